@@ -0,0 +1,92 @@
+import time
+
+
+class DetectorStats(object):
+
+    def __init__(self, name: str):
+        self.name = name
+        self.attempts = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+    def hit_rate(self) -> float:
+        # smoothed, so a detector is not ruled out by its first misses
+        return (self.hits + 1.0) / (self.attempts + 2.0)
+
+    def mean_seconds(self) -> float:
+        if self.attempts == 0:
+            return 0.0
+        return self.seconds / self.attempts
+
+    def expected_cost(self) -> float:
+        # seconds spent per found face, when tried first
+        return self.mean_seconds() / self.hit_rate()
+
+    def __str__(self):
+        return f'{self.name}: attempts {self.attempts}' \
+               f', hits {self.hits} ({self.hits / max(self.attempts, 1) * 100:.1f}%)' \
+               f', {self.mean_seconds() * 1000:.1f} ms/attempt'
+
+
+class AdaptiveCascade(object):
+    """
+    Detector cascade of one video, tries detectors in the order of the lowest expected cost per found face.
+    The first min_trials frames use the default order. Detectors not tried yet have zero cost, so they are tried next.
+    Detectors with a hit rate below skip_hit_rate after min_trials attempts are skipped,
+    and every explore_interval frames the default order runs again to refresh stats.
+    """
+
+    def __init__(self, detector_types: list, min_trials: int = 10, skip_hit_rate: float = 0.05,
+                 explore_interval: int = 50):
+        self.detector_types = list(detector_types)  # default order
+        self.min_trials = min_trials
+        self.skip_hit_rate = skip_hit_rate
+        self.explore_interval = explore_interval
+        self.stats = {detector_type: DetectorStats(detector_type.name.lower()) for detector_type in detector_types}
+        self.frames = 0
+        self.reordered_frames = 0
+        self.skipped = 0
+
+    def get_order(self) -> list:
+        if self.frames <= self.min_trials or self.frames % self.explore_interval == 0:
+            return self.detector_types
+        order = sorted(self.detector_types, key=lambda detector_type: self.stats[detector_type].expected_cost())
+        kept_order = [detector_type for detector_type in order if self._is_useful(self.stats[detector_type])]
+        self.skipped = self.skipped + len(order) - len(kept_order)
+        if len(kept_order) == 0:
+            kept_order = order
+        if kept_order != self.detector_types:
+            self.reordered_frames = self.reordered_frames + 1
+        return kept_order
+
+    def _is_useful(self, detector_stats: DetectorStats) -> bool:
+        if detector_stats.attempts < self.min_trials:
+            return True
+        return detector_stats.hits / detector_stats.attempts >= self.skip_hit_rate
+
+    def detect_first(self, frame_detections) -> tuple:
+        """
+        Same as FrameDetections.detect_first in adaptive order, results cached for the frame are used first
+        """
+        self.frames = self.frames + 1
+        order = self.get_order()
+        cached = [detector_type for detector_type in order if frame_detections.has_run(detector_type)]
+        for detector_type in cached + [detector_type for detector_type in order if detector_type not in cached]:
+            is_cached = frame_detections.has_run(detector_type)
+            start_time = time.perf_counter()
+            face_list = frame_detections.detect(detector_type)
+            if not is_cached:
+                detector_stats = self.stats[detector_type]
+                detector_stats.seconds = detector_stats.seconds + time.perf_counter() - start_time
+                detector_stats.attempts = detector_stats.attempts + 1
+                if len(face_list) > 0:
+                    detector_stats.hits = detector_stats.hits + 1
+            if len(face_list) > 0:
+                return face_list, detector_type
+        return [], None
+
+    def __str__(self):
+        lines = [str(self.stats[detector_type]) for detector_type in self.detector_types]
+        lines.append(f'Cascade frames: {self.frames}, reordered: {self.reordered_frames}'
+                     f', skipped detector runs: {self.skipped}')
+        return '\n'.join(lines)
@@ -0,0 +1,133 @@
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from yawn_train.src import download_utils
+from yawn_train.src.blazeface_detector import BlazeFaceDetector, BLAZEFACE_ENGINE_KERAS, BLAZEFACE_ENGINE_GRAPH, \
+    BLAZEFACE_ENGINE_TFLITE, BLAZEFACE_INPUT_SIZE
+from yawn_train.src.blazeface_utils import convert_to_orig_points, process_detections, xywh_to_tlbr
+
+TEMP_FOLDER = "./temp"
+BLAZEFACE_TFLITE_FILE = 'blazeface.tflite'
+
+
+def load_frames(video_path: str, frames_count: int) -> list:
+    if video_path is None:
+        # random frames of typical video size, detection result does not matter for timing
+        return [np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(frames_count)]
+    frames = []
+    cap = cv2.VideoCapture(video_path)
+    while len(frames) < frames_count:
+        ret, frame = cap.read()
+        if ret is False:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def benchmark(blazeface_detector: BlazeFaceDetector, frames: list, batch_size: int, warmup: int = 3) -> float:
+    """
+    Return milliseconds per frame
+    """
+    batches = [frames[i:i + batch_size] for i in range(0, len(frames), batch_size)]
+    for batch in batches[:warmup]:
+        blazeface_detector.detect_faces(batch)
+    start_time = time.perf_counter()
+    for batch in batches:
+        blazeface_detector.detect_faces(batch)
+    return (time.perf_counter() - start_time) * 1000 / len(frames)
+
+
+def create_letterbox_image_alloc(frame, dim):
+    # previous letterbox: new canvas and resize buffer per call, reference for the benchmark
+    h, w = frame.shape[0:2]
+    scale = min(dim / h, dim / w)
+    nh, nw = int(scale * h), int(scale * w)
+    resized = cv2.resize(frame, (nw, nh))
+    new_image = np.zeros((dim, dim, 3), np.uint8)
+    new_image.fill(0)  # fill(256) of the original wrapped to 0, newer numpy raises for it
+    dx = (dim - nw) // 2
+    dy = (dim - nh) // 2
+    new_image[dy:dy + nh, dx:dx + nw, :] = resized
+    return new_image
+
+
+def prepare_input_alloc(orig_frame) -> np.ndarray:
+    # previous pre-processing: letterbox, a second resize to the input size and temporary float arrays
+    frame = create_letterbox_image_alloc(orig_frame, BLAZEFACE_INPUT_SIZE)
+    input_frame = cv2.cvtColor(cv2.resize(frame, (BLAZEFACE_INPUT_SIZE, BLAZEFACE_INPUT_SIZE)), cv2.COLOR_BGR2RGB)
+    return np.expand_dims(input_frame.astype(np.float32), 0) / 127.5 - 1
+
+
+def process_detections_tf(results, orig_dim, max_boxes=5, score_threshold=0.75, iou_threshold=0.5):
+    # previous post-processing: tensorflow NMS over all anchors, reference for the benchmark
+    box_tlbr = xywh_to_tlbr(results[:, 0:4], y_first=True)
+    out_boxes = tf.image.non_max_suppression(box_tlbr, results[:, -1], max_boxes,
+                                             score_threshold=score_threshold, iou_threshold=iou_threshold)
+    filter_boxes = results[out_boxes.numpy(), :-1]
+    orig_points = convert_to_orig_points(filter_boxes, orig_dim, BLAZEFACE_INPUT_SIZE)
+    return xywh_to_tlbr(orig_points).astype(np.int32)
+
+
+def benchmark_fn(fn, items: list, warmup: int = 10) -> float:
+    """
+    Return microseconds per item
+    """
+    for item in items[:warmup]:
+        fn(item)
+    start_time = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start_time) * 1000000 / len(items)
+
+
+def benchmark_postprocess(frames: list, blazeface_detector: BlazeFaceDetector):
+    # model output with a few confident anchors, as for a frame with one face
+    results = []
+    for _ in range(len(frames)):
+        result = np.random.rand(896, 17).astype(np.float32)
+        result[:, -1] = result[:, -1] * 0.5
+        result[np.random.randint(0, 896, 4), -1] = 0.9
+        results.append(result)
+    orig_dim = frames[0].shape[0:2]
+    print(f'preprocess before: {benchmark_fn(prepare_input_alloc, frames):.1f} us/frame')
+    print(f'preprocess after: {benchmark_fn(lambda frame: blazeface_detector._prepare_batch([frame]), frames):.1f} us/frame')
+    print(f'postprocess before: {benchmark_fn(lambda result: process_detections_tf(result, orig_dim), results):.1f} us/frame')
+    detection_buffer = blazeface_detector.detection_buffer
+    print(f'postprocess after: '
+          f'{benchmark_fn(lambda result: process_detections(result, orig_dim, buffer=detection_buffer), results):.1f}'
+          f' us/frame')
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Compare BlazeFace engines: keras predict, graph and TFLite.")
+    parser.add_argument("--video", type=str, default=None, help="video to read frames from, random frames if empty")
+    parser.add_argument("--frames", type=int, default=256, help="number of frames")
+    parser.add_argument("--batch-sizes", type=int, nargs='+', default=[1, 8, 32], help="batch sizes to measure")
+    parser.add_argument("--postprocess", action='store_true',
+                        help="measure only pre- and post-processing per frame, before and after buffer reuse")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    frames = load_frames(args.video, args.frames)
+    bf_model = download_utils.download_blazeface(TEMP_FOLDER)
+    blazeface_tf = tf.keras.models.load_model(bf_model, compile=False)
+    tflite_path = os.path.join(TEMP_FOLDER, BLAZEFACE_TFLITE_FILE)
+
+    print(f'Frames: {len(frames)}')
+    if args.postprocess:
+        benchmark_postprocess(frames, BlazeFaceDetector(blazeface_tf, BLAZEFACE_ENGINE_KERAS))
+        sys.exit(0)
+    for engine in [BLAZEFACE_ENGINE_KERAS, BLAZEFACE_ENGINE_GRAPH, BLAZEFACE_ENGINE_TFLITE]:
+        blazeface_detector = BlazeFaceDetector(blazeface_tf, engine, tflite_path)
+        for batch_size in args.batch_sizes:
+            ms_per_frame = benchmark(blazeface_detector, frames, batch_size)
+            print(f'{engine}, batch {batch_size}: {ms_per_frame:.2f} ms/frame, {1000 / ms_per_frame:.1f} fps')
@@ -0,0 +1,177 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import time
+
+import cv2
+import numpy as np
+
+from yawn_train.src.model_config import MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT, MOUTH_FOLDER
+from yawn_train.src.mouth_state_classifier import MouthStateClassifier, BACKEND_KERAS, BACKEND_PB, BACKEND_TFLITE, \
+    BACKEND_ONNXRUNTIME, BACKEND_OPENCV
+
+BATCH_SIZES = [1, 8, 32]
+LATENCY_RUNS = 200
+WARMUP_RUNS = 10
+RESULTS_FILE = 'benchmark_models.json'
+
+
+def find_artifacts(model_folder: str) -> list:
+    """
+    Return (name, backend, path) of every model in an output folder of DNNTrainer, ONNX files run in two backends
+    """
+    artifacts = []
+    for file_name in sorted(os.listdir(model_folder)):
+        path = os.path.join(model_folder, file_name)
+        if file_name.endswith('.h5'):
+            artifacts.append((file_name, BACKEND_KERAS, path))
+        elif os.path.isfile(os.path.join(path, 'saved_model.pb')):
+            artifacts.append((file_name, BACKEND_KERAS, path))
+        elif file_name.endswith('.pb'):
+            artifacts.append((file_name, BACKEND_PB, path))
+        elif file_name.endswith('.tflite'):
+            artifacts.append((file_name, BACKEND_TFLITE, path))
+        elif file_name.endswith('.onnx'):
+            artifacts.append((file_name, BACKEND_ONNXRUNTIME, path))
+            artifacts.append((file_name, BACKEND_OPENCV, path))
+    return artifacts
+
+
+def load_crops(data_folder: str, count: int, seed: int = 0) -> list:
+    # fixed crops for every backend: extracted images if available, seeded random images otherwise
+    rng = np.random.RandomState(seed)
+    if data_folder is not None and os.path.isdir(data_folder):
+        from yawn_train.src.metadata_index import MetadataIndex
+        paths = MetadataIndex.from_folder(data_folder).paths
+        if len(paths) > 0:
+            paths = [paths[i] for i in rng.choice(len(paths), min(count, len(paths)), replace=False)]
+            return [cv2.imread(path, cv2.IMREAD_GRAYSCALE) for path in paths]
+    return [rng.randint(0, 255, (MAX_IMAGE_HEIGHT, MAX_IMAGE_WIDTH), dtype=np.uint8) for _ in range(count)]
+
+
+def get_rss_mb() -> float:
+    # current resident memory on linux, peak resident memory elsewhere
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmark_artifact(backend: str, path: str, crops: list, batch_sizes: list) -> dict:
+    """
+    Runs in a fresh process, so load time includes imports and memory belongs to one backend only
+    """
+    rss_start = get_rss_mb()
+    start_time = time.perf_counter()
+    classifier = MouthStateClassifier(backend, path)
+    classifier.predict_batch(crops[:1])  # first call builds graphs and allocates tensors
+    load_seconds = time.perf_counter() - start_time
+    rss_loaded = get_rss_mb()
+
+    classifier.batch_size = 1
+    for crop in crops[:WARMUP_RUNS]:
+        classifier.predict_batch([crop])
+    latencies = []
+    for i in range(LATENCY_RUNS):
+        start_time = time.perf_counter()
+        classifier.predict_batch([crops[i % len(crops)]])
+        latencies.append((time.perf_counter() - start_time) * 1000)
+
+    throughput = {}
+    for batch_size in batch_sizes:
+        classifier.batch_size = batch_size
+        classifier.predict_batch(crops[:batch_size])
+        start_time = time.perf_counter()
+        classifier.predict_batch(crops)
+        throughput[str(batch_size)] = len(crops) / (time.perf_counter() - start_time)
+
+    return {
+        'load_seconds': load_seconds,
+        'rss_mb': rss_loaded - rss_start,
+        'rss_peak_mb': get_rss_mb() - rss_start,
+        'latency_ms': {
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99))
+        },
+        'throughput': throughput,
+        'probabilities': classifier.predict_batch(crops).tolist()
+    }
+
+
+def run_benchmarks(artifacts: list, crops: list, batch_sizes: list) -> list:
+    results = []
+    ctx = multiprocessing.get_context('spawn')
+    for name, backend, path in artifacts:
+        print(f'Benchmark {name} ({backend})')
+        result = {'name': name, 'backend': backend, 'path': path}
+        try:
+            with ctx.Pool(processes=1) as pool:
+                result.update(pool.apply(benchmark_artifact, (backend, path, crops, batch_sizes)))
+        except Exception as e:
+            print(f'Failed {name} ({backend}): {e!r}')
+            result['error'] = repr(e)
+        results.append(result)
+    add_agreement(results)
+    return results
+
+
+def add_agreement(results: list):
+    # max probability difference to the first benchmarked model, exports of one model should agree
+    reference = None
+    for result in results:
+        if 'probabilities' not in result:
+            continue
+        probabilities = np.array(result.pop('probabilities'))
+        if reference is None:
+            reference = (f'{result["name"]} ({result["backend"]})', probabilities)
+        result['max_diff'] = float(np.max(np.abs(probabilities - reference[1])))
+        result['diff_reference'] = reference[0]
+
+
+def format_table(results: list, batch_sizes: list) -> str:
+    header = f'{"model":<32} {"backend":<12} {"load s":>7} {"RSS MB":>7} {"p50 ms":>7} {"p95 ms":>7} {"p99 ms":>7}' + \
+             ''.join(f' {"b" + str(batch_size) + " img/s":>10}' for batch_size in batch_sizes) + f' {"max diff":>9}'
+    lines = [header]
+    for result in results:
+        row = f'{result["name"][:32]:<32} {result["backend"]:<12}'
+        if 'error' in result:
+            lines.append(row + ' failed')
+            continue
+        latency = result['latency_ms']
+        row = row + f' {result["load_seconds"]:>7.2f} {result["rss_mb"]:>7.1f}' \
+                    f' {latency["p50"]:>7.2f} {latency["p95"]:>7.2f} {latency["p99"]:>7.2f}'
+        row = row + ''.join(f' {result["throughput"][str(batch_size)]:>10.1f}' for batch_size in batch_sizes)
+        lines.append(row + f' {result.get("max_diff", 0.0):>9.4f}')
+    return '\n'.join(lines)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Benchmark every exported yawn model of an output folder.")
+    parser.add_argument("--model-folder", type=str, default='./out_epoch_80_full',
+                        help="output folder of DNNTrainer with h5, pb, SavedModel, ONNX and TFLite models")
+    parser.add_argument("--data-folder", type=str, default=MOUTH_FOLDER,
+                        help="extracted face images used as input, random crops if missing")
+    parser.add_argument("--crops", type=int, default=256, help="number of crops")
+    parser.add_argument("--batch-sizes", type=int, nargs='+', default=BATCH_SIZES, help="batch sizes to measure")
+    parser.add_argument("--output", type=str, default=None, help=f"results json, {RESULTS_FILE} in model folder")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    artifacts = find_artifacts(args.model_folder)
+    crops = load_crops(args.data_folder, args.crops)
+    print(f'Models: {len(artifacts)}, crops: {len(crops)}')
+    results = run_benchmarks(artifacts, crops, args.batch_sizes)
+    output_path = args.output or os.path.join(args.model_folder, RESULTS_FILE)
+    with open(output_path, 'w') as f:
+        json.dump({'crops': len(crops), 'batch_sizes': args.batch_sizes, 'results': results}, f, indent=2)
+    print(format_table(results, args.batch_sizes))
+    print(f'Saved {output_path}')
@@ -3,29 +3,135 @@ import sys
 
 import cv2
 import numpy as np
+import tensorflow as tf
 
 # adapt paths for jupyter
 module_path = os.path.abspath(os.path.join('../..'))
 if module_path not in sys.path:
     sys.path.append(module_path)
 
-from yawn_train.src.blazeface_utils import create_letterbox_image, process_detections
+from yawn_train.src.blazeface_utils import DetectionBuffer, LetterboxBuffer, create_letterbox_image, \
+    process_detections
+
+BLAZEFACE_INPUT_SIZE = 128
+BLAZEFACE_ENGINE_KERAS = 'keras'  # keras predict per call, slow for single frames
+BLAZEFACE_ENGINE_GRAPH = 'graph'  # tf.function with fixed input signature
+BLAZEFACE_ENGINE_TFLITE = 'tflite'
+
+
+class GraphBlazeFace(object):
+    """
+    Keras BlazeFace traced once into a graph with fixed input signature, called without predict overhead
+    """
+
+    def __init__(self, keras_model):
+        self.keras_model = keras_model
+        self._predict = tf.function(
+            lambda input_tensor: keras_model(input_tensor, training=False),
+            input_signature=[tf.TensorSpec([None, BLAZEFACE_INPUT_SIZE, BLAZEFACE_INPUT_SIZE, 3], tf.float32)]
+        )
+
+    def __call__(self, input_tensor: np.ndarray) -> np.ndarray:
+        return self._predict(tf.convert_to_tensor(input_tensor)).numpy()
+
+
+class KerasBlazeFace(object):
+
+    def __init__(self, keras_model):
+        self.keras_model = keras_model
+
+    def __call__(self, input_tensor: np.ndarray) -> np.ndarray:
+        return self.keras_model.predict(input_tensor)
+
+
+class TFLiteBlazeFace(object):
+    """
+    BlazeFace in a TFLite interpreter, input is resized when the batch size changes
+    """
+
+    def __init__(self, model_path: str, num_threads: int = None):
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.batch_size = self.interpreter.get_input_details()[0]['shape'][0]
+
+    def __call__(self, input_tensor: np.ndarray) -> np.ndarray:
+        if input_tensor.shape[0] != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input_index, input_tensor.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = input_tensor.shape[0]
+        self.interpreter.set_tensor(self.input_index, input_tensor)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index).copy()
+
+
+def convert_blazeface_tflite(keras_model, tflite_path: str) -> str:
+    # same weights as the keras model, converted once
+    if os.path.isfile(tflite_path):
+        return tflite_path
+    graph_model = GraphBlazeFace(keras_model)
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([graph_model._predict.get_concrete_function()])
+    with open(tflite_path, 'wb') as f:
+        f.write(converter.convert())
+    return tflite_path
+
+
+def create_blazeface_engine(keras_model, engine: str = BLAZEFACE_ENGINE_GRAPH, tflite_path: str = None):
+    if engine == BLAZEFACE_ENGINE_KERAS:
+        return KerasBlazeFace(keras_model)
+    if engine == BLAZEFACE_ENGINE_TFLITE:
+        return TFLiteBlazeFace(convert_blazeface_tflite(keras_model, tflite_path))
+    return GraphBlazeFace(keras_model)
+
+
+def prepare_input(orig_frame) -> np.ndarray:
+    frame = create_letterbox_image(orig_frame, BLAZEFACE_INPUT_SIZE)  # already input size, no resize
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB).astype(np.float32) / 127.5 - 1
 
 
 class BlazeFaceDetector(object):
 
-    def __init__(self, face_model):
+    def __init__(self, face_model, engine: str = BLAZEFACE_ENGINE_GRAPH, tflite_path: str = None):
         self.face_model = face_model
+        self.engine = create_blazeface_engine(face_model, engine, tflite_path)
+        # reused between calls, grows with the largest batch
+        self.letterbox_buffer = LetterboxBuffer(BLAZEFACE_INPUT_SIZE)
+        self.rgb_buffer = np.empty((BLAZEFACE_INPUT_SIZE, BLAZEFACE_INPUT_SIZE, 3), np.uint8)
+        self.input_buffer = np.empty((0, BLAZEFACE_INPUT_SIZE, BLAZEFACE_INPUT_SIZE, 3), np.float32)
+        self.detection_buffer = DetectionBuffer()
+
+    def _prepare_batch(self, orig_frames: list) -> np.ndarray:
+        if len(orig_frames) > len(self.input_buffer):
+            self.input_buffer = np.empty((len(orig_frames),) + self.input_buffer.shape[1:], np.float32)
+        input_tensor = self.input_buffer[:len(orig_frames)]
+        for i, orig_frame in enumerate(orig_frames):
+            frame = self.letterbox_buffer.letterbox(orig_frame)
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.rgb_buffer)
+            # same as prepare_input, without temporary arrays
+            np.multiply(self.rgb_buffer, 1 / 127.5, out=input_tensor[i], casting='unsafe')
+            input_tensor[i] -= 1
+        return input_tensor
+
+    def detect_faces(self, orig_frames: list) -> list:
+        """
+        Detect faces of many frames with one model call, return list of face boxes per frame
+        """
+        if len(orig_frames) == 0:
+            return []
+        input_tensor = self._prepare_batch(orig_frames)
+        results = self.engine(input_tensor)
+        faces = []
+        for orig_frame, result in zip(orig_frames, results):
+            orig_h, orig_w = orig_frame.shape[0:2]
+            final_boxes, landmarks_proposals = process_detections(result, (orig_h, orig_w), 5, 0.75, 0.5,
+                                                                  pad_ratio=0.5, buffer=self.detection_buffer)
+            faces.append([(bx[0], bx[1], bx[2], bx[3]) for bx in final_boxes])
+        return faces
 
     def detect_face(self, orig_frame, draw_rect: bool = False) -> list:
-        orig_h, orig_w = orig_frame.shape[0:2]
-        frame = create_letterbox_image(orig_frame, 128)
-        h, w = frame.shape[0:2]
-        input_frame = cv2.cvtColor(cv2.resize(frame, (128, 128)), cv2.COLOR_BGR2RGB)
-        input_tensor = np.expand_dims(input_frame.astype(np.float32), 0) / 127.5 - 1
-        result = self.face_model.predict(input_tensor)[0]
-        final_boxes, landmarks_proposals = process_detections(result, (orig_h, orig_w), 5, 0.75, 0.5, pad_ratio=0.5)
-        face_list = []
-        for bx in final_boxes:
-            face_list.append((bx[0], bx[1], bx[2], bx[3]))
+        face_list = self.detect_faces([orig_frame])[0]
+        if draw_rect:
+            for (start_x, start_y, end_x, end_y) in face_list:
+                cv2.rectangle(orig_frame, (start_x, start_y), (end_x, end_y), (0, 255, 0), 2)
         return face_list
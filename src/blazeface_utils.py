@@ -1,6 +1,5 @@
 import numpy as np
 import cv2 
-import tensorflow as tf
 
 def get_clean_name(string):
     if "depth" in string.lower() and "kernel" in string.lower():
@@ -64,17 +63,35 @@ def xywh_to_tlbr(boxes, y_first=False):
         final_boxes[:, 2:4] = boxes[:, [1,0]] + (boxes[:, [3,2]]/2)
     return final_boxes
     
+class LetterboxBuffer(object):
+    """
+    Reusable canvas and resize buffers, frames of a video have the same size and reuse them
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.canvas = np.zeros((dim, dim, 3), np.uint8)
+        self.resized = None
+        self.layout = None  # (h, w) of the frame the canvas border was drawn for
+
+    def letterbox(self, frame):
+        h, w = frame.shape[0:2]
+        scale = min(self.dim/h, self.dim/w)
+        nh, nw = int(scale*h), int(scale*w)
+        if self.layout != (h, w):
+            self.canvas.fill(0)
+            self.resized = np.empty((nh, nw, 3), np.uint8)
+            self.layout = (h, w)
+        cv2.resize(frame, (nw, nh), dst=self.resized)
+        dx = (self.dim-nw)//2
+        dy = (self.dim-nh)//2
+        self.canvas[dy:dy+nh, dx:dx+nw,:] = self.resized
+        return self.canvas
+
+
 def create_letterbox_image(frame, dim):
-    h, w = frame.shape[0:2]
-    scale = min(dim/h, dim/w)
-    nh, nw = int(scale*h), int(scale*w)
-    resized = cv2.resize(frame, (nw, nh))
-    new_image = np.zeros((dim, dim, 3), np.uint8) 
-    new_image.fill(256)
-    dx = (dim-nw)//2
-    dy = (dim-nh)//2
-    new_image[dy:dy+nh, dx:dx+nw,:] = resized
-    return new_image
+    # border is black, fill(256) of the uint8 canvas wrapped to 0
+    return LetterboxBuffer(dim).letterbox(frame)
 
 #takes the letterbox dimensions and the original dimensions to map the results in letterbox image coordinates
 #to original image coordinates
@@ -94,11 +111,54 @@ def convert_to_orig_points(results, orig_dim, letter_dim):
     
     return results.astype(np.int32)
 
-def process_detections(results, orig_dim, max_boxes=5, score_threshold=0.75, iou_threshold=0.5, pad_ratio=0.5):
-    box_tlbr = xywh_to_tlbr(results[:, 0:4], y_first=True)
-    out_boxes = tf.image.non_max_suppression(box_tlbr, results[:, -1], max_boxes,
-                                             score_threshold=score_threshold, iou_threshold=iou_threshold)
-    filter_boxes = results[out_boxes.numpy(), :-1]
+def non_max_suppression(boxes, scores, max_boxes, iou_threshold=0.5):
+    """
+    Greedy NMS as tf.image.non_max_suppression, boxes - (N, 4) tlbr, return indices ordered by score
+    """
+    order = np.argsort(-scores, kind='stable')
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while len(order) > 0 and len(keep) < max_boxes:
+        best = order[0]
+        keep.append(best)
+        order = order[1:]
+        inter_w = np.clip(np.minimum(boxes[best, 2], boxes[order, 2]) - np.maximum(boxes[best, 0], boxes[order, 0]), 0, None)
+        inter_h = np.clip(np.minimum(boxes[best, 3], boxes[order, 3]) - np.maximum(boxes[best, 1], boxes[order, 1]), 0, None)
+        inter = inter_w * inter_h
+        union = areas[best] + areas[order] - inter
+        iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+        order = order[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+class DetectionBuffer(object):
+    """
+    Reusable score mask and candidate rows, every frame has the same number of anchors
+    """
+
+    def __init__(self, num_anchors=896, num_values=17):
+        self.mask = np.empty(num_anchors, np.bool_)
+        self.candidates = np.empty((num_anchors, num_values), np.float32)
+
+    def select(self, results, score_threshold):
+        if self.candidates.shape != results.shape or self.candidates.dtype != results.dtype:
+            self.mask = np.empty(results.shape[0], np.bool_)
+            self.candidates = np.empty(results.shape, results.dtype)
+        np.greater(results[:, -1], score_threshold, out=self.mask)
+        indices = np.flatnonzero(self.mask)
+        return np.take(results, indices, axis=0, out=self.candidates[:len(indices)])
+
+
+def process_detections(results, orig_dim, max_boxes=5, score_threshold=0.75, iou_threshold=0.5, pad_ratio=0.5,
+                       buffer=None):
+    # only the few anchors above the threshold are converted, no tensorflow calls
+    if buffer is None:
+        candidates = results[results[:, -1] > score_threshold]
+    else:
+        candidates = buffer.select(results, score_threshold)
+    box_tlbr = xywh_to_tlbr(candidates[:, 0:4], y_first=True)
+    out_boxes = non_max_suppression(box_tlbr, candidates[:, -1], max_boxes, iou_threshold=iou_threshold)
+    filter_boxes = candidates[out_boxes, :-1]
     orig_points = convert_to_orig_points(filter_boxes, orig_dim, 128)
     landmarks_xywh = orig_points.copy()
     landmarks_xywh[:, 2:4] += (landmarks_xywh[:, 2:4] * pad_ratio).astype(np.int32) #adding some padding around detection for landmark detection step.
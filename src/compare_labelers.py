@@ -0,0 +1,71 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from yawn_train.src.convert_dataset_video_to_mouth_img import LNDMR_TYPE, FACEMESH_MOUTH_AR_THRESH, get_mouth_ratio_dlib, \
+    get_mouth_ratios_fan, get_mouth_ratios_facemesh, decide_mouth_opened
+from yawn_train.src.metadata_index import MetadataIndex
+from yawn_train.src.model_config import MOUTH_FOLDER
+from yawn_train.src.model_registry import MODELS
+
+
+def load_faces(data_folder: str, max_images: int, seed: int = 0) -> list:
+    # saved crop is the landmarks rect and the rect came from dlib HOG, the dlib/FAN labeler input of the baseline
+    metadata_index = MetadataIndex.from_folder(data_folder).from_box_source('dlib')
+    paths = metadata_index.select(metadata_index['detector'] == 'dlib').paths
+    rng = np.random.RandomState(seed)
+    if len(paths) > max_images:
+        paths = [paths[i] for i in rng.choice(len(paths), max_images, replace=False)]
+    return [cv2.imread(path, cv2.IMREAD_GRAYSCALE) for path in paths]
+
+
+def label_dlib_fan(face_rois: list) -> tuple:
+    mouth_mars_dlib = [get_mouth_ratio_dlib(face_roi, 0, 0, face_roi.shape[1], face_roi.shape[0])
+                       for face_roi in face_rois]
+    labels = [decide_mouth_opened(mouth_mar_dlib, mouth_mar_3ddfa)
+              for mouth_mar_dlib, mouth_mar_3ddfa in zip(mouth_mars_dlib, get_mouth_ratios_fan(face_rois))]
+    return np.array([label[0] for label in labels]), np.array([label[1] for label in labels]), labels
+
+
+def label_facemesh(face_rois: list) -> tuple:
+    mouth_mars = np.array(get_mouth_ratios_facemesh(face_rois))
+    return mouth_mars >= FACEMESH_MOUTH_AR_THRESH, mouth_mars
+
+
+def timed(fn, face_rois: list) -> tuple:
+    fn(face_rois[:8])  # warm up, models are loaded here
+    start_time = time.perf_counter()
+    result = fn(face_rois)
+    return result, len(face_rois) / (time.perf_counter() - start_time)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Compare face mesh mouth labeling with dlib/FAN labeling.")
+    parser.add_argument("--data-folder", type=str, default=MOUTH_FOLDER, help="extracted face images")
+    parser.add_argument("--max-images", type=int, default=1000, help="number of random images to compare")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    face_rois = load_faces(args.data_folder, args.max_images)
+    print(f'Images: {len(face_rois)}')
+
+    (opened_dlib_fan, mars_dlib_fan, labels_dlib_fan), fps_dlib_fan = timed(label_dlib_fan, face_rois)
+    (opened_facemesh, mars_facemesh), fps_facemesh = timed(label_facemesh, face_rois)
+
+    print(f'dlib/FAN: {fps_dlib_fan:.1f} images/s')
+    print(f'face mesh: {fps_facemesh:.1f} images/s, {fps_facemesh / fps_dlib_fan:.2f}x')
+    print(f'Label agreement: {np.mean(opened_dlib_fan == opened_facemesh) * 100:.1f}%')
+    print(f'Opened by both: {np.sum(opened_dlib_fan & opened_facemesh)}'
+          f', only dlib/FAN: {np.sum(opened_dlib_fan & ~opened_facemesh)}'
+          f', only face mesh: {np.sum(~opened_dlib_fan & opened_facemesh)}'
+          f', closed by both: {np.sum(~opened_dlib_fan & ~opened_facemesh)}')
+    print(f'Mouth ratio correlation: {np.corrcoef(mars_dlib_fan, mars_facemesh)[0, 1]:.3f}')
+    fan_decided = np.array([label[2] == LNDMR_TYPE.FACEALIGN for label in labels_dlib_fan])
+    print(f'Agreement where dlib and FAN disagree: '
+          f'{np.mean(opened_dlib_fan[fan_decided] == opened_facemesh[fan_decided]) * 100:.1f}%'
+          f' of {np.sum(fan_decided)}')
+    print(MODELS.report())
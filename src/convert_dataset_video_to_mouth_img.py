@@ -1,5 +1,7 @@
+import argparse
 import collections
 import csv
+import multiprocessing
 import os
 import sys
 from enum import Enum
@@ -11,45 +13,104 @@ module_path = os.path.abspath(os.path.join('..'))
 if module_path not in sys.path:
     sys.path.append(module_path)
 
-import face_alignment
-from yawn_train.src.blazeface_detector import BlazeFaceDetector
 
 import cv2
-import dlib
 import numpy as np
 from imutils import face_utils
 
-from yawn_train.src.ssd_face_detector import SSDFaceDetector
 
 # define one constants, for mouth aspect ratio to indicate open mouth
 from yawn_train.src import download_utils, detect_utils, inference_utils
-from yawn_train.src.model_config import MOUTH_AR_THRESH, MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT
-
-
-class ImageResult:
-    def __init__(self, is_processed, is_opened_image):
-        self.is_processed = is_processed
-        self.is_opened_image = is_opened_image
-
-    @staticmethod
-    def not_processed():
-        return ImageResult(False, False)
+from yawn_train.src.adaptive_cascade import AdaptiveCascade
+from yawn_train.src.dataset_shards import ShardWriter, remove_shards
+from yawn_train.src.detection_pyramid import PyramidDetector
+from yawn_train.src.metadata_index import INDEX_FIELDS, VideoIndexWriter, merge_video_indices, remove_video_indices
+from yawn_train.src.extract_manifest import ExtractionManifest
+from yawn_train.src.extract_pipeline import ExtractionPipeline, PipelineStage
+from yawn_train.src.face_tracker import FaceTracker, UPDATE_ROI, UPDATE_PROPAGATED, detect_in_roi, roi_to_frame
+from yawn_train.src.frame_detections import FrameDetections
+from yawn_train.src.labeling_gate import LabelingGate
+from yawn_train.src.model_config import MOUTH_AR_THRESH, MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT, IMAGE_PAIR_SIZE, \
+    COLOR_IMG, MOUTH_FOLDER
+from yawn_train.src.model_registry import MODELS, MODEL_DLIB_DETECTOR, MODEL_SSD_DETECTOR, \
+    MODEL_BLAZEFACE_DETECTOR, MODEL_FACE_ALIGNMENT, MODEL_FACEMESH_LABELER, MODELS_FOLDER, LANDMARKS_DLIB_68, \
+    LANDMARKS_DLIB_MOUTH, DLIB_PREDICTOR_MODELS, timed_import, report_workers
+from yawn_train.src.sampling_planner import SamplingPlanner
+
+
+class PendingImage:
+    """
+    Face crop of a frame, waiting for batched landmark labeling
+    """
+
+    def __init__(self, video_id, video_path, frame_id, face_type, prefix, face_roi, output_img, mar_dlib,
+                 is_dense_sampled, box_source):
+        self.video_id = video_id
+        self.video_path = video_path
+        self.frame_id = frame_id
+        self.face_type = face_type
+        self.prefix = prefix  # detector of output crop
+        self.face_roi = face_roi  # landmarks input, cropped with dlib rect
+        self.output_img = output_img
+        self.mar_dlib = mar_dlib
+        self.is_dense_sampled = is_dense_sampled
+        self.box_source = box_source  # detector of the rect of face_roi, or BOX_SOURCE_TRACKED
 
 
 class VideoResult:
-    def __init__(self, total_frames, dlib_counter, caffe_counter, blazeface_counter, opened_counter, closed_counter):
+    def __init__(self, total_frames, dlib_counter, caffe_counter, blazeface_counter, opened_counter, closed_counter,
+                 gate_frames=0, gate_fired=0, gate_audited=0, gate_audit_differences=0,
+                 box_dlib=0, box_caffe=0, box_blazeface=0, box_tracked=0):
         self.total_frames = total_frames
         self.dlib_counter = dlib_counter
         self.caffe_counter = caffe_counter
         self.blazeface_counter = blazeface_counter
         self.opened_counter = opened_counter
         self.closed_counter = closed_counter
+        # LabelingGate counts of the dlib_fan_gated labeler, 0 for other labelers
+        self.gate_frames = gate_frames
+        self.gate_fired = gate_fired
+        self.gate_audited = gate_audited
+        self.gate_audit_differences = gate_audit_differences
+        # saved images by source of the landmarks rect, counters above are by rotation turn of the output crop
+        self.box_dlib = box_dlib
+        self.box_caffe = box_caffe
+        self.box_blazeface = box_blazeface
+        self.box_tracked = box_tracked
 
     @staticmethod
     def empty():
         return VideoResult(0, 0, 0, 0, 0, 0)
 
 
+class JpegImageWriter:
+    """
+    One JPEG per crop, fields are encoded into the file name and written to the per-video metadata index
+    """
+
+    def __init__(self, video_id: int):
+        self.index_writer = VideoIndexWriter(MOUTH_FOLDER, f'{video_id:05d}')
+
+    def write(self, img, is_opened: bool, mar: float, video_id: int, frame_id: int, detector: str, landmark: str,
+              read_counter: int, box_source: str):
+        class_name = 'opened' if is_opened else 'closed'
+        # video id and frame id make the name unique across videos and processes
+        rel_path = os.path.join(class_name, f'{read_counter}_{mar}_{video_id}_{frame_id}_{detector}_{landmark}.jpg')
+        cv2.imwrite(os.path.join(MOUTH_FOLDER, rel_path), img)
+        self.index_writer.add(rel_path, is_opened, mar, video_id, frame_id, detector, landmark, read_counter,
+                              box_source)
+
+    def close(self):
+        self.index_writer.close()
+
+
+def create_image_writer(video_id: int):
+    if OUTPUT_FORMAT == OUTPUT_FORMAT_SHARDS:
+        # shards of a video are named by video id, so an unfinished video can be removed
+        return ShardWriter(MOUTH_SHARDS_FOLDER, f'{video_id:05d}', IMAGE_PAIR_SIZE, 3 if COLOR_IMG else 1)
+    return JpegImageWriter(video_id)
+
+
 class FACE_TYPE(Enum):
     BLAZEFACE = 0
     DLIB = 1
@@ -69,27 +130,68 @@ class FACE_TYPE(Enum):
 class LNDMR_TYPE(Enum):
     DLIB = 0
     FACEALIGN = 1
+    FACEMESH = 2
+    MODEL = 3  # pre-labeled by a trained yawn model
 
 
-COLOR_IMG = False
-MOUTH_FOLDER = "./mouth_state_new10" + ("_color" if COLOR_IMG else "")
 MOUTH_OPENED_FOLDER = os.path.join(MOUTH_FOLDER, 'opened')
 MOUTH_CLOSED_FOLDER = os.path.join(MOUTH_FOLDER, 'closed')
-
-TEMP_FOLDER = "./temp"
+MOUTH_SHARDS_FOLDER = os.path.join(MOUTH_FOLDER, 'shards')
+
+# 'jpeg': one file per crop in opened/closed folders, 'shards': fixed-size binary shards with index
+OUTPUT_FORMAT_JPEG = 'jpeg'
+OUTPUT_FORMAT_SHARDS = 'shards'
+OUTPUT_FORMAT = OUTPUT_FORMAT_JPEG
+
+TEMP_FOLDER = MODELS_FOLDER
+
+# 'dlib_fan': dlib mouth ratio checked by FaceAlignment FAN, 'facemesh': face mesh lip points only
+LABELER_DLIB_FAN = 'dlib_fan'
+LABELER_FACEMESH = 'facemesh'
+# 'dlib_fan_gated': FAN only when the dlib mouth ratio is within FAN_GATE_BAND of MOUTH_AR_THRESH
+LABELER_DLIB_FAN_GATED = 'dlib_fan_gated'
+LABELER = LABELER_DLIB_FAN
+FAN_GATE_BAND = 0.15
+# label every N-th frame outside the band with FAN too, to measure differences to always running FAN
+FAN_GATE_AUDIT_INTERVAL = 20
+# dlib mouth ratio from the 68 points predictor, or from the smaller mouth-only predictor
+DLIB_LANDMARKS = LANDMARKS_DLIB_68
+# trained TFLite yawn model, crops it scores outside (PRELABEL_LOW, PRELABEL_HIGH) skip the landmark labeler.
+# None labels every crop with landmarks
+PRELABEL_MODEL = None
+PRELABEL_LOW = 0.1
+PRELABEL_HIGH = 0.9
+# face mesh lip points follow the dlib mouth points, same ratio threshold
+FACEMESH_MOUTH_AR_THRESH = MOUTH_AR_THRESH
 
 # https://ieee-dataport.org/open-access/yawdd-yawning-detection-dataset#files
 YAWDD_DATASET_FOLDER = "./YawDD dataset"
 CSV_STATS = 'video_stat.csv'
-
-read_mouth_open_counter = 0
-read_mouth_close_counter = 0
-
-saved_mouth_open_counter = 0
-saved_mouth_close_counter = 0
+MANIFEST_FILE = 'extract_manifest.json'
 
 SAMPLE_STEP_IMG_OPENED = 1
 SAMPLE_STEP_IMG_CLOSED = 4
+# decode every frame while the mouth ratio is within margin of the threshold, and hold frames after
+SAMPLE_DENSE_MARGIN = 0.1
+SAMPLE_DENSE_HOLD = 30
+
+# face crops labeled by FaceAlignment in one batch
+FAN_BATCH_SIZE = 32
+
+# run full frame face detection every N frames, track the face in between; 1 detects on every frame
+TRACK_KEYFRAME_INTERVAL = 10
+# box source of frames, whose face box was propagated by the tracker without a detector
+BOX_SOURCE_TRACKED = 'tracked'
+# decode, detect, label and write stages run in threads connected by queues of this size
+EXTRACT_QUEUE_SIZE = 8
+EXTRACT_WRITER_THREADS = 2
+
+# detection scales, tried in order until a face is found. dlib runs without upsampling,
+# scale 2.0 is the same as the former full frame with upsample=1
+DLIB_PYRAMID_SCALES = (0.5, 1.0, 2.0)
+# SSD and BlazeFace resize to a fixed network input, downscaling does not make the network cheaper
+SSD_PYRAMID_SCALES = (1.0,)
+BLAZEFACE_PYRAMID_SCALES = (1.0,)
 
 (mStart, mEnd) = face_utils.FACIAL_LANDMARKS_IDXS["mouth"]
 
@@ -97,23 +199,6 @@ Path(MOUTH_FOLDER).mkdir(parents=True, exist_ok=True)
 Path(MOUTH_OPENED_FOLDER).mkdir(parents=True, exist_ok=True)
 Path(MOUTH_CLOSED_FOLDER).mkdir(parents=True, exist_ok=True)
 
-dlib_landmarks_file = download_utils.download_and_unpack_dlib_68_landmarks(TEMP_FOLDER)
-# dlib predictor for 68pts, mouth
-predictor = dlib.shape_predictor(dlib_landmarks_file)
-# initialize dlib's face detector (HOG-based)
-detector = dlib.get_frontal_face_detector()
-
-caffe_weights, caffe_config = download_utils.download_caffe(TEMP_FOLDER)
-# Reads the network model stored in Caffe framework's format.
-face_model = cv2.dnn.readNetFromCaffe(caffe_config, caffe_weights)
-ssd_face_detector = SSDFaceDetector(face_model)
-
-import tensorflow as tf
-
-bf_model = download_utils.download_blazeface(TEMP_FOLDER)
-blazeface_tf = tf.keras.models.load_model(bf_model, compile=False)
-blazefaceDetector = BlazeFaceDetector(blazeface_tf)
-
 # img = cv2.imread(
 #     '/Users/igla/Desktop/Screenshot 2021-01-14 at 12.29.25.png', cv2.IMREAD_GRAYSCALE)
 # ultrafacedetector = UltraFaceDetector("/Users/igla/Downloads/version-RFB-320_simplified.onnx")
@@ -123,6 +208,12 @@ Take mouth ratio only from dlib rect. Use dnn frame for output
 """
 
 
+def is_video_no_yawn(video_path: str) -> bool:
+    video_name = os.path.basename(video_path)
+    return video_name.endswith('-Normal.avi') or \
+           video_name.endswith('-Talking.avi')
+
+
 def should_process_video(video_name: str) -> bool:
     is_video_sunglasses = video_name.rfind('SunGlasses') != -1
     if is_video_sunglasses:
@@ -146,48 +237,71 @@ pred_types = {'face': pred_type(slice(0, 17), (0.682, 0.780, 0.909, 0.5)),
               'lips': pred_type(slice(48, 60), (0.596, 0.875, 0.541, 0.3)),
               'teeth': pred_type(slice(60, 68), (0.596, 0.875, 0.541, 0.4))
               }
-face_detector = 'sfd'
-face_detector_kwargs = {
-    "filter_threshold": 0.8
-}
-fa = face_alignment.FaceAlignment(face_alignment.LandmarksType._3D, flip_input=True, device='cpu',
-                                  face_detector=face_detector)
+MODEL_FAN_LANDMARKS = 'fan_landmarks'
 
 
-def get_mouth_opened(frame, start_x, start_y, end_x, end_y) -> tuple:
-    mouth_shape = predictor(frame, dlib.rectangle(start_x, start_y, end_x, end_y))
-    mouth_shape = face_utils.shape_to_np(mouth_shape)
-    mouth_arr = mouth_shape[mStart:mEnd]
+def load_fan_landmarks():
+    from yawn_train.src.fan_batch_landmarks import BatchFanLandmarks
+    return BatchFanLandmarks(MODELS.get(MODEL_FACE_ALIGNMENT), FAN_BATCH_SIZE)
+
+
+MODEL_PRELABELER = 'prelabeler'
+
+
+def load_prelabeler():
+    timed_import('tensorflow')
+    from yawn_train.src.model_prelabeler import ModelPreLabeler
+    from yawn_train.src.mouth_state_classifier import MouthStateClassifier, BACKEND_TFLITE
+    classifier = MouthStateClassifier(BACKEND_TFLITE, PRELABEL_MODEL, batch_size=FAN_BATCH_SIZE, num_threads=1)
+    return ModelPreLabeler(classifier, PRELABEL_LOW, PRELABEL_HIGH)
+
+
+# models are loaded lazily on first use in every process, so every worker owns its own instances
+MODELS.register(MODEL_FAN_LANDMARKS, load_fan_landmarks)
+MODELS.register(MODEL_PRELABELER, load_prelabeler)
+
+
+def download_models():
+    # download once in the main process, workers only read the files
+    dlib_landmarks_file = download_utils.download_and_unpack_dlib_68_landmarks(TEMP_FOLDER)
+    caffe_weights, caffe_config = download_utils.download_caffe(TEMP_FOLDER)
+    bf_model = download_utils.download_blazeface(TEMP_FOLDER)
+    if LABELER == LABELER_FACEMESH:
+        download_utils.download_facemesh(TEMP_FOLDER)
+    return dlib_landmarks_file, caffe_weights, caffe_config, bf_model
+
+
+def init_worker(output_format: str, labeler: str, dlib_landmarks: str, prelabel_model: str):
+    # spawned workers import the module again, pass settings changed from command line
+    global OUTPUT_FORMAT, LABELER, DLIB_LANDMARKS, PRELABEL_MODEL
+    OUTPUT_FORMAT = output_format
+    LABELER = labeler
+    DLIB_LANDMARKS = dlib_landmarks
+    PRELABEL_MODEL = prelabel_model
+    # one process per core, avoid oversubscription by inner thread pools
+    cv2.setNumThreads(1)
+    if LABELER in (LABELER_DLIB_FAN, LABELER_DLIB_FAN_GATED):
+        timed_import('torch').set_num_threads(1)
+
+
+def get_mouth_ratio_dlib(frame, start_x, start_y, end_x, end_y) -> float:
+    import dlib  # already imported by the predictor loader
+    predictor = MODELS.get(DLIB_PREDICTOR_MODELS[DLIB_LANDMARKS])
+    mouth_arr = inference_utils.predict_mouth_points(predictor, frame, dlib.rectangle(start_x, start_y, end_x, end_y))
     mouth_mar_dlib = detect_utils.mouth_aspect_ratio(mouth_arr)
-    mouth_mar_dlib = round(mouth_mar_dlib, 2)
-    # print(mouth_mar_dlib)
+    return round(mouth_mar_dlib, 2)
+
+
+def get_mouth_ratios_fan(face_rois: list) -> list:
+    # whole face roi is the face, as detected by dlib
+    landmarks = MODELS.get(MODEL_FAN_LANDMARKS).get_landmarks(face_rois)
+    if len(landmarks) == 0:
+        return []
+    mouth_ratios = detect_utils.mouth_aspect_ratios(landmarks[:, pred_types['lips'].slice])
+    return np.round(mouth_ratios, 2).tolist()
 
-    face_roi_dlib = frame[start_y:end_y, start_x:end_x]
-    height_frame, width_frame = face_roi_dlib.shape[:2]
-    # swapping the read and green channels
-    # https://stackoverflow.com/a/56933474/1461625
-    detected_faces = []
-    detected_faces.append([0, 0, width_frame, height_frame])
-    preds = fa.get_landmarks_from_image(face_roi_dlib, detected_faces)[-1]
-
-    pred_type = pred_types['lips']
-    X = preds[pred_type.slice, 0]
-    Y = preds[pred_type.slice, 1]
-    mouth_shape_3ddfa = []
-    for x, y in zip(X, Y):
-        mouth_shape_3ddfa.append((x, y))
-
-    # shape = []
-    # for idx, pred_type in enumerate(pred_types.values()):
-    #     X = preds[pred_type.slice, 0]
-    #     Y = preds[pred_type.slice, 1]
-    #     for x, y in zip(X, Y):
-    #         shape.append((x, y))
-
-    mouth_mar_3ddfa = detect_utils.mouth_aspect_ratio(mouth_shape_3ddfa)
-    mouth_mar_3ddfa = round(mouth_mar_3ddfa, 2)
-    # print(mouth_mar_3ddfa)
 
+def decide_mouth_opened(mouth_mar_dlib: float, mouth_mar_3ddfa: float) -> tuple:
     is_opened_mouth_3ddfa = mouth_mar_3ddfa >= 0.75
     is_opened_mouth_dlib = mouth_mar_dlib >= MOUTH_AR_THRESH
 
@@ -197,35 +311,84 @@ def get_mouth_opened(frame, start_x, start_y, end_x, end_y) -> tuple:
         return is_opened_mouth_3ddfa, mouth_mar_3ddfa, LNDMR_TYPE.FACEALIGN  # return 3ddfa, as it's more accurate
 
 
-def recognize_image(video_id: int, video_path: str, frame, frame_id: int, face_type: FACE_TYPE, face_rect_dlib,
-                    face_rect_dnn=None) -> ImageResult:
+def get_mouth_ratios_facemesh(face_rois: list) -> list:
+    mouth_ratios = MODELS.get(MODEL_FACEMESH_LABELER).get_mouth_ratios(face_rois)
+    return np.round(mouth_ratios, 2).tolist()
+
+
+def decide_mouth_opened_facemesh(mouth_mar_facemesh: float) -> tuple:
+    return mouth_mar_facemesh >= FACEMESH_MOUTH_AR_THRESH, mouth_mar_facemesh, LNDMR_TYPE.FACEMESH
+
+
+def label_mouth_rois(face_rois: list, mouth_mars_dlib: list, fan_gate: LabelingGate = None) -> list:
+    """
+    Label face rois with the selected labeler, return (is opened, mouth ratio, landmarks type) per face.
+    The gated labeler counts into fan_gate of the video, a gate without audit is used if it is None
+    """
+    if LABELER == LABELER_FACEMESH:
+        return [decide_mouth_opened_facemesh(mouth_mar) for mouth_mar in get_mouth_ratios_facemesh(face_rois)]
+    if LABELER == LABELER_DLIB_FAN_GATED:
+        if fan_gate is None:
+            fan_gate = LabelingGate(MOUTH_AR_THRESH, FAN_GATE_BAND)
+        return label_mouth_rois_gated(face_rois, mouth_mars_dlib, fan_gate)
+    return [decide_mouth_opened(mouth_mar_dlib, mouth_mar_3ddfa)
+            for mouth_mar_dlib, mouth_mar_3ddfa in zip(mouth_mars_dlib, get_mouth_ratios_fan(face_rois))]
+
+
+def label_mouth_rois_gated(face_rois: list, mouth_mars_dlib: list, fan_gate: LabelingGate) -> list:
+    # dlib label, where dlib is far from the threshold
+    mouth_labels = [(mouth_mar_dlib >= MOUTH_AR_THRESH, mouth_mar_dlib, LNDMR_TYPE.DLIB)
+                    for mouth_mar_dlib in mouth_mars_dlib]
+    fan_indices = []
+    audit_indices = set()
+    for i, mouth_mar_dlib in enumerate(mouth_mars_dlib):
+        needs_fan, is_audit = fan_gate.needs_expensive(mouth_mar_dlib)
+        if needs_fan:
+            fan_indices.append(i)
+        if is_audit:
+            audit_indices.add(i)
+    mouth_ratios_fan = get_mouth_ratios_fan([face_rois[i] for i in fan_indices])
+    for i, mouth_mar_3ddfa in zip(fan_indices, mouth_ratios_fan):
+        mouth_label = decide_mouth_opened(mouth_mars_dlib[i], mouth_mar_3ddfa)
+        if i in audit_indices:
+            fan_gate.record_audit(mouth_label[0] == mouth_labels[i][0])
+        else:
+            mouth_labels[i] = mouth_label
+    return mouth_labels
+
+
+def get_mouth_opened(frame, start_x, start_y, end_x, end_y) -> tuple:
+    mouth_mar_dlib = get_mouth_ratio_dlib(frame, start_x, start_y, end_x, end_y)
+    face_roi_dlib = frame[start_y:end_y, start_x:end_x]
+    return label_mouth_rois([face_roi_dlib], [mouth_mar_dlib])[0]
+
+
+def crop_face_image(video_id: int, video_path: str, frame, frame_id: int, face_type: FACE_TYPE,
+                    sampling_planner: SamplingPlanner, is_dense_sampled: bool, box_source: str, face_rect_dlib,
+                    face_rect_dnn=None):
+    """
+    Crop face, label it with cheap dlib landmarks and return PendingImage for batched labeling, or None
+    """
     (start_x, start_y, end_x, end_y) = face_rect_dlib
     start_x = max(start_x, 0)
     start_y = max(start_y, 0)
     if start_x >= end_x or start_y >= end_y:
         print('Invalid detection. Skip', face_rect_dlib)
-        return ImageResult.not_processed()
+        return None
 
     face_roi_dlib = frame[start_y:end_y, start_x:end_x]
     if face_roi_dlib is None:
         print('Cropped face is None. Skip')
-        return ImageResult.not_processed()
+        return None
 
     height_frame, width_frame = face_roi_dlib.shape[:2]
     if height_frame < 50 or width_frame < 50:  # some images have invalid dlib face rect
         print('Too small face. Skip')
-        return ImageResult.not_processed()
+        return None
 
     # https://pyimagesearch.com/wp-content/uploads/2017/04/facial_landmarks_68markup.jpg
-    is_mouth_opened, open_mouth_ratio, lndmk_type = get_mouth_opened(frame, start_x, start_y, end_x, end_y)
-
-    # skip frames in normal and talking, containing opened mouth (we detect only yawn)
-    video_name = os.path.basename(video_path)
-    is_video_no_yawn = video_name.endswith('-Normal.avi') or \
-                       video_name.endswith('-Talking.avi')
-    if is_mouth_opened and is_video_no_yawn:
-        # some videos may contain opened mouth, skip these situations
-        return ImageResult.not_processed()
+    mouth_mar_dlib = get_mouth_ratio_dlib(frame, start_x, start_y, end_x, end_y)
+    sampling_planner.observe(mouth_mar_dlib >= MOUTH_AR_THRESH - SAMPLE_DENSE_MARGIN)
 
     prefix = 'dlib'
     target_face_roi = None
@@ -246,50 +409,108 @@ def recognize_image(video_id: int, video_path: str, frame, frame_id: int, face_t
     else:
         gray_img = cv2.cvtColor(target_face_roi, cv2.COLOR_BGR2GRAY)
     gray_img = detect_utils.resize_img(gray_img, MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT)
+    return PendingImage(video_id, video_path, frame_id, face_type, prefix, face_roi_dlib, gray_img, mouth_mar_dlib,
+                        is_dense_sampled, box_source)
+
+
+def label_pending_rois(pending_images: list, fan_gate: LabelingGate = None) -> list:
+    """
+    Same as label_mouth_rois, crops scored confidently by the pre-label model keep the model label and dlib ratio
+    """
+    face_rois = [pending_image.face_roi for pending_image in pending_images]
+    mouth_mars_dlib = [pending_image.mar_dlib for pending_image in pending_images]
+    if PRELABEL_MODEL is None:
+        return label_mouth_rois(face_rois, mouth_mars_dlib, fan_gate)
+    output_imgs = [pending_image.output_img for pending_image in pending_images]
+    model_labels = MODELS.get(MODEL_PRELABELER).pre_label(output_imgs)
+    mouth_labels = [(is_opened, mouth_mar_dlib, LNDMR_TYPE.MODEL)
+                    for is_opened, mouth_mar_dlib in zip(model_labels, mouth_mars_dlib)]
+    uncertain_indices = [i for i, is_opened in enumerate(model_labels) if is_opened is None]
+    if len(uncertain_indices) > 0:
+        landmark_labels = label_mouth_rois([face_rois[i] for i in uncertain_indices],
+                                           [mouth_mars_dlib[i] for i in uncertain_indices], fan_gate)
+        for i, mouth_label in zip(uncertain_indices, landmark_labels):
+            mouth_labels[i] = mouth_label
+    return mouth_labels
+
+
+def label_pending_images(pending_images: list, sampling_planner: SamplingPlanner, video_result,
+                         fan_gate: LabelingGate = None) -> list:
+    """
+    Label pending images in a batch with the selected labeler, then sample them in frame order.
+    Return image writer arguments of images to save
+    """
+    write_jobs = []
+    if len(pending_images) == 0:
+        return write_jobs
+    mouth_labels = label_pending_rois(pending_images, fan_gate)
+    for pending_image, (is_mouth_opened, open_mouth_ratio, lndmk_type) in zip(pending_images, mouth_labels):
+
+        # skip frames in normal and talking, containing opened mouth (we detect only yawn)
+        if is_mouth_opened and is_video_no_yawn(pending_image.video_path):
+            # some videos may contain opened mouth, skip these situations
+            continue
 
-    lndmk_type_name = lndmk_type.name.lower()
-    if is_mouth_opened:
-        global read_mouth_open_counter
-        read_mouth_open_counter = read_mouth_open_counter + 1
         # reduce img count
-        if read_mouth_open_counter % SAMPLE_STEP_IMG_OPENED != 0:
-            return ImageResult.not_processed()
-
-        global saved_mouth_open_counter
-        saved_mouth_open_counter = saved_mouth_open_counter + 1
-        file_name = os.path.join(MOUTH_OPENED_FOLDER,
-                                 f'{read_mouth_open_counter}_{open_mouth_ratio}_{video_id}_{frame_id}_{prefix}_{lndmk_type_name}.jpg')
-        cv2.imwrite(file_name, gray_img)
-        return ImageResult(is_processed=True, is_opened_image=True)
-    else:
-        global read_mouth_close_counter
-        read_mouth_close_counter = read_mouth_close_counter + 1
-        # reduce img count
-        if read_mouth_close_counter % SAMPLE_STEP_IMG_CLOSED != 0:
-            return ImageResult.not_processed()
-
-        global saved_mouth_close_counter
-        saved_mouth_close_counter = saved_mouth_close_counter + 1
-        file_name = os.path.join(MOUTH_CLOSED_FOLDER,
-                                 f'{read_mouth_close_counter}_{open_mouth_ratio}_{video_id}_{frame_id}_{prefix}_{lndmk_type_name}.jpg')
-        cv2.imwrite(file_name, gray_img)
-        return ImageResult(is_processed=True, is_opened_image=False)
-
+        if sampling_planner.keep(is_mouth_opened, pending_image.is_dense_sampled) is False:
+            continue
 
-def detect_faces_complex(frame):
-    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    face_list_dlib = inference_utils.detect_face_dlib(detector, gray_frame)
-    if len(face_list_dlib) > 0:
-        return face_list_dlib, FACE_TYPE.DLIB
+        if is_mouth_opened:
+            read_counter = sampling_planner.read_opened
+            video_result.opened_counter = video_result.opened_counter + 1
+        else:
+            read_counter = sampling_planner.read_closed
+            video_result.closed_counter = video_result.closed_counter + 1
+
+        if pending_image.face_type == FACE_TYPE.DLIB:
+            video_result.dlib_counter = video_result.dlib_counter + 1
+        elif pending_image.face_type == FACE_TYPE.CAFFE:
+            video_result.caffe_counter = video_result.caffe_counter + 1
+        else:
+            video_result.blazeface_counter = video_result.blazeface_counter + 1
+        box_counter = 'box_' + pending_image.box_source
+        setattr(video_result, box_counter, getattr(video_result, box_counter) + 1)
+
+        write_jobs.append((pending_image.output_img, is_mouth_opened, open_mouth_ratio, pending_image.video_id,
+                           pending_image.frame_id, pending_image.prefix, lndmk_type.name.lower(), read_counter,
+                           pending_image.box_source))
+    return write_jobs
+
+
+# reorder and skip detectors per video by hit rate and latency, False keeps FACE_DETECTOR_ORDER
+ADAPTIVE_CASCADE = True
+
+# every detector runs on a downscaled frame first, larger scales only if no face is found
+PYRAMID_DETECTORS = {
+    FACE_TYPE.DLIB: PyramidDetector(
+        'dlib',
+        lambda gray: inference_utils.detect_face_dlib(MODELS.get(MODEL_DLIB_DETECTOR), gray, upsample=0),
+        DLIB_PYRAMID_SCALES
+    ),
+    FACE_TYPE.CAFFE: PyramidDetector(
+        'caffe',
+        lambda frame: MODELS.get(MODEL_SSD_DETECTOR).detect_face(frame),
+        SSD_PYRAMID_SCALES
+    ),
+    FACE_TYPE.BLAZEFACE: PyramidDetector(
+        'blazeface',
+        lambda frame: MODELS.get(MODEL_BLAZEFACE_DETECTOR).detect_face(frame),
+        BLAZEFACE_PYRAMID_SCALES
+    )
+}
+# detectors take FrameDetections, dlib works on the gray frame converted once per frame
+FACE_DETECTORS = {
+    FACE_TYPE.DLIB: lambda frame_detections: PYRAMID_DETECTORS[FACE_TYPE.DLIB](frame_detections.gray),
+    FACE_TYPE.CAFFE: lambda frame_detections: PYRAMID_DETECTORS[FACE_TYPE.CAFFE](frame_detections.frame),
+    FACE_TYPE.BLAZEFACE: lambda frame_detections: PYRAMID_DETECTORS[FACE_TYPE.BLAZEFACE](frame_detections.frame)
+}
+FACE_DETECTOR_ORDER = [FACE_TYPE.DLIB, FACE_TYPE.CAFFE, FACE_TYPE.BLAZEFACE]
 
-    face_list_dnn_cafe = ssd_face_detector.detect_face(frame)
-    if len(face_list_dnn_cafe) > 0:
-        return face_list_dnn_cafe, FACE_TYPE.CAFFE
 
-    face_list_dnn_blaze = blazefaceDetector.detect_face(frame)
-    if len(face_list_dnn_blaze) > 0:
-        return face_list_dnn_blaze, FACE_TYPE.BLAZEFACE
-    return [], None
+def detect_faces_complex(frame_detections: FrameDetections, cascade: AdaptiveCascade = None) -> tuple:
+    if cascade is None:
+        return frame_detections.detect_first(FACE_DETECTOR_ORDER)
+    return cascade.detect_first(frame_detections)
 
 
 def process_video(video_id, video_path) -> VideoResult:
@@ -302,92 +523,172 @@ def process_video(video_id, video_path) -> VideoResult:
     if cap.isOpened() is False:
         print('Video is not opened', video_path)
         return VideoResult.empty()
-    face_dlib_counter = 0
-    face_caffe_counter = 0
-    face_blazeface_counter = 0
-
-    opened_img_counter = 0
-    closed_img_counter = 0
-
-    frame_id = 0
-    face_type = FACE_TYPE.DLIB
-    while True:
-        ret, frame = cap.read()
-        if ret is False:
-            break
-        if frame is None:
-            print('No images left in', video_path)
-            break
-        if np.shape(frame) == ():
-            print('Empty image. Skip')
-            continue
-
-        frame_id = frame_id + 1
-
-        face_list, f_type = detect_faces_complex(frame)
-        if len(face_list) == 0:
-            # skip images not recognized by dlib or other detectors
-            continue
-
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        recognize_frame = frame if COLOR_IMG else gray_frame
-        if face_type == FACE_TYPE.DLIB:
-            image_result = recognize_image(video_id, video_path, recognize_frame, frame_id, face_type,
-                                           face_list[0])
-            is_processed = image_result.is_processed
-            if is_processed:
-                face_type = face_type.get_next()
-                face_dlib_counter = face_dlib_counter + 1
-                if image_result.is_opened_image:
-                    opened_img_counter = opened_img_counter + 1
-                else:
-                    closed_img_counter = closed_img_counter + 1
-            continue
-
-        if face_type == FACE_TYPE.CAFFE:
-            face_list_dnn = ssd_face_detector.detect_face(frame)
-            if len(face_list_dnn) == 0:
-                face_type = face_type.get_next()
-                print('Face not found with Caffe DNN')
+    video_result = VideoResult.empty()
+    # detectors are shared by the videos of a process, their stats are printed per video
+    for pyramid_detector in PYRAMID_DETECTORS.values():
+        pyramid_detector.reset_stats()
+
+    # opened images of videos without yawns are dropped, no need to decode densely there
+    sampling_planner = SamplingPlanner(SAMPLE_STEP_IMG_OPENED, SAMPLE_STEP_IMG_CLOSED,
+                                       dense_hold=SAMPLE_DENSE_HOLD,
+                                       allow_dense=not is_video_no_yawn(video_path))
+    # detector order adapts to the hit rate and cost of detectors in this video
+    cascade = AdaptiveCascade(FACE_DETECTOR_ORDER) if ADAPTIVE_CASCADE else None
+    # counts of the gated labeler in this video
+    fan_gate = LabelingGate(MOUTH_AR_THRESH, FAN_GATE_BAND, FAN_GATE_AUDIT_INTERVAL) \
+        if LABELER == LABELER_DLIB_FAN_GATED else None
+    # state of single threaded stages
+    decode_state = {'frame_id': 0}
+    detect_state = {'face_type': FACE_TYPE.DLIB, 'roi_detections': None, 'cascade_type': None}
+
+    def detect_cascade(frame_detections: FrameDetections) -> list:
+        # detector which found the face, the last cascade run of a frame gives the tracked box
+        face_list, f_type = detect_faces_complex(frame_detections, cascade)
+        detect_state['cascade_type'] = f_type
+        return face_list
+
+    def detect_roi_faces(roi_image) -> list:
+        # detections of the tracker roi are kept for the frame, the rotation crop reuses them
+        roi_detections = FrameDetections(roi_image, FACE_DETECTORS)
+        detect_state['roi_detections'] = roi_detections
+        return detect_cascade(roi_detections)
+
+    face_tracker = FaceTracker(detect_roi_faces, keyframe_interval=TRACK_KEYFRAME_INTERVAL)
+    pending_images = []
+
+    def decode_frame():
+        # decode stage: next sampled frame as (frame_id, frame, is dense sampled), None at the end of video
+        while True:
+            is_decoded, is_dense_sampled = sampling_planner.should_decode()
+            if is_decoded is False:
+                # advance without decoding, the frame would not be sampled anyway
+                if cap.grab() is False:
+                    return None
+                decode_state['frame_id'] = decode_state['frame_id'] + 1
                 continue
 
-            image_result = recognize_image(video_id, video_path, recognize_frame, frame_id, face_type,
-                                           face_list[0],
-                                           face_list_dnn[0])
-            is_processed = image_result.is_processed
-            if is_processed:
-                face_type = face_type.get_next()
-                face_caffe_counter = face_caffe_counter + 1
-                if image_result.is_opened_image:
-                    opened_img_counter = opened_img_counter + 1
-                else:
-                    closed_img_counter = closed_img_counter + 1
-
-        if face_type == FACE_TYPE.BLAZEFACE:
-            face_list_dnn = blazefaceDetector.detect_face(frame)
-            if len(face_list_dnn) == 0:
-                face_type = face_type.get_next()
-                print('Face not found with Blazeface')
+            ret, frame = cap.read()
+            if ret is False:
+                return None
+            if frame is None:
+                print('No images left in', video_path)
+                return None
+            if np.shape(frame) == ():
+                print('Empty image. Skip')
+                sampling_planner.release(is_dense_sampled)
                 continue
-            image_result = recognize_image(video_id, video_path, recognize_frame, frame_id, face_type,
-                                           face_list[0],
-                                           face_list_dnn[0])
-            is_processed = image_result.is_processed
-            if is_processed:
-                face_type = face_type.get_next()
-                face_blazeface_counter = face_blazeface_counter + 1
-                if image_result.is_opened_image:
-                    opened_img_counter = opened_img_counter + 1
-                else:
-                    closed_img_counter = closed_img_counter + 1
+            decode_state['frame_id'] = decode_state['frame_id'] + 1
+            return decode_state['frame_id'], frame, is_dense_sampled
+
+    def detect_frame(decoded_frame) -> list:
+        # detect stage: face detection, tracking and crop with cheap dlib labeling
+        try:
+            return detect_face_crop(decoded_frame)
+        finally:
+            # decoder may wait for the sampling mode of this frame
+            sampling_planner.release(decoded_frame[2])
+
+    def detect_face_crop(decoded_frame) -> list:
+        frame_id, frame, is_dense_sampled = decoded_frame
+        face_type = detect_state['face_type']
+        frame_detections = FrameDetections(frame, FACE_DETECTORS)
+        detect_state['roi_detections'] = None
+        face_list = face_tracker.update(frame, frame_detections.gray,
+                                        detect_full=lambda: detect_cascade(frame_detections))
+        if len(face_list) == 0:
+            # skip images not recognized by dlib or other detectors
+            return []
+        if face_tracker.last_update == UPDATE_PROPAGATED:
+            box_source = BOX_SOURCE_TRACKED
+        else:
+            box_source = detect_state['cascade_type'].name.lower()
+
+        # output crop rotates between detectors, landmarks always use the tracked face rect
+        face_rect_dnn = None
+        if face_type != FACE_TYPE.DLIB:
+            if frame_detections.has_run(face_type):
+                # reuses cascade result, if dlib missed and the detector already ran on this frame
+                face_list_dnn = frame_detections.detect(face_type)
+                face_rect_dnn = face_list_dnn[0] if len(face_list_dnn) > 0 else None
+            elif face_tracker.last_update == UPDATE_ROI:
+                # tracked face was found in the roi, the detector may already have run there in the cascade
+                face_list_dnn = detect_state['roi_detections'].detect(face_type)
+                face_rect_dnn = roi_to_frame(face_list_dnn[0], face_tracker.roi) if len(face_list_dnn) > 0 else None
+            else:
+                # only around the tracked face, a full frame detection would undo the tracker savings
+                face_rect_dnn = detect_in_roi(PYRAMID_DETECTORS[face_type], frame_detections.frame, face_list[0],
+                                              face_tracker.roi_scale)
+            if face_rect_dnn is None:
+                print(f'Face not found with {face_type.name}')
+                detect_state['face_type'] = face_type.get_next()
+                return []
+
+        recognize_frame = frame if COLOR_IMG else frame_detections.gray
+        pending_image = crop_face_image(video_id, video_path, recognize_frame, frame_id, face_type,
+                                        sampling_planner, is_dense_sampled, box_source, face_list[0],
+                                        face_rect_dnn)
+        if pending_image is None:
+            return []
+        # labels are known only after the batch, rotate detectors per cropped image
+        detect_state['face_type'] = face_type.get_next()
+        return [pending_image]
+
+    def label_image(pending_image) -> list:
+        # label stage: batched FaceAlignment labeling and sampling
+        pending_images.append(pending_image)
+        if len(pending_images) < FAN_BATCH_SIZE:
+            return []
+        return label_batch()
+
+    def label_batch() -> list:
+        write_jobs = label_pending_images(pending_images, sampling_planner, video_result, fan_gate)
+        pending_images.clear()
+        return write_jobs
+
+    def write_image(write_job) -> list:
+        # write stage: image encoding and output
+        image_writer.write(*write_job)
+        return []
+
+    image_writer = create_image_writer(video_id)
+    pipeline = ExtractionPipeline(decode_frame, [
+        PipelineStage('detect', detect_frame, queue_size=EXTRACT_QUEUE_SIZE),
+        PipelineStage('label', label_image, queue_size=EXTRACT_QUEUE_SIZE, flush_fn=label_batch),
+        # shard writer is not thread-safe, jpeg encoding is
+        PipelineStage('write', write_image, queue_size=EXTRACT_QUEUE_SIZE,
+                      threads=EXTRACT_WRITER_THREADS if OUTPUT_FORMAT == OUTPUT_FORMAT_JPEG else 1)
+    ])
+    try:
+        pipeline.run()
+    finally:
+        image_writer.close()
+        cap.release()
+    video_result.total_frames = decode_state['frame_id']
+    if fan_gate is not None:
+        video_result.gate_frames = fan_gate.frames
+        video_result.gate_fired = fan_gate.gate_fired
+        video_result.gate_audited = fan_gate.audited
+        video_result.gate_audit_differences = fan_gate.audit_differences
 
     print(
-        f"Total images: {face_dlib_counter + face_caffe_counter + face_blazeface_counter}"
-        f', dlib: {face_dlib_counter} images'
-        f', blazeface: {face_blazeface_counter} images'
-        f', caffe: {face_caffe_counter} images in video {video_name}'
+        f"Total images: {video_result.dlib_counter + video_result.caffe_counter + video_result.blazeface_counter}"
+        f', dlib: {video_result.dlib_counter} images'
+        f', blazeface: {video_result.blazeface_counter} images'
+        f', caffe: {video_result.caffe_counter} images in video {video_name}'
     )
-    cap.release()
+    print(f'Landmarks rect from dlib: {video_result.box_dlib}, caffe: {video_result.box_caffe}'
+          f', blazeface: {video_result.box_blazeface}, tracked: {video_result.box_tracked} images')
+    if cascade is not None:
+        print(cascade)
+    if fan_gate is not None:
+        print(fan_gate)
+    if PRELABEL_MODEL is not None:
+        print(MODELS.get(MODEL_PRELABELER))
+    print(face_tracker.stats)
+    pipeline.print_stats()
+    for pyramid_detector in PYRAMID_DETECTORS.values():
+        print(pyramid_detector)
+    print(f'Frames skipped without decoding: {sampling_planner.skipped_frames}')
 
     # The function is not implemented. Rebuild the library with Windows, GTK+ 2.x or Cocoa support. If you are on
     # Ubuntu or Debian, install libgtk2.0-dev and pkg-config, then re-run cmake or configure script in function
@@ -397,57 +698,187 @@ def process_video(video_id, video_path) -> VideoResult:
     except:
         print('No destroy windows')
 
-    return VideoResult(
-        frame_id,
-        face_dlib_counter,
-        face_blazeface_counter,
-        face_caffe_counter,
-        opened_img_counter,
-        closed_img_counter
-    )
+    return video_result
 
 
-def write_csv_stat(filename, video_count, video_result: VideoResult):
+def write_csv_stats(video_rows: list):
+    """
+    Write rows of (video id, file name, VideoResult) ordered by video id
+    """
     video_stat_dict_path = os.path.join(MOUTH_FOLDER, CSV_STATS)
-    if os.path.isfile(video_stat_dict_path) is False:
-        with open(video_stat_dict_path, 'w') as f:
-            w = csv.writer(f)
-            w.writerow(['Video id', 'File name', 'Total frames', 'Image saved', 'Opened img', 'Closed img'])
-
-    # mode 'a' append
-    with open(video_stat_dict_path, 'a') as f:
+    with open(video_stat_dict_path, 'w') as f:
         w = csv.writer(f)
-        img_counter = video_result.caffe_counter + video_result.dlib_counter + video_result.blazeface_counter
-        w.writerow((
-            video_count,
-            filename,
-            video_result.total_frames,
-            img_counter,
-            video_result.opened_counter,
-            video_result.closed_counter
-        ))
-
-
-def process_videos():
-    video_count = 0
-    total_frames = 0
+        w.writerow(['Video id', 'File name', 'Total frames', 'Image saved', 'Opened img', 'Closed img',
+                    'Gate frames', 'Gate fired', 'Gate audited', 'Gate audit differences',
+                    'Box dlib', 'Box caffe', 'Box blazeface', 'Box tracked'])
+        for video_id, filename, video_result in sorted(video_rows, key=lambda row: row[0]):
+            img_counter = video_result.caffe_counter + video_result.dlib_counter + video_result.blazeface_counter
+            w.writerow((
+                video_id,
+                filename,
+                video_result.total_frames,
+                img_counter,
+                video_result.opened_counter,
+                video_result.closed_counter,
+                video_result.gate_frames,
+                video_result.gate_fired,
+                video_result.gate_audited,
+                video_result.gate_audit_differences,
+                video_result.box_dlib,
+                video_result.box_caffe,
+                video_result.box_blazeface,
+                video_result.box_tracked
+            ))
+
+
+def list_videos() -> list:
+    # sorted, so video ids do not depend on file system order
+    video_paths = []
     for root, dirs, files in os.walk(YAWDD_DATASET_FOLDER):
         for file in files:
             if file.endswith(".avi"):
-                video_count = video_count + 1
-                file_name = os.path.join(root, file)
-                print('Current video', file_name)
-
-                video_result = process_video(video_count, file_name)
-                total_frames = total_frames + video_result.total_frames
-                write_csv_stat(file_name, video_count, video_result)
-
-    print(f'Videos processed: {video_count}')
+                video_paths.append(os.path.join(root, file))
+    return sorted(video_paths)
+
+
+def extraction_settings() -> dict:
+    # videos extracted with other settings are extracted again
+    return {
+        'mouth_ar_thresh': MOUTH_AR_THRESH,
+        'sample_step_img_opened': SAMPLE_STEP_IMG_OPENED,
+        'sample_step_img_closed': SAMPLE_STEP_IMG_CLOSED,
+        'sample_dense_margin': SAMPLE_DENSE_MARGIN,
+        'sample_dense_hold': SAMPLE_DENSE_HOLD,
+        'color_img': COLOR_IMG,
+        'max_image_width': MAX_IMAGE_WIDTH,
+        'max_image_height': MAX_IMAGE_HEIGHT,
+        'output_format': OUTPUT_FORMAT,
+        'track_keyframe_interval': TRACK_KEYFRAME_INTERVAL,
+        'dlib_pyramid_scales': list(DLIB_PYRAMID_SCALES),
+        'ssd_pyramid_scales': list(SSD_PYRAMID_SCALES),
+        'blazeface_pyramid_scales': list(BLAZEFACE_PYRAMID_SCALES),
+        'adaptive_cascade': ADAPTIVE_CASCADE,
+        'labeler': LABELER,
+        'fan_gate_band': FAN_GATE_BAND,
+        'dlib_landmarks': DLIB_LANDMARKS,
+        'prelabel_model': PRELABEL_MODEL,
+        'prelabel_band': [PRELABEL_LOW, PRELABEL_HIGH],
+        'index_fields': list(INDEX_FIELDS)
+    }
+
+
+def remove_video_images(video_ids: set):
+    # image name: {counter}_{mar}_{video_id}_{frame_id}_{detector}_{landmarks}.jpg
+    if len(video_ids) == 0:
+        return
+    video_id_strs = set(str(video_id) for video_id in video_ids)
+    removed_counter = 0
+    for folder in [MOUTH_OPENED_FOLDER, MOUTH_CLOSED_FOLDER]:
+        for file_name in os.listdir(folder):
+            name_parts = os.path.splitext(file_name)[0].split('_')
+            if len(name_parts) > 2 and name_parts[2] in video_id_strs:
+                os.remove(os.path.join(folder, file_name))
+                removed_counter = removed_counter + 1
+    video_names = set(f'{video_id:05d}' for video_id in video_ids)
+    removed_counter = removed_counter + remove_shards(MOUTH_SHARDS_FOLDER, video_names)
+    remove_video_indices(MOUTH_FOLDER, video_names)
+    print(f'Removed {removed_counter} image files of unfinished videos')
+
+
+def process_video_task(task: tuple) -> tuple:
+    video_id, file_name = task
+    print('Current video', file_name)
+    return video_id, file_name, process_video(video_id, file_name)
+
+
+def process_video_task_timed(task: tuple) -> tuple:
+    # workers import and load models on their own, send their timings back with the video row
+    return process_video_task(task), os.getpid(), MODELS.timings()
+
+
+def process_videos(workers: int = 1, output_format: str = OUTPUT_FORMAT_JPEG, labeler: str = LABELER_DLIB_FAN,
+                   dlib_landmarks: str = LANDMARKS_DLIB_68, prelabel_model: str = None):
+    global OUTPUT_FORMAT, LABELER, DLIB_LANDMARKS, PRELABEL_MODEL
+    OUTPUT_FORMAT = output_format
+    LABELER = labeler
+    DLIB_LANDMARKS = dlib_landmarks
+    PRELABEL_MODEL = prelabel_model
+    manifest = ExtractionManifest(os.path.join(MOUTH_FOLDER, MANIFEST_FILE), extraction_settings())
+    video_rows = []
+    tasks = []
+    stale_video_ids = set()
+    for file_name in list_videos():
+        video_id = manifest.get_video_id(file_name)
+        if manifest.is_done(file_name):
+            video_rows.append((video_id, file_name, VideoResult(**manifest.get_result(file_name))))
+            continue
+        if manifest.is_known(file_name):
+            # crashed in the middle, video changed or settings changed, start over
+            stale_video_ids.add(video_id)
+        manifest.mark_started(file_name, video_id)
+        tasks.append((video_id, file_name))
+    manifest.save()
+    print(f'Videos already extracted: {len(video_rows)}, to extract: {len(tasks)}')
+    remove_video_images(stale_video_ids)
+
+    def on_video_done(video_row):
+        video_id, file_name, video_result = video_row
+        video_rows.append(video_row)
+        manifest.mark_done(file_name, vars(video_result))
+        manifest.save()
+
+    if workers > 1 and len(tasks) > 0:
+        download_models()
+        # tensorflow and torch are not fork-safe, start clean interpreters
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(processes=workers, initializer=init_worker,
+                      initargs=(output_format, labeler, dlib_landmarks, prelabel_model)) as pool:
+            worker_timings = {}  # pid -> latest timings of the worker
+            for video_row, worker_pid, timings in pool.imap_unordered(process_video_task_timed, tasks):
+                on_video_done(video_row)
+                worker_timings[worker_pid] = timings
+        print(report_workers(worker_timings.values()))
+    elif len(tasks) > 0:
+        for task in tasks:
+            on_video_done(process_video_task(task))
+        print(MODELS.report())
+    write_csv_stats(video_rows)
+    if output_format == OUTPUT_FORMAT_JPEG:
+        print(f'Metadata index rows: {merge_video_indices(MOUTH_FOLDER)}')
+
+    total_frames = sum(video_result.total_frames for _, _, video_result in video_rows)
+    saved_opened = sum(video_result.opened_counter for _, _, video_result in video_rows)
+    saved_closed = sum(video_result.closed_counter for _, _, video_result in video_rows)
+    print(f'Videos processed: {len(video_rows)}')
     print(f'Total read images: {total_frames}')
-    print(f'Total saved images: {saved_mouth_open_counter + saved_mouth_close_counter}')
-    print(f'Saved opened mouth images: {saved_mouth_open_counter}')
-    print(f'Saved closed mouth images: {saved_mouth_close_counter}')
+    print(f'Total saved images: {saved_opened + saved_closed}')
+    print(f'Saved opened mouth images: {saved_opened}')
+    print(f'Saved closed mouth images: {saved_closed}')
+    gate_frames = sum(video_result.gate_frames for _, _, video_result in video_rows)
+    if gate_frames > 0:
+        gate_fired = sum(video_result.gate_fired for _, _, video_result in video_rows)
+        print(f'FAN gate fired: {gate_fired} of {gate_frames} frames ({gate_fired / gate_frames * 100:.1f}%)')
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Convert YawDD videos to mouth images.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes, each loads its own models")
+    parser.add_argument("--output-format", type=str, default=OUTPUT_FORMAT_JPEG,
+                        choices=[OUTPUT_FORMAT_JPEG, OUTPUT_FORMAT_SHARDS],
+                        help="one jpeg per crop, or fixed-size binary shards with index")
+    parser.add_argument("--labeler", type=str, default=LABELER_DLIB_FAN,
+                        choices=[LABELER_DLIB_FAN, LABELER_DLIB_FAN_GATED, LABELER_FACEMESH],
+                        help="dlib checked by FaceAlignment FAN, FAN only near the threshold, or face mesh only")
+    parser.add_argument("--dlib-landmarks", type=str, default=LANDMARKS_DLIB_68,
+                        choices=[LANDMARKS_DLIB_68, LANDMARKS_DLIB_MOUTH],
+                        help="dlib 68 face points, or the mouth-only predictor of train_mouth_predictor.py")
+    parser.add_argument("--prelabel-model", type=str, default=None,
+                        help="TFLite yawn model, e.g. ./out_epoch_80_lite/yawn_model_float_80.tflite;"
+                             " confidently scored crops are labeled by it instead of landmarks")
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
-    process_videos()
+    args = get_args()
+    process_videos(args.workers, args.output_format, args.labeler, args.dlib_landmarks, args.prelabel_model)
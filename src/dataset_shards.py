@@ -0,0 +1,122 @@
+import glob
+import os
+
+import cv2
+import numpy as np
+
+from yawn_train.src.metadata_index import save_atomic, save_index, to_columns
+
+SHARD_SIZE = 1024
+SHARD_IMAGES_FILE = 'images_{}.npy'
+SHARD_INDEX_FILE = 'index_{}.npz'
+CLASS_INDICES = {'closed': 0, 'opened': 1}
+
+
+class ShardWriter(object):
+    """
+    Streams fixed-size mouth crops into shards of shard_size images instead of one JPEG per crop.
+    Every shard is images_{name}.npy (N, H, W, C) uint8, with a sidecar index_{name}.npz holding one array per field,
+    same columns as the metadata index.
+    """
+
+    def __init__(self, folder: str, shard_prefix: str, img_size: tuple, channels: int = 1,
+                 shard_size: int = SHARD_SIZE):
+        self.folder = folder
+        self.shard_prefix = shard_prefix
+        self.img_width, self.img_height = img_size
+        self.channels = channels
+        self.shard_size = shard_size
+        self.shard_counter = 0
+        self.images = []
+        self.records = []
+        os.makedirs(folder, exist_ok=True)
+
+    def write(self, img, is_opened: bool, mar: float, video_id: int, frame_id: int, detector: str, landmark: str,
+              read_counter: int, box_source: str):
+        if img.shape[0] != self.img_height or img.shape[1] != self.img_width:
+            img = cv2.resize(img, (self.img_width, self.img_height), interpolation=cv2.INTER_AREA)
+        self.images.append(np.reshape(img, (self.img_height, self.img_width, self.channels)))
+        self.records.append((int(is_opened), mar, video_id, frame_id, detector, landmark, read_counter, box_source))
+        if len(self.images) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.images) == 0:
+            return
+        shard_name = f'{self.shard_prefix}_{self.shard_counter:03d}'
+        images = np.stack(self.images).astype(np.uint8)
+        save_atomic(os.path.join(self.folder, SHARD_IMAGES_FILE.format(shard_name)),
+                    lambda f: np.save(f, images))
+        # index is written last, shard without index is incomplete
+        save_index(os.path.join(self.folder, SHARD_INDEX_FILE.format(shard_name)), to_columns(self.records))
+        self.shard_counter = self.shard_counter + 1
+        self.images = []
+        self.records = []
+
+    def close(self):
+        self.flush()
+
+
+def remove_shards(folder: str, shard_prefixes: set) -> int:
+    removed_counter = 0
+    if not os.path.isdir(folder):
+        return removed_counter
+    for file_name in os.listdir(folder):
+        for pattern in [SHARD_IMAGES_FILE, SHARD_INDEX_FILE]:
+            prefix, suffix = pattern.split('{}')
+            if file_name.startswith(prefix) and file_name.endswith(suffix):
+                shard_name = file_name[len(prefix):-len(suffix)]
+                if shard_name.rsplit('_', 1)[0] in shard_prefixes:
+                    os.remove(os.path.join(folder, file_name))
+                    removed_counter = removed_counter + 1
+    return removed_counter
+
+
+class ShardDataset(object):
+    """
+    All shards of a folder: images are memory-mapped, index fields are concatenated across shards
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.shards = []
+        index_parts = {}
+        prefix, suffix = SHARD_INDEX_FILE.split('{}')
+        for shard_id, index_path in enumerate(sorted(glob.glob(os.path.join(folder, SHARD_INDEX_FILE.format('*'))))):
+            shard_name = os.path.basename(index_path)[len(prefix):-len(suffix)]
+            shard_images = np.load(os.path.join(folder, SHARD_IMAGES_FILE.format(shard_name)), mmap_mode='r')
+            self.shards.append(shard_images)
+            with np.load(index_path) as shard_index:
+                for field in shard_index.files:
+                    index_parts.setdefault(field, []).append(shard_index[field])
+            index_parts.setdefault('shard', []).append(np.full(len(shard_images), shard_id, dtype=np.int32))
+            index_parts.setdefault('offset', []).append(np.arange(len(shard_images), dtype=np.int32))
+        self.index = {field: np.concatenate(parts) for field, parts in index_parts.items()}
+
+    def __len__(self):
+        return len(self.index['label']) if 'label' in self.index else 0
+
+    @property
+    def labels(self) -> np.ndarray:
+        return self.index['label']
+
+    def get_images(self, indices) -> np.ndarray:
+        shard_ids = self.index['shard'][indices]
+        offsets = self.index['offset'][indices]
+        return np.stack([self.shards[shard_id][offset] for shard_id, offset in zip(shard_ids, offsets)])
+
+    def split(self, train_ratio=0.80, val_ratio=0.15, seed: int = 0) -> tuple:
+        """
+        Per class random split into train, val, test indices, same ratios as SplitDatasetManager
+        """
+        rng = np.random.RandomState(seed)
+        train_idx, val_idx, test_idx = [], [], []
+        for label in np.unique(self.labels):
+            label_idx = np.flatnonzero(self.labels == label)
+            rng.shuffle(label_idx)
+            train_part, val_part, test_part = np.split(label_idx, [int(len(label_idx) * train_ratio),
+                                                                   int(len(label_idx) * (train_ratio + val_ratio))])
+            train_idx.append(train_part)
+            val_idx.append(val_part)
+            test_idx.append(test_part)
+        return np.concatenate(train_idx), np.concatenate(val_idx), np.concatenate(test_idx)
@@ -1,11 +1,13 @@
 import cv2
 import face_alignment
+import numpy as np
 import torch
 from imutils import face_utils
 from skimage import io
 
 from yawn_train.src import detect_utils
-from yawn_train.src.convert_dataset_video_to_mouth_img import MOUTH_AR_THRESH
+from yawn_train.src.model_config import MOUTH_AR_THRESH
+from yawn_train.src.metadata_index import MetadataIndex
 
 print(torch.__version__)
 (mStart, mEnd) = face_utils.FACIAL_LANDMARKS_IDXS["mouth"]
@@ -31,70 +33,64 @@ cv2.imshow("3D landmarks", input)
 cv2.waitKey(0)
 
 
-def scan_folder(directory):
+def get_face_landmarks(paths: list) -> np.ndarray:
+    shapes = []
+    for path in paths:
+        img = io.imread(path)
+        shapes.append(fa.get_landmarks(img)[-1][:, :2])
+    return np.array(shapes).reshape((-1, 68, 2))
+
+
+def scan_folder(metadata_index):
     import os
     from shutil import copyfile
-    for filename in os.listdir(directory):
-        if filename.endswith(".png") or filename.endswith(".jpg"):
-            path = os.path.join(directory, filename)
-            img = io.imread(path)
-            shape = fa.get_landmarks(img)[-1]
-            mouth = shape[mStart:mEnd]
-            mouth_mar = round(detect_utils.mouth_aspect_ratio(mouth), 2)
-            print(mouth_mar)
-
-            filename_only = os.path.splitext(filename)[0]
-
-            img_threshold = filename_only.split("_")
-            conf = float(img_threshold[2])
-            if conf >= MOUTH_AR_THRESH > mouth_mar or conf < MOUTH_AR_THRESH <= mouth_mar:
-                os.makedirs('../incorrect/', exist_ok=True)
-                copyfile(path, './incorrect/' + str(mouth_mar) + '_' + os.path.basename(filename))
-            continue
-        else:
+    paths = metadata_index.paths
+    shapes = get_face_landmarks(paths)
+    # one vectorized call for the whole folder
+    mouth_mars = np.round(detect_utils.mouth_aspect_ratios(shapes), 2)
+    for path, conf, mouth_mar in zip(paths, metadata_index['mar'], mouth_mars):
+        filename = os.path.basename(path)
+        print(mouth_mar)
+        if conf >= MOUTH_AR_THRESH > mouth_mar or conf < MOUTH_AR_THRESH <= mouth_mar:
+            os.makedirs('../incorrect/', exist_ok=True)
+            copyfile(path, './incorrect/' + str(mouth_mar) + '_' + os.path.basename(filename))
+
+
+def filter_out(metadata_index):
+    import os
+    from shutil import copyfile
+    paths = metadata_index.paths
+    shapes = get_face_landmarks(paths)
+    mouth_mars = np.round(detect_utils.mouth_aspect_ratios(shapes), 2)
+    for path, conf, shape, mouth_mar in zip(paths, metadata_index['mar'], shapes, mouth_mars):
+        filename = os.path.basename(path)
+        print(mouth_mar)
+        if mouth_mar > 1.0 and conf < 0.3:
+            print('Filter image by confidence: ' + os.path.basename(filename))
+            os.makedirs('../filtered/', exist_ok=True)
+            copyfile(path, './filtered/' + str(mouth_mar) + '_' + os.path.basename(filename))
             continue
 
+        # if nose point is most left
+        nose_left = shape[29][0] < shape[0][0] and shape[30][0] < shape[0][0] and \
+                    shape[29][0] < shape[1][0] and shape[30][0] < shape[1][0]
 
-def filter_out(directory):
-    import os
-    from shutil import copyfile
-    for filename in os.listdir(directory):
-        if filename.endswith(".png") or filename.endswith(".jpg"):
-            path = os.path.join(directory, filename)
-            img = io.imread(path)
-            shape = fa.get_landmarks(img)[-1]
-            mouth = shape[mStart:mEnd]
-            mouth_mar = round(detect_utils.mouth_aspect_ratio(mouth), 2)
-            print(mouth_mar)
-
-            filename_only = os.path.splitext(filename)[0]
-            img_threshold = filename_only.split("_")
-            conf = float(img_threshold[2])
-            if mouth_mar > 1.0 and conf < 0.3:
-                print('Filter image by confidence: ' + os.path.basename(filename))
-                os.makedirs('../filtered/', exist_ok=True)
-                copyfile(path, './filtered/' + str(mouth_mar) + '_' + os.path.basename(filename))
-                continue
-
-            # if nose point is most left
-            nose_left = shape[29][0] < shape[0][0] and shape[30][0] < shape[0][0] and \
-                        shape[29][0] < shape[1][0] and shape[30][0] < shape[1][0]
-
-            nose_right = shape[29][0] > shape[16][0] and shape[30][0] > shape[16][0] and \
-                         shape[29][0] > shape[15][0] and shape[30][0] > shape[15][0]
-
-            if nose_left or nose_right:
-                print('Filter image: ' + os.path.basename(filename))
-                os.makedirs('../filtered/', exist_ok=True)
-                copyfile(path, './filtered/' + str(mouth_mar) + '_' + os.path.basename(filename))
+        nose_right = shape[29][0] > shape[16][0] and shape[30][0] > shape[16][0] and \
+                     shape[29][0] > shape[15][0] and shape[30][0] > shape[15][0]
+
+        if nose_left or nose_right:
+            print('Filter image: ' + os.path.basename(filename))
+            os.makedirs('../filtered/', exist_ok=True)
+            copyfile(path, './filtered/' + str(mouth_mar) + '_' + os.path.basename(filename))
 
 
+dataset_index = MetadataIndex.from_folder('./mouth_state')
 print('Filter closed')
-filter_out('./mouth_state/closed')
+filter_out(dataset_index.closed())
 print('Filter opened')
-filter_out('./mouth_state/opened')
+filter_out(dataset_index.opened())
 
 # print('Scan closed eyes')
-# scan_folder('./mouth_state/closed')
+# scan_folder(dataset_index.closed())
 # print('Scan opened eyes')
-# scan_folder('./mouth_state/opened')
+# scan_folder(dataset_index.opened())
@@ -5,6 +5,7 @@ import dlib
 from imutils import face_utils
 
 from yawn_train.src import download_utils, inference_utils, detect_utils
+from yawn_train.src.model_registry import LANDMARKS_DLIB_68, LANDMARKS_DLIB_MOUTH, DLIB_MOUTH_PREDICTOR_FILE
 
 (mStart, mEnd) = face_utils.FACIAL_LANDMARKS_IDXS["mouth"]
 
@@ -18,8 +19,13 @@ tddfa = TDDFA_ONNX.TDDFA_ONNX()
 
 TEMP_FOLDER = "./temp"
 DETECT_FACE = False
-dlib_landmarks_file = download_utils.download_and_unpack_dlib_68_landmarks(TEMP_FOLDER)
-# dlib predictor for 68pts
+# LANDMARKS_DLIB_MOUTH: 20 mouth points of train_mouth_predictor.py
+DLIB_LANDMARKS = LANDMARKS_DLIB_68
+if DLIB_LANDMARKS == LANDMARKS_DLIB_MOUTH:
+    dlib_landmarks_file = os.path.join(TEMP_FOLDER, DLIB_MOUTH_PREDICTOR_FILE)
+else:
+    dlib_landmarks_file = download_utils.download_and_unpack_dlib_68_landmarks(TEMP_FOLDER)
+# dlib predictor for 68pts or mouth pts
 predictor = dlib.shape_predictor(dlib_landmarks_file)
 detector = dlib.get_frontal_face_detector()
 
@@ -50,18 +56,20 @@ if len(rects) > 0:
 
     # https://pyimagesearch.com/wp-content/uploads/2017/04/facial_landmarks_68markup.jpg
     shape = predictor(img, dlib_rect)  # dlib.rectangle(0, 0, width_frame, height_frame))
-    shape = face_utils.shape_to_np(shape)
+    shape = inference_utils.shape_to_points(shape)
 
     print(shape)
     print('Predictions size: ' + str(len(shape)))
 
-    mouth = shape[mStart:mEnd]
+    mouth = shape[mStart:mEnd] if len(shape) == 68 else shape
     mouth_mar = detect_utils.mouth_aspect_ratio(mouth)
     print(mouth_mar)
 
     img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
     cnt = 0
     (mStart, mEnd) = face_utils.FACIAL_LANDMARKS_IDXS["mouth"]  # right_eye
+    if len(shape) != 68:
+        cnt = mStart  # mouth points numbered as in the 68 points model
     for (x, y) in shape:
         cnt = cnt + 1
         if mStart < cnt <= mEnd:
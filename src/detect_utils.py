@@ -1,19 +1,33 @@
 import cv2
-from scipy.spatial import distance as dist
+import numpy as np
+
+# mouth points inside the 68 points face model
+MOUTH_START, MOUTH_END = 48, 68
 
 
 def mouth_aspect_ratio(mouth) -> float:
+    return float(mouth_aspect_ratios(np.asarray(mouth)[np.newaxis])[0])
+
+
+def mouth_aspect_ratios(landmarks) -> np.ndarray:
+    """
+    Mouth aspect ratio of N faces in one call.
+    landmarks: (N, 68, 2) face points, (N, 20, 2) mouth points or (N, 12, 2) outer lips points, extra z is ignored
+    """
+    landmarks = np.asarray(landmarks, dtype=np.float64)
+    if landmarks.shape[1] == 68:
+        landmarks = landmarks[:, MOUTH_START:MOUTH_END]
+    mouth = landmarks[:, :, :2]
     # compute the euclidean distances between the two sets of
     # vertical mouth landmarks (x, y)-coordinates
-    A = dist.euclidean(mouth[2], mouth[10])  # 51, 59
-    B = dist.euclidean(mouth[4], mouth[8])  # 53, 57
+    A = np.linalg.norm(mouth[:, 2] - mouth[:, 10], axis=1)  # 51, 59
+    B = np.linalg.norm(mouth[:, 4] - mouth[:, 8], axis=1)  # 53, 57
 
     # compute the euclidean distance between the horizontal
     # mouth landmark (x, y)-coordinates
-    C = dist.euclidean(mouth[0], mouth[6])  # 49, 55
+    C = np.linalg.norm(mouth[:, 0] - mouth[:, 6], axis=1)  # 49, 55
     # compute the mouth aspect ratio
-    mar = (A + B) / (2.0 * C)
-    return mar
+    return (A + B) / (2.0 * C)
 
 
 def resize_img(frame_crop, max_width, max_height):
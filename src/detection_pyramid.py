@@ -0,0 +1,74 @@
+import time
+
+import cv2
+
+
+class ScaleStats(object):
+
+    def __init__(self, scale: float):
+        self.scale = scale
+        self.calls = 0
+        self.found = 0
+        self.seconds = 0.0
+
+    def detections_per_second(self) -> float:
+        if self.seconds == 0:
+            return 0.0
+        return self.calls / self.seconds
+
+    def __str__(self):
+        hit_rate = self.found / self.calls if self.calls > 0 else 0.0
+        return f'scale {self.scale}: {self.calls} calls' \
+               f', found {self.found} ({hit_rate * 100:.1f}%)' \
+               f', {self.detections_per_second():.1f} detections/s'
+
+
+def scale_image(image, scale: float):
+    if scale == 1.0:
+        return image
+    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation)
+
+
+def scale_boxes(face_list, scale: float, width: int, height: int) -> list:
+    # boxes of the scaled image to coordinates of the original image
+    boxes = []
+    for (start_x, start_y, end_x, end_y) in face_list:
+        boxes.append((max(int(start_x / scale), 0), max(int(start_y / scale), 0),
+                      min(int(end_x / scale), width), min(int(end_y / scale), height)))
+    return boxes
+
+
+class PyramidDetector(object):
+    """
+    Runs a face detector on a downscaled image first.
+    Next scales of the pyramid run only if no face is found, e.g. (0.5, 1.0, 2.0).
+    Boxes are returned in coordinates of the original image.
+    """
+
+    def __init__(self, name: str, detect_fn, scales: tuple = (1.0,)):
+        self.name = name
+        self.detect_fn = detect_fn  # function(image) -> list of (start_x, start_y, end_x, end_y)
+        self.scales = scales
+        self.stats = [ScaleStats(scale) for scale in scales]
+
+    def reset_stats(self):
+        self.stats = [ScaleStats(scale) for scale in self.scales]
+
+    def detect(self, image) -> list:
+        height, width = image.shape[:2]
+        for scale, scale_stats in zip(self.scales, self.stats):
+            start_time = time.perf_counter()
+            face_list = self.detect_fn(scale_image(image, scale))
+            scale_stats.seconds = scale_stats.seconds + time.perf_counter() - start_time
+            scale_stats.calls = scale_stats.calls + 1
+            if len(face_list) > 0:
+                scale_stats.found = scale_stats.found + 1
+                return scale_boxes(face_list, scale, width, height)
+        return []
+
+    def __call__(self, image) -> list:
+        return self.detect(image)
+
+    def __str__(self):
+        return '\n'.join(f'{self.name} {scale_stats}' for scale_stats in self.stats)
@@ -8,6 +8,7 @@ DLIB_LANDMARKS = 'https://github.com/davisking/dlib-models/raw/master/shape_pred
 CAFFE_RES10_WEIGHTS = 'https://github.com/nhatthai/opencv-face-recognition/raw/master/src/face_detection_model/weights.caffemodel'
 CAFFE_RES10_CONFIG = 'https://github.com/nhatthai/opencv-face-recognition/raw/master/src/face_detection_model/deploy.prototxt'
 BLAZEFACE_URL = 'https://raw.githubusercontent.com/gouthamvgk/facemesh_coreml_tf/master/keras_models/blazeface_tf.h5'
+FACEMESH_URL = 'https://raw.githubusercontent.com/gouthamvgk/facemesh_coreml_tf/master/keras_models/facemesh_tf.h5'
 
 
 def download(url, file_name) -> str:
@@ -31,6 +32,17 @@ def download_blazeface(folder) -> str:
     return file1
 
 
+def download_facemesh(folder) -> str:
+    print('Downloading facemesh file...')
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    model_path = os.path.join(folder, "facemesh_tf.h5")
+    if os.path.isfile(model_path):  # already exists
+        file1 = model_path
+    else:
+        file1 = download(FACEMESH_URL, model_path)
+    return file1
+
+
 def download_caffe(folder) -> (str, str):
     print('Downloading caffe files...')
     Path(folder).mkdir(parents=True, exist_ok=True)
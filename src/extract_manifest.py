@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+
+STATUS_STARTED = 'started'
+STATUS_DONE = 'done'
+
+
+def settings_hash(settings: dict) -> str:
+    settings_str = json.dumps(settings, sort_keys=True)
+    return hashlib.sha1(settings_str.encode('utf-8')).hexdigest()
+
+
+def file_fingerprint(file_path: str) -> dict:
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+class ExtractionManifest(object):
+    """
+    Persistent record of extracted videos, keyed by video path.
+    A video is finished only if its size, mtime and extraction settings are unchanged.
+    """
+
+    def __init__(self, manifest_path: str, settings: dict):
+        self.manifest_path = manifest_path
+        self.settings = settings
+        self.settings_hash = settings_hash(settings)
+        self.videos = {}
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as f:
+                self.videos = json.load(f).get('videos', {})
+
+    def get_video_id(self, video_path: str) -> int:
+        # keep ids of known videos stable, so images of a video can be found again
+        entry = self.videos.get(video_path)
+        if entry is not None:
+            return entry['video_id']
+        return max([entry['video_id'] for entry in self.videos.values()], default=0) + 1
+
+    def is_known(self, video_path: str) -> bool:
+        return video_path in self.videos
+
+    def is_done(self, video_path: str) -> bool:
+        entry = self.videos.get(video_path)
+        if entry is None or entry['status'] != STATUS_DONE:
+            return False
+        return entry['settings_hash'] == self.settings_hash and \
+               entry['fingerprint'] == file_fingerprint(video_path)
+
+    def get_result(self, video_path: str) -> dict:
+        return self.videos[video_path]['result']
+
+    def mark_started(self, video_path: str, video_id: int):
+        self.videos[video_path] = {
+            'video_id': video_id,
+            'status': STATUS_STARTED,
+            'settings_hash': self.settings_hash,
+            'fingerprint': file_fingerprint(video_path),
+            'result': None
+        }
+
+    def mark_done(self, video_path: str, result: dict):
+        entry = self.videos[video_path]
+        entry['status'] = STATUS_DONE
+        entry['result'] = result
+
+    def save(self):
+        # write to temp file first, the manifest is never left half-written
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'settings': self.settings, 'videos': self.videos}, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
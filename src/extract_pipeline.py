@@ -0,0 +1,175 @@
+import queue
+import threading
+import time
+
+STAGE_QUEUE_SIZE = 8
+
+# end of stream marker, passed from stage to stage
+_END = object()
+
+
+class StageStats(object):
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        self.depth_sum = 0
+        self.depth_samples = 0
+        self.max_depth = 0
+        self._lock = threading.Lock()
+
+    def observe(self, queue_depth, busy_seconds: float, items_out: int):
+        # queue_depth is None for a source without input queue
+        with self._lock:
+            self.items_in = self.items_in + 1
+            self.items_out = self.items_out + items_out
+            self.busy_seconds = self.busy_seconds + busy_seconds
+            if queue_depth is not None:
+                self.depth_sum = self.depth_sum + queue_depth
+                self.depth_samples = self.depth_samples + 1
+                self.max_depth = max(self.max_depth, queue_depth)
+
+    def add_output(self, items_out: int):
+        # items emitted without input, e.g. a flushed batch
+        with self._lock:
+            self.items_out = self.items_out + items_out
+
+    def throughput(self) -> float:
+        # items per second of work, excluding time waiting for input
+        if self.busy_seconds == 0:
+            return 0.0
+        return self.items_in / self.busy_seconds
+
+    def avg_depth(self) -> float:
+        if self.depth_samples == 0:
+            return 0.0
+        return self.depth_sum / self.depth_samples
+
+    def __str__(self):
+        stats_str = f'{self.name}: items {self.items_in} -> {self.items_out}' \
+                    f', busy {self.busy_seconds:.1f}s' \
+                    f', {self.throughput():.1f} items/s'
+        if self.depth_samples > 0:
+            stats_str = stats_str + f', input queue avg {self.avg_depth():.1f}, max {self.max_depth}'
+        return stats_str
+
+
+class PipelineStage(object):
+    """
+    Consumes items of a bounded input queue with one or more threads.
+    fn(item) returns a list of items for the next stage, flush_fn() returns the last items at end of input,
+    e.g. a partially filled batch. fn is called from a single thread unless threads > 1.
+    """
+
+    def __init__(self, name: str, fn, threads: int = 1, queue_size: int = STAGE_QUEUE_SIZE, flush_fn=None):
+        self.name = name
+        self.fn = fn
+        self.flush_fn = flush_fn
+        self.threads = threads
+        self.input_queue = queue.Queue(maxsize=queue_size)
+        self.next_stage = None
+        self.stats = StageStats(name)
+        self.error = None
+        self._running_threads = threads
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        self.input_queue.put(item)
+
+    def _emit(self, items: list):
+        if self.next_stage is not None:
+            for item in items:
+                self.next_stage.put(item)
+
+    def _run(self):
+        while True:
+            queue_depth = self.input_queue.qsize()
+            item = self.input_queue.get()
+            if item is _END:
+                self.input_queue.put(_END)  # let sibling threads stop too
+                break
+            if self.error is not None:
+                continue  # keep draining, so upstream stages are not blocked
+            start_time = time.perf_counter()
+            try:
+                output_items = self.fn(item)
+            except Exception as e:
+                self.error = e
+                continue
+            self.stats.observe(queue_depth, time.perf_counter() - start_time, len(output_items))
+            self._emit(output_items)
+
+        with self._lock:
+            self._running_threads = self._running_threads - 1
+            is_last_thread = self._running_threads == 0
+        if not is_last_thread:
+            return
+        if self.flush_fn is not None and self.error is None:
+            try:
+                output_items = self.flush_fn()
+                self.stats.add_output(len(output_items))
+                self._emit(output_items)
+            except Exception as e:
+                self.error = e
+        if self.next_stage is not None:
+            self.next_stage.put(_END)
+
+    def start(self) -> list:
+        workers = [threading.Thread(target=self._run, name=f'{self.name}-{i}', daemon=True)
+                   for i in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        return workers
+
+
+class ExtractionPipeline(object):
+    """
+    Source function runs in its own thread (e.g. video decoding) and feeds the chain of stages
+    through bounded queues, so decoding, detection, labeling and encoding overlap.
+    Models of a stage are used by the stage threads only.
+    """
+
+    def __init__(self, source_fn, stages: list, source_name: str = 'decode'):
+        self.source_fn = source_fn  # function() -> next item, None at the end
+        self.stages = stages
+        self.source_stats = StageStats(source_name)
+        self.source_error = None
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+
+    def _is_failed(self) -> bool:
+        return any(stage.error is not None for stage in self.stages)
+
+    def _run_source(self):
+        first_stage = self.stages[0]
+        try:
+            while not self._is_failed():
+                start_time = time.perf_counter()
+                item = self.source_fn()
+                if item is None:
+                    break
+                self.source_stats.observe(None, time.perf_counter() - start_time, 1)
+                first_stage.put(item)
+        except Exception as e:
+            self.source_error = e
+        first_stage.put(_END)
+
+    def run(self):
+        workers = [threading.Thread(target=self._run_source, name=self.source_stats.name, daemon=True)]
+        workers[0].start()
+        for stage in self.stages:
+            workers.extend(stage.start())
+        for worker in workers:
+            worker.join()
+        for error in [self.source_error] + [stage.error for stage in self.stages]:
+            if error is not None:
+                raise error
+
+    def stats(self) -> list:
+        return [self.source_stats] + [stage.stats for stage in self.stages]
+
+    def print_stats(self):
+        for stage_stats in self.stats():
+            print(stage_stats)
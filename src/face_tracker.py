@@ -0,0 +1,178 @@
+import cv2
+
+# template is matched at this width, enough to follow a face and cheap to match
+TRACK_TEMPLATE_WIDTH = 48
+# how the box of the last update was found
+UPDATE_KEYFRAME = 'keyframe'
+UPDATE_ROI = 'roi'
+UPDATE_PROPAGATED = 'propagated'
+
+
+class TrackerStats(object):
+
+    def __init__(self):
+        self.frames = 0
+        self.full_detections = 0
+        self.roi_detections = 0
+        self.propagated = 0
+        self.lost = 0
+
+    def detector_savings(self) -> float:
+        # share of frames, which did not run a full frame detection
+        if self.frames == 0:
+            return 0.0
+        return 1.0 - self.full_detections / self.frames
+
+    def __str__(self):
+        return f'Tracked frames: {self.frames}' \
+               f', full detections: {self.full_detections}' \
+               f', roi detections: {self.roi_detections}' \
+               f', propagated: {self.propagated}' \
+               f', lost: {self.lost}' \
+               f', detector savings: {self.detector_savings() * 100:.1f}%'
+
+
+def enlarge_box(box, scale: float, width: int, height: int) -> tuple:
+    (start_x, start_y, end_x, end_y) = box
+    box_w = end_x - start_x
+    box_h = end_y - start_y
+    pad_x = int(box_w * (scale - 1.0) / 2)
+    pad_y = int(box_h * (scale - 1.0) / 2)
+    return max(start_x - pad_x, 0), max(start_y - pad_y, 0), min(end_x + pad_x, width), min(end_y + pad_y, height)
+
+
+def roi_to_frame(box, roi) -> tuple:
+    # box found inside roi to frame coordinates
+    (start_x, start_y, end_x, end_y) = box
+    return start_x + roi[0], start_y + roi[1], end_x + roi[0], end_y + roi[1]
+
+
+def detect_in_roi(detect_fn, frame, box, roi_scale: float, roi: tuple = None):
+    """
+    Run detect_fn only inside box enlarged by roi_scale, or inside roi if given,
+    return the first face in frame coordinates or None
+    """
+    if roi is None:
+        height, width = frame.shape[:2]
+        roi = enlarge_box(box, roi_scale, width, height)
+    (roi_x, roi_y, roi_end_x, roi_end_y) = roi
+    if roi_x >= roi_end_x or roi_y >= roi_end_y:
+        return None
+    face_list = detect_fn(frame[roi_y:roi_end_y, roi_x:roi_end_x])
+    if len(face_list) == 0:
+        return None
+    return roi_to_frame(face_list[0], roi)
+
+
+class FaceTracker(object):
+    """
+    Runs a full frame face detector only on keyframes: every keyframe_interval frames or when the face is lost.
+    In between, the last face is propagated with template matching,
+    or detected again only inside an enlarged region around the previous box.
+    """
+
+    def __init__(self, detect_fn, keyframe_interval: int = 10, roi_scale: float = 2.0,
+                 min_track_score: float = 0.7, propagate: bool = True):
+        self.detect_fn = detect_fn  # function(image) -> list of (start_x, start_y, end_x, end_y)
+        self.keyframe_interval = keyframe_interval
+        self.roi_scale = roi_scale
+        self.min_track_score = min_track_score
+        self.propagate = propagate
+        self.stats = TrackerStats()
+        self.last_box = None
+        self.template = None
+        self.template_scale = 1.0
+        self.frames_since_keyframe = 0
+        self.last_update = None  # UPDATE_KEYFRAME, UPDATE_ROI or UPDATE_PROPAGATED
+        self.roi = None  # enlarged box of the last roi detection
+
+    def reset(self):
+        self.last_box = None
+        self.template = None
+        self.frames_since_keyframe = 0
+
+    def is_keyframe_due(self) -> bool:
+        # next update runs a full frame detection, unless the face is lost in between
+        return self.last_box is None or self.frames_since_keyframe + 1 >= self.keyframe_interval
+
+    def update(self, frame, gray_frame=None, detect_full=None) -> list:
+        """
+        Return face boxes of the frame. detect_full overrides the full frame detection, e.g. to reuse cached results
+        """
+        self.stats.frames = self.stats.frames + 1
+        if self.is_keyframe_due():
+            return self._detect_keyframe(frame, gray_frame, detect_full)
+
+        if gray_frame is None and self.propagate:
+            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if len(frame.shape) == 3 else frame
+
+        if self.propagate:
+            box, score = self._match_template(gray_frame)
+            if box is not None and score >= self.min_track_score:
+                self.stats.propagated = self.stats.propagated + 1
+                self.frames_since_keyframe = self.frames_since_keyframe + 1
+                self.last_box = box
+                self.last_update = UPDATE_PROPAGATED
+                return [box]
+
+        box = self._detect_roi(frame)
+        if box is not None:
+            self.stats.roi_detections = self.stats.roi_detections + 1
+            self.frames_since_keyframe = self.frames_since_keyframe + 1
+            self._set_box(box, gray_frame)
+            self.last_update = UPDATE_ROI
+            return [box]
+
+        # tracking confidence dropped, detect on the full frame
+        self.stats.lost = self.stats.lost + 1
+        return self._detect_keyframe(frame, gray_frame, detect_full)
+
+    def _detect_keyframe(self, frame, gray_frame, detect_full) -> list:
+        self.stats.full_detections = self.stats.full_detections + 1
+        self.frames_since_keyframe = 0
+        self.last_update = UPDATE_KEYFRAME
+        face_list = detect_full() if detect_full is not None else self.detect_fn(frame)
+        if len(face_list) == 0:
+            self.reset()
+            return face_list
+        if gray_frame is None and self.propagate:
+            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if len(frame.shape) == 3 else frame
+        self._set_box(face_list[0], gray_frame)
+        return face_list
+
+    def _set_box(self, box, gray_frame):
+        self.last_box = box
+        self.template = None
+        if not self.propagate:
+            return
+        (start_x, start_y, end_x, end_y) = box
+        start_x = max(start_x, 0)
+        start_y = max(start_y, 0)
+        face_crop = gray_frame[start_y:end_y, start_x:end_x]
+        if face_crop.shape[0] < 2 or face_crop.shape[1] < 2:
+            return
+        self.template_scale = min(1.0, TRACK_TEMPLATE_WIDTH / float(face_crop.shape[1]))
+        self.template = cv2.resize(face_crop, None, fx=self.template_scale, fy=self.template_scale,
+                                   interpolation=cv2.INTER_AREA)
+
+    def _match_template(self, gray_frame) -> tuple:
+        if self.template is None:
+            return None, 0.0
+        height, width = gray_frame.shape[:2]
+        (roi_x, roi_y, roi_end_x, roi_end_y) = enlarge_box(self.last_box, self.roi_scale, width, height)
+        search_img = cv2.resize(gray_frame[roi_y:roi_end_y, roi_x:roi_end_x], None,
+                                fx=self.template_scale, fy=self.template_scale, interpolation=cv2.INTER_AREA)
+        tmpl_h, tmpl_w = self.template.shape[:2]
+        if search_img.shape[0] < tmpl_h or search_img.shape[1] < tmpl_w:
+            return None, 0.0
+        result = cv2.matchTemplate(search_img, self.template, cv2.TM_CCOEFF_NORMED)
+        _, max_score, _, max_loc = cv2.minMaxLoc(result)
+        (start_x, start_y, end_x, end_y) = self.last_box
+        new_x = roi_x + int(max_loc[0] / self.template_scale)
+        new_y = roi_y + int(max_loc[1] / self.template_scale)
+        return (new_x, new_y, new_x + end_x - start_x, new_y + end_y - start_y), max_score
+
+    def _detect_roi(self, frame):
+        height, width = frame.shape[:2]
+        self.roi = enlarge_box(self.last_box, self.roi_scale, width, height)
+        return detect_in_roi(self.detect_fn, frame, self.last_box, self.roi_scale, self.roi)
@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from yawn_train.src import detect_utils
+from yawn_train.src.blazeface_utils import get_landmarks_crop, process_landmarks
+
+FACEMESH_INPUT_SIZE = (192, 192)
+# face mesh points in the order of the 20 dlib mouth points 48..67: outer lips, then inner lips
+FACEMESH_MOUTH_POINTS = [61, 39, 37, 0, 267, 269, 291, 405, 314, 17, 84, 181,
+                         78, 82, 13, 312, 308, 317, 14, 87]
+# face roi is padded on every side by this part of its size, face mesh expects a margin around the face
+FACEMESH_ROI_PAD = 0.25
+
+
+class FaceMeshLabeler(object):
+    """
+    Computes lip landmarks and mouth aspect ratio with the 468 points face mesh in batches.
+    Faces are given as BlazeFace landmark proposals (center x, center y, width, height), or as face rois.
+    """
+
+    def __init__(self, facemesh_model, batch_size: int = 32):
+        self.facemesh_model = facemesh_model
+        self.batch_size = batch_size
+        self._predict = tf.function(
+            lambda input_tensor: facemesh_model(input_tensor, training=False),
+            input_signature=[tf.TensorSpec([None, FACEMESH_INPUT_SIZE[0], FACEMESH_INPUT_SIZE[1], 3], tf.float32)]
+        )
+
+    def _run_model(self, crops: np.ndarray) -> np.ndarray:
+        outputs = self._predict(tf.convert_to_tensor(crops))
+        if isinstance(outputs, (list, tuple)):  # landmarks and face confidence
+            outputs = outputs[0]
+        return np.reshape(outputs.numpy(), (len(crops), -1))
+
+    def get_landmarks(self, images: list, proposals: list) -> np.ndarray:
+        """
+        Return (N, 468, 2) landmarks in image coordinates, one proposal per image
+        """
+        if len(images) == 0:
+            return np.zeros((0, 468, 2), dtype=np.int32)
+        landmarks = []
+        for batch_start in range(0, len(images), self.batch_size):
+            batch_images = images[batch_start:batch_start + self.batch_size]
+            batch_proposals = np.array(proposals[batch_start:batch_start + self.batch_size])
+            crops = np.concatenate([
+                get_landmarks_crop(image, proposal[np.newaxis], FACEMESH_INPUT_SIZE)
+                for image, proposal in zip(batch_images, batch_proposals)
+            ])
+            landmarks_result = self._run_model(crops)
+            landmarks.append(process_landmarks(landmarks_result, batch_proposals, None, FACEMESH_INPUT_SIZE[0]))
+        return np.concatenate(landmarks)
+
+    def get_mouth_ratios(self, face_rois: list) -> np.ndarray:
+        # whole face roi is the face, as for FAN labeling
+        images = []
+        proposals = []
+        for face_roi in face_rois:
+            if face_roi.ndim == 2:
+                face_roi = cv2.cvtColor(face_roi, cv2.COLOR_GRAY2BGR)
+            height, width = face_roi.shape[:2]
+            pad_x = int(width * FACEMESH_ROI_PAD)
+            pad_y = int(height * FACEMESH_ROI_PAD)
+            image = cv2.copyMakeBorder(face_roi, pad_y, pad_y, pad_x, pad_x, cv2.BORDER_REPLICATE)
+            images.append(image)
+            proposals.append((image.shape[1] // 2, image.shape[0] // 2, image.shape[1], image.shape[0]))
+        landmarks = self.get_landmarks(images, proposals)
+        return detect_utils.mouth_aspect_ratios(landmarks[:, FACEMESH_MOUTH_POINTS])
@@ -0,0 +1,56 @@
+import numpy as np
+import torch
+from face_alignment.utils import crop, flip, get_preds_fromhm
+
+
+class BatchFanLandmarks(object):
+    """
+    Runs the FaceAlignment (FAN) landmark network over many face crops in batches,
+    instead of one get_landmarks_from_image call with batch size 1 per face.
+
+    Only x, y landmarks are returned: the depth network of the 3D model does not change them,
+    and the mouth aspect ratio uses x, y only.
+    """
+
+    def __init__(self, fa, batch_size: int = 32):
+        self.fa = fa
+        self.batch_size = batch_size
+
+    def _prepare_input(self, image, box) -> tuple:
+        if image.ndim == 2:  # FAN expects 3 channels, same as face_alignment.utils.get_image
+            image = np.stack([image] * 3, axis=-1)
+        (start_x, start_y, end_x, end_y) = box
+        center = torch.tensor([end_x - (end_x - start_x) / 2.0, end_y - (end_y - start_y) / 2.0])
+        center[1] = center[1] - (end_y - start_y) * 0.12
+        scale = (end_x - start_x + end_y - start_y) / self.fa.face_detector.reference_scale
+        return crop(image, center, scale), center, scale
+
+    @torch.no_grad()
+    def get_landmarks(self, images: list, boxes: list = None) -> np.ndarray:
+        """
+        Return (N, 68, 2) landmarks in image coordinates. Without boxes, the whole image is the face
+        """
+        if len(images) == 0:
+            return np.zeros((0, 68, 2), dtype=np.float32)
+        if boxes is None:
+            boxes = [(0, 0, image.shape[1], image.shape[0]) for image in images]
+
+        landmarks = []
+        for batch_start in range(0, len(images), self.batch_size):
+            batch_images = images[batch_start:batch_start + self.batch_size]
+            batch_boxes = boxes[batch_start:batch_start + self.batch_size]
+            inputs = [self._prepare_input(image, box) for image, box in zip(batch_images, batch_boxes)]
+
+            inp = torch.from_numpy(np.stack([item[0] for item in inputs]).transpose((0, 3, 1, 2))).float()
+            inp = inp.to(self.fa.device)
+            inp.div_(255.0)
+
+            out = self.fa.face_alignment_net(inp).detach()
+            if self.fa.flip_input:
+                out += flip(self.fa.face_alignment_net(flip(inp)).detach(), is_label=True)
+            out = out.cpu().numpy()
+
+            for i, (_, center, scale) in enumerate(inputs):
+                pts_img = get_preds_fromhm(out[i:i + 1], center.numpy(), scale)[1]
+                landmarks.append(np.reshape(pts_img, (68, 2)))
+        return np.array(landmarks, dtype=np.float32)
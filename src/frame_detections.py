@@ -0,0 +1,39 @@
+import cv2
+
+
+class FrameDetections(object):
+    """
+    Face detections of a single frame.
+    Detectors run lazily on first request and at most once per frame, gray frame is converted once.
+    """
+
+    def __init__(self, frame, detectors: dict):
+        self.frame = frame
+        self.detectors = detectors  # detector type -> function(FrameDetections) -> list of boxes
+        self.boxes = {}  # detector type -> list of boxes, only for detectors which ran
+        self._gray_frame = None
+
+    @property
+    def gray(self):
+        if self._gray_frame is None:
+            if len(self.frame.shape) == 2:  # single channel
+                self._gray_frame = self.frame
+            else:
+                self._gray_frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+        return self._gray_frame
+
+    def has_run(self, detector_type) -> bool:
+        return detector_type in self.boxes
+
+    def detect(self, detector_type) -> list:
+        if detector_type not in self.boxes:
+            self.boxes[detector_type] = self.detectors[detector_type](self)
+        return self.boxes[detector_type]
+
+    def detect_first(self, detector_types) -> tuple:
+        # cascade: stop at first detector, which finds a face
+        for detector_type in detector_types:
+            face_list = self.detect(detector_type)
+            if len(face_list) > 0:
+                return face_list, detector_type
+        return [], None
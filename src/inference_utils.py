@@ -3,6 +3,8 @@ import datetime
 import cv2
 import numpy as np
 
+from yawn_train.src import detect_utils
+
 
 def prepare_image(image_frame, image_size):
     image_frame = cv2.resize(image_frame, image_size, cv2.INTER_AREA)
@@ -14,11 +16,26 @@ def get_timestamp_ms():
     return int((datetime.datetime.utcnow() - datetime.datetime(1970, 1, 1)).total_seconds() * 1000)
 
 
-def detect_face_dlib(detector, gray_img) -> list:
-    # detect faces in the grayscale image
-    rects = detector(gray_img, 1)
+def detect_face_dlib(detector, gray_img, upsample: int = 1) -> list:
+    # detect faces in the grayscale image, every upsample doubles the image size and finds smaller faces
+    rects = detector(gray_img, upsample)
     rect_list = []
     # loop over the face detections
     for (i, rect) in enumerate(rects):
         rect_list.append((rect.left(), rect.top(), rect.right(), rect.bottom()))
     return rect_list
+
+
+def shape_to_points(shape) -> np.ndarray:
+    # any number of parts, face_utils.shape_to_np expects the 68 points model
+    return np.array([(shape.part(i).x, shape.part(i).y) for i in range(shape.num_parts)], dtype=np.int32)
+
+
+def predict_mouth_points(predictor, img, dlib_rect) -> np.ndarray:
+    """
+    Return (20, 2) mouth points of the 68 points predictor or of the mouth-only predictor
+    """
+    points = shape_to_points(predictor(img, dlib_rect))
+    if len(points) == 68:
+        points = points[detect_utils.MOUTH_START:detect_utils.MOUTH_END]
+    return points
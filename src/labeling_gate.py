@@ -0,0 +1,45 @@
+class LabelingGate(object):
+    """
+    Runs the expensive labeler only when the cheap mouth ratio is close to the threshold.
+    Every audit_interval-th frame outside the band is labeled by both, to measure how labels
+    differ from running the expensive labeler on every frame; 0 disables the audit.
+    """
+
+    def __init__(self, threshold: float, band: float, audit_interval: int = 0):
+        self.threshold = threshold
+        self.band = band
+        self.audit_interval = audit_interval
+        self.frames = 0
+        self.gate_fired = 0
+        self.audited = 0
+        self.audit_differences = 0
+        self.skipped_counter = 0
+
+    def is_uncertain(self, mouth_ratio: float) -> bool:
+        return abs(mouth_ratio - self.threshold) <= self.band
+
+    def needs_expensive(self, mouth_ratio: float) -> tuple:
+        """
+        Return (run expensive labeler, is audit) for the cheap mouth ratio of a frame
+        """
+        self.frames = self.frames + 1
+        if self.is_uncertain(mouth_ratio):
+            self.gate_fired = self.gate_fired + 1
+            return True, False
+        self.skipped_counter = self.skipped_counter + 1
+        if self.audit_interval > 0 and self.skipped_counter % self.audit_interval == 0:
+            return True, True
+        return False, False
+
+    def record_audit(self, is_same_label: bool):
+        self.audited = self.audited + 1
+        if not is_same_label:
+            self.audit_differences = self.audit_differences + 1
+
+    def __str__(self):
+        fired_rate = self.gate_fired / self.frames if self.frames > 0 else 0.0
+        gate_str = f'Gate frames: {self.frames}, fired: {self.gate_fired} ({fired_rate * 100:.1f}%)'
+        if self.audited > 0:
+            gate_str = gate_str + f', audited: {self.audited}' \
+                                  f', labels differ: {self.audit_differences / self.audited * 100:.1f}%'
+        return gate_str
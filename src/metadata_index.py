@@ -0,0 +1,184 @@
+import glob
+import os
+
+import numpy as np
+
+METADATA_INDEX_FILE = 'metadata_index.npz'
+VIDEO_INDEX_FOLDER = 'index'
+VIDEO_INDEX_FILE = 'index_{}.npz'
+CLASS_FOLDERS = ('closed', 'opened')
+# modification times of the class folders at merge time, stored next to the columns of the metadata index
+FOLDER_MTIMES_KEY = 'folder_mtimes'
+# columns of every index: per-video index, shard sidecar and consolidated metadata index.
+# detector: rotation turn of the output crop, box_source: detector of the rect landmarks ran in, or 'tracked'
+INDEX_FIELDS = ('label', 'mar', 'video_id', 'frame_id', 'detector', 'landmark', 'counter', 'box_source')
+INDEX_DTYPES = {
+    'label': np.uint8,
+    'mar': np.float32,
+    'video_id': np.int32,
+    'frame_id': np.int32,
+    'counter': np.int32
+}
+
+
+def save_atomic(path: str, save_fn):
+    # readers never see half-written files
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        save_fn(f)
+    os.replace(tmp_path, path)
+
+
+def to_columns(records: list, fields: tuple = INDEX_FIELDS) -> dict:
+    # list of row tuples -> one array per field
+    columns = zip(*records) if len(records) > 0 else [[]] * len(fields)
+    return {field: np.array(column, dtype=INDEX_DTYPES.get(field, str)) for field, column in zip(fields, columns)}
+
+
+def save_index(path: str, columns: dict):
+    save_atomic(path, lambda f: np.savez(f, **columns))
+
+
+def load_index(path: str) -> dict:
+    with np.load(path) as index:
+        return {field: index[field] for field in index.files}
+
+
+def concat_columns(column_parts: list) -> dict:
+    if len(column_parts) == 0:
+        return to_columns([])
+    return {field: np.concatenate([columns[field] for columns in column_parts]) for field in column_parts[0]}
+
+
+class VideoIndexWriter(object):
+    """
+    Collects index rows of one video, written as {folder}/index/index_{name}.npz on close
+    """
+
+    def __init__(self, folder: str, name: str):
+        self.index_path = os.path.join(folder, VIDEO_INDEX_FOLDER, VIDEO_INDEX_FILE.format(name))
+        self.records = []
+
+    def add(self, path: str, is_opened: bool, mar: float, video_id: int, frame_id: int, detector: str,
+            landmark: str, read_counter: int, box_source: str):
+        self.records.append((path, int(is_opened), mar, video_id, frame_id, detector, landmark, read_counter,
+                             box_source))
+
+    def close(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        save_index(self.index_path, to_columns(self.records, ('path',) + INDEX_FIELDS))
+
+
+def remove_video_indices(folder: str, names: set) -> int:
+    removed_counter = 0
+    for name in names:
+        index_path = os.path.join(folder, VIDEO_INDEX_FOLDER, VIDEO_INDEX_FILE.format(name))
+        if os.path.exists(index_path):
+            os.remove(index_path)
+            removed_counter = removed_counter + 1
+    return removed_counter
+
+
+def merge_video_indices(folder: str) -> int:
+    """
+    Consolidate per-video indices of the folder into a single metadata index, return number of rows
+    """
+    index_paths = sorted(glob.glob(os.path.join(folder, VIDEO_INDEX_FOLDER, VIDEO_INDEX_FILE.format('*'))))
+    columns = concat_columns([load_index(index_path) for index_path in index_paths])
+    if 'path' not in columns:
+        columns['path'] = np.array([], dtype=str)
+    save_index(os.path.join(folder, METADATA_INDEX_FILE), dict(columns, **{FOLDER_MTIMES_KEY: folder_mtimes(folder)}))
+    return len(columns['label'])
+
+
+def folder_mtimes(folder: str) -> np.ndarray:
+    # a class folder changes its mtime when images are added, removed or renamed in it
+    return np.array([os.stat(os.path.join(folder, class_name)).st_mtime_ns
+                     if os.path.isdir(os.path.join(folder, class_name)) else 0
+                     for class_name in CLASS_FOLDERS], dtype=np.int64)
+
+
+def parse_image_name(rel_path: str) -> tuple:
+    """
+    Fallback for folders without index, image name: {counter}_{mar}_{video_id}_{frame_id}_{detector}_{landmarks}.jpg,
+    box source is not in the name
+    """
+    label = 1 if os.path.basename(os.path.dirname(rel_path)) == 'opened' else 0
+    name_parts = os.path.splitext(os.path.basename(rel_path))[0].split('_')
+    if len(name_parts) < 6:
+        return rel_path, label, float(label), -1, -1, '', '', -1, ''
+    try:
+        return rel_path, label, float(name_parts[1]), int(name_parts[2]), int(name_parts[3]), name_parts[4], \
+               name_parts[5], int(name_parts[0]), ''
+    except ValueError:
+        return rel_path, label, float(label), -1, -1, '', '', -1, ''
+
+
+def list_images(folder: str) -> list:
+    # image paths relative to the folder, as stored in the index
+    rel_paths = []
+    for class_name in CLASS_FOLDERS:
+        class_folder = os.path.join(folder, class_name)
+        if not os.path.isdir(class_folder):
+            continue
+        for file_name in sorted(os.listdir(class_folder)):
+            if not file_name.startswith('.'):
+                rel_paths.append(os.path.join(class_name, file_name))
+    return rel_paths
+
+
+class MetadataIndex(object):
+    """
+    Columnar index of extracted mouth images, one array per field.
+    Histograms and filters are array operations, e.g. index.select(index['mar'] > 0.5)
+    """
+
+    def __init__(self, columns: dict, folder: str = ''):
+        self.columns = columns
+        self.folder = folder
+
+    @classmethod
+    def from_folder(cls, folder: str, validate: bool = False):
+        """
+        Index is stale when images were added, removed or moved by hand after the extraction:
+        checked by class folder mtimes, or by comparing every path with the folder listing if validate
+        """
+        index_path = os.path.join(folder, METADATA_INDEX_FILE)
+        if os.path.exists(index_path):
+            columns = load_index(index_path)
+            mtimes = columns.pop(FOLDER_MTIMES_KEY, None)
+            if validate:
+                is_valid = 'path' in columns and set(columns['path']) == set(list_images(folder))
+            else:
+                is_valid = mtimes is not None and np.array_equal(mtimes, folder_mtimes(folder))
+            if is_valid:
+                return cls(columns, folder)
+            print(f'Metadata index does not match images of {folder}, rebuild it from file names')
+        # dataset extracted without index, fields are parsed from file names once
+        records = [parse_image_name(rel_path) for rel_path in list_images(folder)]
+        return cls(to_columns(records, ('path',) + INDEX_FIELDS), folder)
+
+    def __len__(self):
+        return len(self.columns['label'])
+
+    def __getitem__(self, field) -> np.ndarray:
+        return self.columns[field]
+
+    def select(self, mask):
+        return MetadataIndex({field: column[mask] for field, column in self.columns.items()}, self.folder)
+
+    def from_box_source(self, box_source: str):
+        # images whose landmarks ran in a box of this detector, older indices do not record it
+        if 'box_source' not in self.columns or not np.any(self.columns['box_source'] != ''):
+            raise Exception(f"Index of {self.folder} has no box source, extract the videos again")
+        return self.select(self.columns['box_source'] == box_source)
+
+    def opened(self):
+        return self.select(self.columns['label'] == 1)
+
+    def closed(self):
+        return self.select(self.columns['label'] == 0)
+
+    @property
+    def paths(self) -> list:
+        return [os.path.join(self.folder, rel_path) for rel_path in self.columns['path']]
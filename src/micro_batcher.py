@@ -0,0 +1,129 @@
+import collections
+import threading
+import time
+
+MAX_BATCH_SIZE = 32
+MAX_WAIT_US = 5000
+
+
+class BatchFuture(object):
+    """
+    Result of one crop request, the crop travels with its request
+    """
+
+    def __init__(self, crop, tag=None):
+        self.crop = crop
+        self.tag = tag  # caller data, e.g. frame id
+        self.submit_time = time.perf_counter()
+        self.done_time = None
+        self._event = threading.Event()
+        self._result = None
+        self._error = None
+
+    def set_result(self, result):
+        self._result = result
+        self.done_time = time.perf_counter()
+        self._event.set()
+
+    def set_error(self, error: BaseException):
+        self._error = error
+        self.done_time = time.perf_counter()
+        self._event.set()
+
+    def done(self) -> bool:
+        return self._event.is_set()
+
+    def result(self, timeout: float = None):
+        if not self._event.wait(timeout):
+            raise TimeoutError("Batch result not ready")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def latency_ms(self) -> float:
+        return (self.done_time - self.submit_time) * 1000 if self.done_time is not None else 0.0
+
+
+class MicroBatcher(object):
+    """
+    Collects crops from any number of producer threads and classifies them in a background thread.
+    A batch is flushed when it has max_batch_size crops or when its oldest crop waited max_wait_us
+    """
+
+    def __init__(self, predict_batch_fn, max_batch_size: int = MAX_BATCH_SIZE, max_wait_us: int = MAX_WAIT_US):
+        self.predict_batch_fn = predict_batch_fn  # function(list of crops) -> one result per crop
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_us / 1000000
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self.batches = 0
+        self.items = 0
+        self.full_flushes = 0
+        self.wait_seconds = 0.0  # oldest crop of a batch, submit to flush
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, crop, tag=None) -> BatchFuture:
+        future = BatchFuture(crop, tag)
+        with self._condition:
+            if self._stopped:
+                raise Exception("Batcher closed")
+            self._queue.append(future)
+            if len(self._queue) == 1 or len(self._queue) >= self.max_batch_size:
+                self._condition.notify()
+        return future
+
+    def _next_batch(self) -> list:
+        with self._condition:
+            while len(self._queue) == 0 and not self._stopped:
+                self._condition.wait()
+            if len(self._queue) == 0:
+                return []
+            deadline = self._queue[0].submit_time + self.max_wait
+            while len(self._queue) < self.max_batch_size and not self._stopped:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch_size))]
+        if len(batch) == self.max_batch_size:
+            self.full_flushes = self.full_flushes + 1
+        self.wait_seconds = self.wait_seconds + time.perf_counter() - batch[0].submit_time
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if len(batch) == 0:
+                return
+            try:
+                results = self.predict_batch_fn([future.crop for future in batch])
+            except Exception as e:
+                for future in batch:
+                    future.set_error(e)
+            else:
+                if len(results) != len(batch):
+                    # zip would leave the futures without a result waiting forever
+                    error = Exception(f"Batch of {len(batch)} crops got {len(results)} results")
+                    for future in batch:
+                        future.set_error(error)
+                else:
+                    for future, result in zip(batch, results):
+                        future.set_result(result)
+            self.batches = self.batches + 1
+            self.items = self.items + len(batch)
+
+    def close(self):
+        # crops already submitted are still classified
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def __str__(self):
+        avg_batch = self.items / self.batches if self.batches > 0 else 0.0
+        avg_wait_ms = self.wait_seconds / self.batches * 1000 if self.batches > 0 else 0.0
+        return f'Batches: {self.batches}, crops: {self.items}, avg batch: {avg_batch:.1f}' \
+               f', full batches: {self.full_flushes}, avg wait: {avg_wait_ms:.2f} ms'
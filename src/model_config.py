@@ -3,3 +3,6 @@ MAX_IMAGE_HEIGHT = 100
 MAX_IMAGE_WIDTH = 100
 COLOR_CHANNELS = 1
 IMAGE_PAIR_SIZE = (MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT)
+# output of the video converter, input of the training tools
+COLOR_IMG = False
+MOUTH_FOLDER = "./mouth_state_new10" + ("_color" if COLOR_IMG else "")
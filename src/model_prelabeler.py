@@ -0,0 +1,46 @@
+import numpy as np
+
+
+class ModelPreLabeler(object):
+    """
+    Scores face crops with a trained yawn model (MouthStateClassifier) in batches.
+    Crops with opened mouth probability below low or above high are labeled by the model,
+    crops inside the band are left to the landmark labeler.
+    """
+
+    def __init__(self, classifier, low: float = 0.1, high: float = 0.9):
+        self.classifier = classifier
+        self.low = low
+        self.high = high
+        self.scored = 0
+        self.opened = 0
+        self.closed = 0
+
+    def predict(self, gray_imgs: list) -> np.ndarray:
+        """
+        Return opened mouth probability of every crop
+        """
+        return self.classifier.predict_batch(gray_imgs)
+
+    def pre_label(self, gray_imgs: list) -> list:
+        """
+        Return True (opened), False (closed) or None (uncertain) for every crop
+        """
+        labels = []
+        for probability in self.predict(gray_imgs):
+            if probability >= self.high:
+                labels.append(True)
+                self.opened = self.opened + 1
+            elif probability <= self.low:
+                labels.append(False)
+                self.closed = self.closed + 1
+            else:
+                labels.append(None)
+        self.scored = self.scored + len(gray_imgs)
+        return labels
+
+    def __str__(self):
+        uncertain = self.scored - self.opened - self.closed
+        uncertain_rate = uncertain / self.scored if self.scored > 0 else 0.0
+        return f'Pre-labeled: {self.scored}, opened: {self.opened}, closed: {self.closed}' \
+               f', to landmark labeler: {uncertain} ({uncertain_rate * 100:.1f}%)'
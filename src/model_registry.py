@@ -0,0 +1,153 @@
+import importlib
+import os
+import threading
+import time
+
+from yawn_train.src import download_utils
+
+MODELS_FOLDER = "./temp"
+
+MODEL_DLIB_PREDICTOR = 'dlib_predictor'
+MODEL_DLIB_MOUTH_PREDICTOR = 'dlib_mouth_predictor'
+MODEL_DLIB_DETECTOR = 'dlib_detector'
+MODEL_SSD_DETECTOR = 'ssd_detector'
+MODEL_BLAZEFACE_DETECTOR = 'blazeface_detector'
+MODEL_FACE_ALIGNMENT = 'face_alignment'
+MODEL_FACEMESH_LABELER = 'facemesh_labeler'
+
+# dlib landmarks backends: 68 face points, or 20 mouth points trained by train_mouth_predictor.py
+LANDMARKS_DLIB_68 = 'dlib68'
+LANDMARKS_DLIB_MOUTH = 'dlib_mouth'
+DLIB_MOUTH_PREDICTOR_FILE = 'shape_predictor_mouth_20_landmarks.dat'
+DLIB_PREDICTOR_MODELS = {LANDMARKS_DLIB_68: MODEL_DLIB_PREDICTOR, LANDMARKS_DLIB_MOUTH: MODEL_DLIB_MOUTH_PREDICTOR}
+
+# module name -> seconds of first import
+IMPORT_SECONDS = {}
+
+
+def timed_import(module_name: str):
+    if module_name in IMPORT_SECONDS:
+        return importlib.import_module(module_name)
+    start_time = time.perf_counter()
+    module = importlib.import_module(module_name)
+    IMPORT_SECONDS[module_name] = time.perf_counter() - start_time
+    return module
+
+
+class ModelRegistry(object):
+    """
+    Loads every registered model on first use, once per process. Callers of get() share the loaded instance
+    """
+
+    def __init__(self):
+        self.loaders = {}  # name -> function() -> model
+        self.models = {}
+        self.load_seconds = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, loader):
+        with self._lock:
+            self.loaders[name] = loader
+            self.models.pop(name, None)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self.models
+
+    def get(self, name: str):
+        model = self.models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            if name not in self.models:
+                start_time = time.perf_counter()
+                self.models[name] = self.loaders[name]()
+                self.load_seconds[name] = time.perf_counter() - start_time
+                print(f'Loaded {name} in {self.load_seconds[name]:.2f}s')
+            return self.models[name]
+
+    def timings(self) -> dict:
+        # 'import <module>' / 'load <model>' -> seconds, picklable to send back from a worker process
+        timings = {f'import {module_name}': seconds for module_name, seconds in IMPORT_SECONDS.items()}
+        timings.update((f'load {name}', seconds) for name, seconds in self.load_seconds.items())
+        return timings
+
+    def report(self) -> str:
+        lines = [f'{key}: {seconds:.2f}s' for key, seconds in self.timings().items()]
+        not_loaded = [name for name in self.loaders if name not in self.models]
+        if len(not_loaded) > 0:
+            lines.append(f'not loaded: {", ".join(not_loaded)}')
+        return '\n'.join(lines)
+
+
+def report_workers(worker_timings) -> str:
+    """
+    Aggregates ModelRegistry.timings() of several worker processes, each worker imports and loads on its own
+    """
+    worker_timings = list(worker_timings)
+    seconds_per_key = {}
+    for timings in worker_timings:
+        for key, seconds in timings.items():
+            seconds_per_key.setdefault(key, []).append(seconds)
+    lines = [f'{key}: total {sum(seconds):.2f}s, max {max(seconds):.2f}s, {len(seconds)}/{len(worker_timings)} workers'
+             for key, seconds in seconds_per_key.items()]
+    return '\n'.join(lines)
+
+
+def load_dlib_predictor():
+    # dlib predictor for 68pts, mouth
+    dlib = timed_import('dlib')
+    return dlib.shape_predictor(download_utils.download_and_unpack_dlib_68_landmarks(MODELS_FOLDER))
+
+
+def load_dlib_mouth_predictor():
+    dlib = timed_import('dlib')
+    predictor_path = os.path.join(MODELS_FOLDER, DLIB_MOUTH_PREDICTOR_FILE)
+    if not os.path.isfile(predictor_path):
+        raise Exception(f"Mouth predictor not found: {predictor_path}, train it with train_mouth_predictor.py")
+    return dlib.shape_predictor(predictor_path)
+
+
+def load_dlib_detector():
+    # dlib's face detector (HOG-based)
+    dlib = timed_import('dlib')
+    return dlib.get_frontal_face_detector()
+
+
+def load_ssd_detector():
+    cv2 = timed_import('cv2')
+    from yawn_train.src.ssd_face_detector import SSDFaceDetector
+    caffe_weights, caffe_config = download_utils.download_caffe(MODELS_FOLDER)
+    # Reads the network model stored in Caffe framework's format.
+    return SSDFaceDetector(cv2.dnn.readNetFromCaffe(caffe_config, caffe_weights))
+
+
+def load_blazeface_detector():
+    tf = timed_import('tensorflow')
+    from yawn_train.src.blazeface_detector import BlazeFaceDetector
+    blazeface_tf = tf.keras.models.load_model(download_utils.download_blazeface(MODELS_FOLDER), compile=False)
+    return BlazeFaceDetector(blazeface_tf)
+
+
+def load_face_alignment():
+    face_alignment = timed_import('face_alignment')
+    # faces are always passed as boxes, 'folder' detector loads no detector network.
+    # Its reference scale is the same as of the default 'sfd' detector, so landmarks do not change
+    return face_alignment.FaceAlignment(face_alignment.LandmarksType._3D, flip_input=True, device='cpu',
+                                        face_detector='folder')
+
+
+def load_facemesh_labeler():
+    tf = timed_import('tensorflow')
+    from yawn_train.src.facemesh_labeler import FaceMeshLabeler
+    facemesh_tf = tf.keras.models.load_model(download_utils.download_facemesh(MODELS_FOLDER), compile=False)
+    return FaceMeshLabeler(facemesh_tf)
+
+
+MODELS = ModelRegistry()
+MODELS.register(MODEL_DLIB_PREDICTOR, load_dlib_predictor)
+MODELS.register(MODEL_DLIB_MOUTH_PREDICTOR, load_dlib_mouth_predictor)
+MODELS.register(MODEL_DLIB_DETECTOR, load_dlib_detector)
+MODELS.register(MODEL_SSD_DETECTOR, load_ssd_detector)
+MODELS.register(MODEL_BLAZEFACE_DETECTOR, load_blazeface_detector)
+MODELS.register(MODEL_FACE_ALIGNMENT, load_face_alignment)
+MODELS.register(MODEL_FACEMESH_LABELER, load_facemesh_labeler)
@@ -0,0 +1,183 @@
+import cv2
+import numpy as np
+
+from yawn_train.src.model_config import IMAGE_PAIR_SIZE, MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT, COLOR_CHANNELS
+
+BACKEND_KERAS = 'keras'  # h5 or SavedModel
+BACKEND_PB = 'pb'  # frozen graph
+BACKEND_TFLITE = 'tflite'
+BACKEND_ONNXRUNTIME = 'onnxruntime'
+BACKEND_OPENCV = 'opencv'  # onnx model in cv2.dnn
+BACKENDS = [BACKEND_KERAS, BACKEND_PB, BACKEND_TFLITE, BACKEND_ONNXRUNTIME, BACKEND_OPENCV]
+
+CONFIDENCE_THRESHOLD = 0.2
+BATCH_SIZE = 32
+
+
+def prepare_crops(crops: list) -> np.ndarray:
+    """
+    Return (N, H, W, 1) float32 input in [0, 1] for face crops, BGR, (H, W) or (H, W, 1) grayscale of any size
+    """
+    input_tensor = np.empty((len(crops), MAX_IMAGE_HEIGHT, MAX_IMAGE_WIDTH, COLOR_CHANNELS), np.float32)
+    for i, crop in enumerate(crops):
+        if crop.shape[0] != MAX_IMAGE_HEIGHT or crop.shape[1] != MAX_IMAGE_WIDTH:
+            crop = cv2.resize(crop, IMAGE_PAIR_SIZE, interpolation=cv2.INTER_AREA)
+        if crop.ndim == 3 and crop.shape[-1] == 3:
+            crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        elif crop.ndim == 3:
+            crop = crop[:, :, 0]  # (H, W, 1) grayscale
+        np.multiply(crop, 1 / 255.0, out=input_tensor[i, :, :, 0], casting='unsafe')
+    return input_tensor
+
+
+class KerasBackend(object):
+    """
+    Keras model traced once into a graph, called without predict overhead
+    """
+
+    def __init__(self, model_path: str):
+        import tensorflow as tf
+        self.tf = tf
+        self.model = tf.keras.models.load_model(model_path, compile=False)
+        self._predict = tf.function(
+            lambda input_tensor: self.model(input_tensor, training=False),
+            input_signature=[tf.TensorSpec([None, MAX_IMAGE_HEIGHT, MAX_IMAGE_WIDTH, COLOR_CHANNELS], tf.float32)]
+        )
+
+    def __call__(self, input_tensor: np.ndarray) -> np.ndarray:
+        return self._predict(self.tf.convert_to_tensor(input_tensor)).numpy()
+
+
+class PbBackend(object):
+    """
+    Frozen graph in a TF1 session, the session is kept open between calls
+    """
+
+    def __init__(self, model_path: str, input_name: str = 'x:0', output_name: str = 'Identity:0'):
+        import tensorflow as tf
+        with tf.io.gfile.GFile(model_path, 'rb') as f:
+            graph_def = tf.compat.v1.GraphDef()
+            graph_def.ParseFromString(f.read())
+        with tf.Graph().as_default() as graph:
+            tf.import_graph_def(graph_def, name='prefix')
+        self.input = graph.get_tensor_by_name('prefix/' + input_name)
+        self.output = graph.get_tensor_by_name('prefix/' + output_name)
+        self.session = tf.compat.v1.Session(graph=graph)
+
+    def __call__(self, input_tensor: np.ndarray) -> np.ndarray:
+        return self.session.run(self.output, feed_dict={self.input: input_tensor})
+
+
+class TFLiteBackend(object):
+    """
+    TFLite interpreter, input is resized when the batch size changes. Quantized models get uint8 pixels
+    """
+
+    def __init__(self, model_path: str, num_threads: int = None):
+        import tensorflow as tf
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        input_details = self.interpreter.get_input_details()[0]
+        output_details = self.interpreter.get_output_details()[0]
+        self.input_index = input_details['index']
+        self.output_index = output_details['index']
+        self.floating_model = input_details['dtype'] == np.float32
+        self.output_quantization = output_details['quantization']
+        self.batch_size = input_details['shape'][0]
+
+    def __call__(self, input_tensor: np.ndarray) -> np.ndarray:
+        if not self.floating_model:
+            input_tensor = np.round(input_tensor * 255.0).astype(np.uint8)
+        if input_tensor.shape[0] != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input_index, input_tensor.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = input_tensor.shape[0]
+        self.interpreter.set_tensor(self.input_index, input_tensor)
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self.output_index)
+        scale, zero_point = self.output_quantization
+        if not self.floating_model and scale > 0:
+            return scale * (output.astype(np.float32) - zero_point)
+        return output.copy()
+
+
+class OnnxRuntimeBackend(object):
+    """
+    Persistent onnxruntime session, models exported with a fixed batch size of 1 run crop by crop
+    """
+
+    def __init__(self, model_path: str, num_threads: int = None):
+        import onnxruntime as rt
+        options = rt.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = rt.InferenceSession(model_path, options)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.output_name = self.session.get_outputs()[0].name
+        self.fixed_batch = model_input.shape[0] == 1
+
+    def __call__(self, input_tensor: np.ndarray) -> np.ndarray:
+        if self.fixed_batch and len(input_tensor) > 1:
+            return np.concatenate([self.session.run([self.output_name], {self.input_name: input_tensor[i:i + 1]})[0]
+                                   for i in range(len(input_tensor))])
+        return self.session.run([self.output_name], {self.input_name: input_tensor})[0]
+
+
+class OpenCVBackend(object):
+
+    def __init__(self, model_path: str):
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+
+    def __call__(self, input_tensor: np.ndarray) -> np.ndarray:
+        self.net.setInput(input_tensor)
+        return self.net.forward()
+
+
+def create_backend(backend: str, model_path: str, num_threads: int = None):
+    if backend == BACKEND_KERAS:
+        return KerasBackend(model_path)
+    if backend == BACKEND_PB:
+        return PbBackend(model_path)
+    if backend == BACKEND_TFLITE:
+        return TFLiteBackend(model_path, num_threads)
+    if backend == BACKEND_ONNXRUNTIME:
+        return OnnxRuntimeBackend(model_path, num_threads)
+    if backend == BACKEND_OPENCV:
+        return OpenCVBackend(model_path)
+    raise ValueError(f"Unknown backend: {backend}, expected one of {BACKENDS}")
+
+
+class MouthStateClassifier(object):
+    """
+    Opened mouth classifier of face crops, same preprocessing for every backend
+    """
+
+    def __init__(self, backend: str, model_path: str, threshold: float = CONFIDENCE_THRESHOLD,
+                 batch_size: int = BATCH_SIZE, num_threads: int = None):
+        self.backend_name = backend
+        self.model_path = model_path
+        self.backend = create_backend(backend, model_path, num_threads)
+        self.threshold = threshold
+        self.batch_size = batch_size
+
+    def predict_batch(self, crops: list) -> np.ndarray:
+        """
+        Return opened mouth probability of every crop
+        """
+        if len(crops) == 0:
+            return np.zeros(0, dtype=np.float32)
+        probabilities = []
+        for batch_start in range(0, len(crops), self.batch_size):
+            input_tensor = prepare_crops(crops[batch_start:batch_start + self.batch_size])
+            probabilities.append(np.reshape(self.backend(input_tensor), (len(input_tensor), -1))[:, -1])
+        return np.concatenate(probabilities).astype(np.float32)
+
+    def predict(self, crop) -> float:
+        return float(self.predict_batch([crop])[0])
+
+    def is_opened(self, probabilities):
+        return probabilities >= self.threshold
+
+    def __str__(self):
+        return f'{self.backend_name}: {self.model_path}, threshold {self.threshold}'
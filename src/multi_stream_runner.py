@@ -0,0 +1,189 @@
+import argparse
+import collections
+import time
+
+import cv2
+import numpy as np
+
+from yawn_train.src import download_utils
+from yawn_train.src.face_tracker import FaceTracker
+from yawn_train.src.mouth_state_classifier import MouthStateClassifier, BACKENDS, BACKEND_TFLITE, \
+    CONFIDENCE_THRESHOLD
+from yawn_train.src.ssd_face_detector import SSDFaceDetector
+
+TEMP_FOLDER = "./temp"
+KEYFRAME_INTERVAL = 10
+LATENCY_WINDOW = 1000  # latest results for latency percentiles, cameras run without end
+
+
+class StreamState(object):
+    """
+    State of one video source: capture, face tracker, counters and timings
+    """
+
+    def __init__(self, stream_id: int, source, face_detector: SSDFaceDetector, keyframe_interval: int):
+        self.stream_id = stream_id
+        self.source = source
+        self.vid = cv2.VideoCapture(source)
+        if self.vid.isOpened() is False:
+            raise Exception(f"Video not opened: {source}")
+        # trackers of all streams share one detector network
+        self.face_tracker = FaceTracker(face_detector.detect_face, keyframe_interval=keyframe_interval)
+        self.is_done = False
+        self.frames = 0
+        self.classified = 0
+        self.mouth_open_counter = 0
+        self.last_probability = 0.0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)  # ms from frame read to result
+        self.start_time = time.perf_counter()
+        self.end_time = None
+
+    def read(self):
+        """
+        Return (frame, read time), frame is None at the end of the video
+        """
+        ret, frame = self.vid.read()
+        read_time = time.perf_counter()
+        if ret is False:
+            self.is_done = True
+            self.end_time = read_time
+            self.vid.release()
+            return None, read_time
+        self.frames = self.frames + 1
+        return frame, read_time
+
+    def track(self, frame, keyframe_faces: list = None):
+        """
+        Return face box or None, keyframe_faces are full frame detections of a batched keyframe
+        """
+        detect_full = (lambda: keyframe_faces) if keyframe_faces is not None else None
+        face_list = self.face_tracker.update(frame, detect_full=detect_full)
+        return face_list[0] if len(face_list) > 0 else None
+
+    def on_result(self, probability: float, is_opened: bool, read_time: float):
+        self.classified = self.classified + 1
+        self.last_probability = probability
+        if is_opened:
+            self.mouth_open_counter = self.mouth_open_counter + 1
+        self.latencies.append((time.perf_counter() - read_time) * 1000)
+
+    def fps(self) -> float:
+        end_time = self.end_time or time.perf_counter()
+        return self.frames / max(end_time - self.start_time, 1e-6)
+
+    def __str__(self):
+        latencies = self.latencies if len(self.latencies) > 0 else [0.0]
+        return f'Stream {self.stream_id} ({self.source}): frames {self.frames}, {self.fps():.1f} fps' \
+               f', classified {self.classified}, opened {self.mouth_open_counter}' \
+               f', latency p50 {np.percentile(latencies, 50):.1f} ms, p95 {np.percentile(latencies, 95):.1f} ms'
+
+
+class MultiStreamRunner(object):
+    """
+    Reads one frame of every active stream per tick, classifies the face crops of all streams in one batch
+    and passes the results back to their streams
+    """
+
+    def __init__(self, sources: list, face_model, classifier: MouthStateClassifier,
+                 keyframe_interval: int = KEYFRAME_INTERVAL, show: bool = False):
+        self.face_detector = SSDFaceDetector(face_model)
+        self.streams = [StreamState(stream_id, source, self.face_detector, keyframe_interval)
+                        for stream_id, source in enumerate(sources)]
+        self.classifier = classifier
+        self.show = show
+        self.ticks = 0
+        self.batch_sizes = []
+        self.keyframe_batch_sizes = []
+
+    def detect_keyframes(self, frames: list) -> list:
+        # streams due for a keyframe in this tick share one detector forward pass
+        if len(frames) == 0:
+            return []
+        self.keyframe_batch_sizes.append(len(frames))
+        return [[tuple(box) for box in boxes.tolist()] for boxes in self.face_detector.detect_faces(frames)]
+
+    def tick(self):
+        frames = []  # (stream, frame, read time)
+        for stream in self.streams:
+            if stream.is_done:
+                continue
+            frame, read_time = stream.read()
+            if frame is not None:
+                frames.append((stream, frame, read_time))
+        keyframe_indices = [i for i, (stream, _, _) in enumerate(frames) if stream.face_tracker.is_keyframe_due()]
+        keyframe_faces = dict(zip(keyframe_indices, self.detect_keyframes([frames[i][1] for i in keyframe_indices])))
+
+        requests = []  # (stream, frame, face, read time)
+        for i, (stream, frame, read_time) in enumerate(frames):
+            # lost faces still fall back to a detection of their own stream
+            face = stream.track(frame, keyframe_faces.get(i))
+            if face is not None:
+                (start_x, start_y, end_x, end_y) = face
+                face = (max(start_x, 0), max(start_y, 0), end_x, end_y)
+            if face is None or face[0] >= face[2] or face[1] >= face[3]:
+                self.show_frame(stream, frame, None)
+                continue
+            requests.append((stream, frame, face, read_time))
+        crops = [frame[start_y:end_y, start_x:end_x] for _, frame, (start_x, start_y, end_x, end_y), _ in requests]
+        probabilities = self.classifier.predict_batch(crops)
+        for (stream, frame, face, read_time), probability in zip(requests, probabilities):
+            stream.on_result(float(probability), bool(self.classifier.is_opened(probability)), read_time)
+            self.show_frame(stream, frame, face)
+        self.ticks = self.ticks + 1
+        self.batch_sizes.append(len(crops))
+
+    def show_frame(self, stream: StreamState, frame, face):
+        if not self.show:
+            return
+        if face is not None:
+            (start_x, start_y, end_x, end_y) = face
+            cv2.rectangle(frame, (start_x, start_y), (end_x, end_y), (0, 255, 0), 2)
+        is_opened = self.classifier.is_opened(stream.last_probability)
+        cv2.putText(frame, f"Mouth opened {stream.mouth_open_counter}", (0, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.8,
+                    (0, 0, 255), 2)
+        cv2.putText(frame, f"{'Opened' if is_opened else 'Closed'}, {stream.last_probability:.2f}", (0, 50),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+        cv2.imshow(f"Stream {stream.stream_id}", frame)
+        cv2.waitKey(1)
+
+    def run(self):
+        while not all(stream.is_done for stream in self.streams):
+            self.tick()
+        if self.show:
+            cv2.destroyAllWindows()
+        self.print_stats()
+
+    def print_stats(self):
+        for stream in self.streams:
+            print(stream)
+            print(stream.face_tracker.stats)
+        avg_batch = np.mean(self.batch_sizes) if len(self.batch_sizes) > 0 else 0.0
+        avg_keyframe_batch = np.mean(self.keyframe_batch_sizes) if len(self.keyframe_batch_sizes) > 0 else 0.0
+        print(f'Ticks: {self.ticks}, avg batch: {avg_batch:.1f}'
+              f', keyframe detections: {len(self.keyframe_batch_sizes)}, avg keyframe batch: {avg_keyframe_batch:.1f}')
+
+
+def parse_source(source: str):
+    # camera index or file path
+    return int(source) if source.isdigit() else source
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Run the yawn classifier over many video sources in one process.")
+    parser.add_argument("sources", type=str, nargs='+', help="video files or camera indices")
+    parser.add_argument("--backend", type=str, default=BACKEND_TFLITE, choices=BACKENDS)
+    parser.add_argument("--model", type=str, default='./out_epoch_80_lite/yawn_model_float_80.tflite')
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD)
+    parser.add_argument("--show", action='store_true', help="show a window per stream")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    caffe_weights, caffe_config = download_utils.download_caffe(TEMP_FOLDER)
+    # Reads the network model stored in Caffe framework's format.
+    face_model = cv2.dnn.readNetFromCaffe(caffe_config, caffe_weights)
+    classifier = MouthStateClassifier(args.backend, args.model, args.threshold)
+    runner = MultiStreamRunner([parse_source(source) for source in args.sources], face_model, classifier,
+                               show=args.show)
+    runner.run()
@@ -1,48 +1,41 @@
+import collections
 import glob
 import os
 from pathlib import Path
 
 import cv2
 import numpy as np
-import tensorflow as tf
 
 from yawn_train.src import download_utils, inference_utils
-from yawn_train.src.model_config import IMAGE_PAIR_SIZE, MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT, COLOR_CHANNELS
+from yawn_train.src.micro_batcher import MicroBatcher
+from yawn_train.src.model_config import IMAGE_PAIR_SIZE
+from yawn_train.src.mouth_state_classifier import MouthStateClassifier, BACKEND_OPENCV
 from yawn_train.src.video_face_reader import VideoFaceDetector
 
-assert tf.__version__.startswith('2')
-
-print('TensorFlow version: {}'.format(tf.__version__))
-
 """
 Use this to run interference
-Helpful links
-https://colab.research.google.com/github/tensorflow/examples/blob/master/lite/codelabs/digit_classifier/ml/step2_train_ml_model.ipynb#scrollTo=WFHKkb7gcJei
 """
 
-print("Version: ", tf.__version__)
-print("Eager mode: ", tf.executing_eagerly())
-print("GPU is", "available" if tf.test.is_gpu_available() else "NOT AVAILABLE")
-
-# it runs much slower than float version on CPU
-# https://github.com/tensorflow/tensorflow/issues/21698#issuecomment-414764709
 CONFIDENCE_THRESHOLD = 0.4
 VIDEO_FILE = '/Users/igla/Downloads/YawDD dataset 2/Mirror/Male_mirror Avi Videos/8-MaleGlassesBeard-Yawning.avi'  # '/Users/igla/Downloads/critical_video_yawn.mp4' #'/Users/igla/Downloads/T001yawning.mp4'
 TEST_DIR = '../out_test_mouth/'
 TEMP_FOLDER = "./temp"
-BATCH_IMG_COUNT_PROCESS = 1  # number of images per process
+BATCH_IMG_COUNT_PROCESS = 1  # max images per classifier call, 1 classifies every frame before reading the next
+BATCH_MAX_WAIT_US = 20000  # classify a smaller batch when its oldest image waited that long
 WRITE_VIDEO = True
 
-# Provide trained KERAS model
-cv_model = cv2.dnn.readNetFromONNX('/Users/igla/Downloads/out_epoch_80_lite-3/yawn_model_onnx_80.onnx')
+# Provide trained ONNX model
+classifier = MouthStateClassifier(BACKEND_OPENCV, '/Users/igla/Downloads/out_epoch_80_lite-3/yawn_model_onnx_80.onnx',
+                                  CONFIDENCE_THRESHOLD)
 
 caffe_weights, caffe_config = download_utils.download_caffe(TEMP_FOLDER)
 # Reads the network model stored in Caffe framework's format.
 face_model = cv2.dnn.readNetFromCaffe(caffe_config, caffe_weights)
 
 mouth_open_counter = 0
-batch_img_list = []
 last_pred_val = 0.0
+batcher = None
+pending_futures = collections.deque()
 
 
 def clear_test():
@@ -56,38 +49,6 @@ def clear_test():
     Path(TEST_DIR).mkdir(parents=True, exist_ok=True)
 
 
-def prepare_input_blob(im):
-    if im.shape[0] != MAX_IMAGE_WIDTH or im.shape[1] != MAX_IMAGE_HEIGHT:
-        try:
-            im = cv2.resize(im, IMAGE_PAIR_SIZE)
-        except:
-            print('Exception')
-    im = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
-    blob = cv2.dnn.blobFromImage(im,
-                                 scalefactor=1 / 255.0,
-                                 ddepth=cv2.CV_32F)
-    # print(blob.shape)
-    blob = blob.reshape(-1, MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT, COLOR_CHANNELS)
-    # print(blob.shape)
-    return blob, im
-
-
-def prepare_input_blob_multiple(images: list):
-    img_list = []
-    for img in images:
-        if img.shape[0] != MAX_IMAGE_WIDTH or img.shape[1] != MAX_IMAGE_HEIGHT:
-            img = cv2.resize(img, IMAGE_PAIR_SIZE)
-        img_list.append(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
-
-    blob = cv2.dnn.blobFromImages(img_list,
-                                  scalefactor=1 / 255.0,
-                                  ddepth=cv2.CV_32F)
-    # print(blob.shape)
-    blob = blob.reshape(-1, MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT, COLOR_CHANNELS)
-    # print(blob.shape)
-    return blob, img_list
-
-
 video_writer = None
 
 
@@ -101,23 +62,13 @@ def image_reader(frame, face):
     (start_x, startY, endX, endY) = face
     frame_crop = frame[startY:endY, start_x:endX]
 
-    im_input_cv, gray_img = prepare_input_blob(frame_crop)
-
-    # im_input_cv.shape
-    # im_input_cv.dtype
-    # im_input_cv.ravel()[5000:5010]
-
     time_start = inference_utils.get_timestamp_ms()
-    cv_model.setInput(im_input_cv)
-
-    predictions = cv_model.forward()
-    pred = np.squeeze(predictions)
-    pred = round(pred[()], 2)
+    pred = round(classifier.predict(frame_crop), 2)
     time_diff = inference_utils.get_timestamp_ms() - time_start
     print(f'Prediction: {pred:.2f}; time: {time_diff} ms')
 
     global mouth_open_counter
-    is_mouth_opened = True if pred >= CONFIDENCE_THRESHOLD else False
+    is_mouth_opened = classifier.is_opened(pred)
     if is_mouth_opened:
         mouth_open_counter = mouth_open_counter + 1
 
@@ -136,6 +87,7 @@ def image_reader(frame, face):
     opened_str = "State: " + ("opened" if is_mouth_opened else "closed") + ", " + str(pred)
     cv2.putText(frame, opened_str, (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.8, text_color, 2)
 
+    gray_img = cv2.cvtColor(cv2.resize(frame_crop, IMAGE_PAIR_SIZE), cv2.COLOR_BGR2GRAY)
     backtorgb = cv2.cvtColor(gray_img, cv2.COLOR_GRAY2RGB)
     x_offset = 20
     y_offset = 75
@@ -148,24 +100,32 @@ def image_reader(frame, face):
         video_writer.write(frame)
 
 
-def image_reader_batch(frame, face):
-    global batch_img_list
+def read_predictions(wait: bool):
+    # results arrive in submit order; with wait, blocks until every submitted crop is classified
     global last_pred_val
+    global mouth_open_counter
+
+    while len(pending_futures) > 0 and (wait or pending_futures[0].done()):
+        future = pending_futures.popleft()
+        last_pred_val = round(float(future.result()), 2)
+        if classifier.is_opened(last_pred_val):
+            mouth_open_counter = mouth_open_counter + 1
+        print(f'Prediction: {last_pred_val:.2f}; latency: {future.latency_ms():.1f} ms')
 
-    batch_img_list.append(frame)
-    if len(batch_img_list) == BATCH_IMG_COUNT_PROCESS:
-        if face is not None:
-            last_pred_val = resolve_predictions(batch_img_list, face)
-        else:
-            last_pred_val = 0.0
-        batch_img_list = []  # clear
-    else:
-        print('Wait next frame, collected:', len(batch_img_list))
+
+def image_reader_batch(frame, face):
+    if face is not None:
+        (start_x, start_y, end_x, end_y) = face
+        frame_crop = frame[max(start_y, 0):end_y, max(start_x, 0):end_x]
+        if frame_crop.size > 0:
+            # copied, putText draws on the frame while the batcher thread reads the crop; results arrive in submit order
+            pending_futures.append(batcher.submit(frame_crop.copy()))
+    read_predictions(wait=False)
 
     cv2.putText(frame, f"Mouth opened {mouth_open_counter}", (0, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.8,
                 (0, 0, 255),
                 2)
-    is_mouth_opened = last_pred_val >= CONFIDENCE_THRESHOLD
+    is_mouth_opened = classifier.is_opened(last_pred_val)
     opened_str = "Opened" if is_mouth_opened else "Closed"
     cv2.putText(frame, opened_str, (0, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
 
@@ -176,40 +136,6 @@ def image_reader_batch(frame, face):
     cv2.waitKey(1)
 
 
-def resolve_predictions(frames: list, face) -> float:
-    time_start = inference_utils.get_timestamp_ms()
-
-    frames_list = []
-    for frame in frames:
-        (startX, startY, endX, endY) = face
-        frame_crop = frame[startY:endY, startX:endX]
-        frames_list.append(frame_crop)
-
-    im_input_cvs, gray_imgs = prepare_input_blob_multiple(frames_list)
-    cv_model.setInput(im_input_cvs)
-    predictions = cv_model.forward()
-
-    pred = np.squeeze(predictions)
-    print(pred)
-
-    global mouth_open_counter
-    ret_predictions = []
-    total = 0.0
-    for x in pred:
-        x = round(x, 2)
-        ret_predictions.append(x)
-        total = total + x
-
-        is_mouth_opened = True if x >= CONFIDENCE_THRESHOLD else False
-        if is_mouth_opened:
-            mouth_open_counter = mouth_open_counter + 1
-
-    avg_open = total / len(ret_predictions)
-    time_diff = inference_utils.get_timestamp_ms() - time_start
-    print(f'Predictions: {ret_predictions}; time: {time_diff} ms')
-    return round(avg_open, 2)
-
-
 if __name__ == '__main__':
     mouth_open_counter = 0
     clear_test()
@@ -218,7 +144,13 @@ if __name__ == '__main__':
     if BATCH_IMG_COUNT_PROCESS == 1:
         video_face_detector.start_single(image_reader)
     else:
+        batcher = MicroBatcher(classifier.predict_batch, BATCH_IMG_COUNT_PROCESS, BATCH_MAX_WAIT_US)
         video_face_detector.start_batch(image_reader_batch)
+        batcher.close()
+        # predictions still pending when the video ended
+        read_predictions(wait=True)
+        print(batcher)
+        print(f'Mouth opened {mouth_open_counter}')
     cv2.destroyAllWindows()
 
     if video_writer is not None:
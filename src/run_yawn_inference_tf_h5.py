@@ -3,12 +3,10 @@ import os
 from pathlib import Path
 
 import cv2
-import numpy as np
 import tensorflow as tf
-from tensorflow import keras
 
 from yawn_train.src import download_utils, inference_utils
-from yawn_train.src.model_config import IMAGE_PAIR_SIZE
+from yawn_train.src.mouth_state_classifier import MouthStateClassifier, BACKEND_KERAS
 from yawn_train.src.video_face_reader import VideoFaceDetector
 
 assert tf.__version__.startswith('2')
@@ -33,7 +31,7 @@ TEST_DIR = '../out_test_mouth/'
 TEMP_FOLDER = "./temp"
 
 # Provide trained KERAS model
-model = keras.models.load_model('../out_epoch_30/yawn_model_30.h5')
+classifier = MouthStateClassifier(BACKEND_KERAS, '../out_epoch_30/yawn_model_30.h5', CONFIDENCE_THRESHOLD)
 
 caffe_weights, caffe_config = download_utils.download_caffe(TEMP_FOLDER)
 # Reads the network model stored in Caffe framework's format.
@@ -42,18 +40,11 @@ face_model = cv2.dnn.readNetFromCaffe(caffe_config, caffe_weights)
 
 def predict_image_data(img_array):
     start = inference_utils.get_timestamp_ms()
-
-    # scale pixel values to [0, 1]
-    img_array = img_array.astype(np.float32)
-    img_array /= 255.0
-    img_array = tf.expand_dims(img_array, axis=0)  # Create batch axis
-    model_predictions = model.predict(img_array)
-    predicted_confidence = np.max(model_predictions[0])
-
+    predicted_confidence = classifier.predict(img_array)
     diff = inference_utils.get_timestamp_ms() - start
     print(f'Time elapsed {diff} ms')
 
-    is_mouth_opened = True if predicted_confidence >= CONFIDENCE_THRESHOLD else False
+    is_mouth_opened = classifier.is_opened(predicted_confidence)
     # classes taken from input data
     predicted_label_id = 'opened' if is_mouth_opened else 'closed'
     condition = f">= {CONFIDENCE_THRESHOLD}" if is_mouth_opened else f"< {CONFIDENCE_THRESHOLD}"
@@ -65,11 +56,7 @@ def predict_image_data(img_array):
 
 
 def predict_image_path(input_img):
-    loaded_img = keras.preprocessing.image.load_img(
-        input_img, target_size=IMAGE_PAIR_SIZE, color_mode="grayscale"
-    )
-    img_array = keras.preprocessing.image.img_to_array(loaded_img)
-    predict_image_data(img_array)
+    predict_image_data(cv2.imread(input_img, cv2.IMREAD_GRAYSCALE))
 
 
 def clear_test():
@@ -86,9 +73,7 @@ def clear_test():
 def image_reader(frame, face):
     (startX, startY, endX, endY) = face
     frame_crop = frame[startY:endY, startX:endX]
-    img_expanded = inference_utils.prepare_image(frame_crop, IMAGE_PAIR_SIZE)
-
-    prediction = predict_image_data(img_expanded)
+    prediction = predict_image_data(frame_crop)
     print(prediction)
 
     cv2.imshow("Image", frame)
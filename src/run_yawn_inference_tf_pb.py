@@ -3,11 +3,10 @@ import os
 from pathlib import Path
 
 import cv2
-import numpy as np
 import tensorflow as tf
 
 from yawn_train.src import download_utils, inference_utils
-from yawn_train.src.model_config import IMAGE_PAIR_SIZE, MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT, COLOR_CHANNELS
+from yawn_train.src.mouth_state_classifier import MouthStateClassifier, BACKEND_PB
 from yawn_train.src.video_face_reader import VideoFaceDetector
 
 assert tf.__version__.startswith('2')
@@ -32,31 +31,8 @@ TEST_DIR = '../out_test_mouth/'
 TEMP_FOLDER = "./temp"
 
 
-def load_pb_model():
-    print("load graph")
-    with tf.io.gfile.GFile(GRAPH_PB_PATH, 'rb') as f:
-        graph_def = tf.compat.v1.GraphDef()
-        graph_def.ParseFromString(f.read())
-
-    with tf.Graph().as_default() as graph:
-        tf.import_graph_def(graph_def, name='prefix')
-
-    graph_nodes = [n for n in graph_def.node]
-    names = []
-    for t in graph_nodes:
-        names.append(t.name)
-    print(names)
-
-    for op in graph.get_operations():
-        print(op.name)
-
-    input = graph.get_tensor_by_name('prefix/x:0')
-    output = graph.get_tensor_by_name('prefix/Identity:0')
-    return tf.compat.v1.Session(graph=graph), input, output
-
-
 GRAPH_PB_PATH = '../out_epoch_60/yawn_model_60.pb'
-pb_session_tuple = load_pb_model()
+classifier = MouthStateClassifier(BACKEND_PB, GRAPH_PB_PATH, CONFIDENCE_THRESHOLD)
 
 caffe_weights, caffe_config = download_utils.download_caffe(TEMP_FOLDER)
 # Reads the network model stored in Caffe framework's format.
@@ -65,23 +41,11 @@ face_model = cv2.dnn.readNetFromCaffe(caffe_config, caffe_weights)
 
 def predict_image_data(img_array):
     start = inference_utils.get_timestamp_ms()
-
-    # scale pixel values to [0, 1]
-    img_array = img_array.astype(np.float32)
-    img_array /= 255.0
-    img_array = np.reshape(img_array, (-1, MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT, COLOR_CHANNELS))
-    # img_array = tf.expand_dims(img_array, axis=0)  # Create batch axis
-
-    sess, input, output = pb_session_tuple
-    y_out = sess.run(output, feed_dict={input: img_array})
-
-    # model_predictions = model.predict(img_array)
-    predicted_confidence = np.max(y_out[0])
-
+    predicted_confidence = classifier.predict(img_array)
     diff = inference_utils.get_timestamp_ms() - start
     print(f'Time elapsed {diff} ms')
 
-    is_mouth_opened = True if predicted_confidence >= CONFIDENCE_THRESHOLD else False
+    is_mouth_opened = classifier.is_opened(predicted_confidence)
     # classes taken from input data
     predicted_label_id = 'opened' if is_mouth_opened else 'closed'
     condition = f">= {CONFIDENCE_THRESHOLD}" if is_mouth_opened else f"< {CONFIDENCE_THRESHOLD}"
@@ -106,9 +70,7 @@ def clear_test():
 def image_reader(frame, face):
     (startX, startY, endX, endY) = face
     frame_crop = frame[startY:endY, startX:endX]
-    img_expanded = inference_utils.prepare_image(frame_crop, IMAGE_PAIR_SIZE)
-
-    prediction = predict_image_data(img_expanded)
+    prediction = predict_image_data(frame_crop)
     print(prediction)
 
     cv2.imshow("Image", frame)
@@ -3,11 +3,10 @@ import os
 from pathlib import Path
 
 import cv2
-import numpy as np
 import tensorflow as tf
 
 from yawn_train.src import download_utils, inference_utils
-from yawn_train.src.model_config import IMAGE_PAIR_SIZE
+from yawn_train.src.mouth_state_classifier import MouthStateClassifier, BACKEND_TFLITE
 from yawn_train.src.video_face_reader import VideoFaceDetector
 
 assert tf.__version__.startswith('2')
@@ -39,28 +38,8 @@ caffe_weights, caffe_config = download_utils.download_caffe(TEMP_FOLDER)
 # Reads the network model stored in Caffe framework's format.
 face_model = cv2.dnn.readNetFromCaffe(caffe_config, caffe_weights)
 
-interpreter = tf.lite.Interpreter(model_path=TFLITE_FLOAT_MODEL)
-interpreter.allocate_tensors()
-
-input_details = interpreter.get_input_details()
-output_details = interpreter.get_output_details()
-
-print("== Input details ==")
-print("name:", input_details[0]['name'])
-print("shape:", input_details[0]['shape'])
-print("type:", input_details[0]['dtype'])
-
-print("\n== Output details ==")
-print("name:", interpreter.get_output_details()[0]['name'])
-print("shape:", interpreter.get_output_details()[0]['shape'])
-print("type:", interpreter.get_output_details()[0]['dtype'])
-
-floating_model = input_details[0]['dtype'] == np.float32
-print('Floating model is: ' + str(floating_model))
-
-# NxHxWxC, H:1, W:2
-height = input_details[0]['shape'][1]
-width = input_details[0]['shape'][2]
+classifier = MouthStateClassifier(BACKEND_TFLITE, TFLITE_FLOAT_MODEL, CONFIDENCE_THRESHOLD)
+print(classifier)
 
 time_elapsed = 0
 exec_cnt = 0
@@ -68,24 +47,10 @@ exec_cnt = 0
 
 def make_interference(image_frame):
     """
-        Return True if opened class detected, otherwise False
+        Return opened mouth confidence
     """
-    # Acquire frame and resize to expected shape [1xHxWx1]
-    # add N dim
-    image_frame = inference_utils.prepare_image(image_frame, IMAGE_PAIR_SIZE)
-
-    if floating_model:
-        # Normalize to [0, 1]
-        image_frame = image_frame / 255.0
-        images_data = np.expand_dims(image_frame, 0).astype(np.float32)  # or [img_data]
-    else:  # 0.00390625 * q
-        images_data = np.expand_dims(image_frame, 0).astype(np.uint8)  # or [img_data]
-
     start = inference_utils.get_timestamp_ms()
-    # Inference on input data normalized to [0, 1]
-    interpreter.set_tensor(input_details[0]['index'], images_data)
-    interpreter.invoke()
-    output_data = interpreter.get_tensor(output_details[0]['index'])
+    predicted_confidence = classifier.predict(image_frame)
 
     global time_elapsed
     global exec_cnt
@@ -95,18 +60,10 @@ def make_interference(image_frame):
     print(f'Elapsed time: {diff} ms')
     print(f'Avg time: {time_elapsed / exec_cnt}')
 
-    predict_label = np.argmax(output_data)
-    score = 100 * output_data[0][predict_label]
-    if floating_model is False:
-        score = score * 0.00390625
-
-    predicted_confidence = output_data[0][predict_label]
-    is_mouth_opened = True if predicted_confidence >= CONFIDENCE_THRESHOLD else False
-
-    # print(np.argmax(output()[0]))
-    print("Predicted value for [0, 1] normalization. Label index: {}, confidence: {:2.0f}%"
-          .format(predict_label, score))
-    return is_mouth_opened
+    predict_label = int(classifier.is_opened(predicted_confidence))
+    print("Predicted value for [0, 1] normalization. Label: {}, confidence: {:2.0f}%"
+          .format(dataset_labels[predict_label], predicted_confidence * 100))
+    return predicted_confidence
 
 
 def clear_test():
@@ -128,7 +85,7 @@ def image_reader(frame, face):
     print(predicted_confidence)
 
     global mouth_open_counter
-    is_mouth_opened = True if predicted_confidence >= CONFIDENCE_THRESHOLD else False
+    is_mouth_opened = classifier.is_opened(predicted_confidence)
     if is_mouth_opened:
         mouth_open_counter = mouth_open_counter + 1
 
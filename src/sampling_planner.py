@@ -0,0 +1,82 @@
+import threading
+
+
+class SamplingPlanner(object):
+    """
+    Decides before decoding, which frames of a video go to detection and landmark labeling.
+
+    Closed mouth images are kept every sample_step_closed frames, so while the mouth is closed
+    only every sample_step_closed-th frame is decoded at all. Once a labeled frame is opened or close
+    to the threshold, every frame is decoded for dense_hold frames, so opened images are not skipped.
+    Closed images found in dense mode are sampled with the read counter, as before.
+
+    Decoding and labeling may run in different threads. A sparse frame stands for sample_step_closed frames,
+    so the decoder waits until it is observed (release), otherwise queued sparse frames would delay dense mode
+    by more than the hold window. Dense frames are decoded ahead without waiting.
+    The mode is returned by should_decode and travels with the frame, keep() samples by the decode mode.
+    """
+
+    def __init__(self,
+                 sample_step_opened: int,
+                 sample_step_closed: int,
+                 dense_hold: int = 30,
+                 allow_dense: bool = True,
+                 max_wait: float = 1.0):
+        self.sample_step_opened = sample_step_opened
+        self.sample_step_closed = sample_step_closed
+        self.dense_hold = dense_hold
+        self.allow_dense = allow_dense  # False if opened images are not used, e.g. videos without yawns
+        self.frame_counter = 0
+        self.dense_frames_left = 0
+        self.read_opened = 0
+        self.read_closed = 0
+        self.skipped_frames = 0
+        self.max_wait = max_wait  # seconds, a failed detect stage never releases its frames
+        self.pending_sparse = 0
+        self._lock = threading.Condition()
+
+    @property
+    def is_dense(self) -> bool:
+        return self.dense_frames_left > 0
+
+    def should_decode(self) -> tuple:
+        """
+        Return (decode the next frame, frame is decoded in dense mode)
+        """
+        with self._lock:
+            self.frame_counter = self.frame_counter + 1
+            if self.allow_dense and not self.is_dense:
+                # the previous sparse frame may switch to dense mode, frames after it are not skipped yet
+                self._lock.wait_for(lambda: self.pending_sparse == 0, self.max_wait)
+            if self.is_dense:
+                self.dense_frames_left = self.dense_frames_left - 1
+                return True, True
+            if self.frame_counter % self.sample_step_closed == 0:
+                self.pending_sparse = self.pending_sparse + 1
+                return True, False
+            self.skipped_frames = self.skipped_frames + 1
+            return False, False
+
+    def observe(self, is_near_opened: bool):
+        # called after cheap labeling of a decoded frame
+        if is_near_opened and self.allow_dense:
+            with self._lock:
+                self.dense_frames_left = self.dense_hold
+
+    def release(self, is_dense_sampled: bool):
+        # called when detection of a decoded frame is done, observed or not
+        if not is_dense_sampled:
+            with self._lock:
+                self.pending_sparse = max(self.pending_sparse - 1, 0)
+                self._lock.notify_all()
+
+    def keep(self, is_opened: bool, is_dense_sampled: bool) -> bool:
+        # is_dense_sampled: planner mode returned by should_decode for the frame, not the current mode
+        if is_opened:
+            self.read_opened = self.read_opened + 1
+            return self.read_opened % self.sample_step_opened == 0
+        self.read_closed = self.read_closed + 1
+        if not is_dense_sampled:
+            # already sampled before decoding, frame stands for sample_step_closed frames
+            return True
+        return self.read_closed % self.sample_step_closed == 0
@@ -2,30 +2,42 @@ import cv2
 
 import numpy as np
 
+SSD_INPUT_SIZE = (300, 300)
+SSD_MEAN = (104.0, 177.0, 123.0)
+SSD_CONFIDENCE = 0.4
+
 
 class SSDFaceDetector(object):
 
-    def __init__(self, face_model):
+    def __init__(self, face_model, confidence: float = SSD_CONFIDENCE):
         self.face_model = face_model
+        self.confidence = confidence
 
-    def detect_face(self, image, draw_rect: bool = False) -> list:
-        # accessing the image.shape tuple and taking the elements
-        (h, w) = image.shape[:2]  # get our blob which is our input image
-        blob = cv2.dnn.blobFromImage(cv2.resize(image, (300, 300)), 1.0, (300, 300),
-                                     (104.0, 177.0, 123.0))  # input the blob into the model and get back the detections
+    def detect_faces(self, images: list) -> list:
+        """
+        Detect faces of many frames with one forward pass.
+        Return (K, 4) int array of (start_x, start_y, end_x, end_y) per frame, ordered by confidence
+        """
+        if len(images) == 0:
+            return []
+        # blobFromImages resizes every image to the network input, no resize beforehand
+        blob = cv2.dnn.blobFromImages(images, 1.0, SSD_INPUT_SIZE, SSD_MEAN)
         self.face_model.setInput(blob)
-        detections = self.face_model.forward()
-        # Iterate over all of the faces detected and extract their start and end points
-        rect_list = []
-        for i in range(0, detections.shape[2]):
-            box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-            (startX, startY, endX, endY) = box.astype("int")
-            startX = max(startX, 0)
-            startY = max(startY, 0)
-            confidence = detections[0, 0, i, 2]
-            if confidence >= 0.4:
-                # print('Face confidence: ' + str(confidence))
-                rect_list.append((startX, startY, endX, endY))
-                if draw_rect:
-                    cv2.rectangle(image, (startX, startY), (endX, endY), (0, 255, 0), 2)
+        # (1, 1, N, 7) rows of (image id, class, confidence, x1, y1, x2, y2) in relative coordinates
+        detections = self.face_model.forward().reshape(-1, 7)
+        detections = detections[detections[:, 2] >= self.confidence]
+
+        image_sizes = np.array([[image.shape[1], image.shape[0]] for image in images], dtype=np.float32)
+        image_ids = detections[:, 0].astype(np.int32)
+        box_sizes = np.tile(image_sizes[image_ids], 2)
+        boxes = (detections[:, 3:7] * box_sizes).astype(np.int32)
+        boxes[:, 0:2] = np.maximum(boxes[:, 0:2], 0)
+        boxes[:, 2:4] = np.minimum(boxes[:, 2:4], box_sizes[:, 0:2].astype(np.int32))
+        return [boxes[image_ids == i] for i in range(len(images))]
+
+    def detect_face(self, image, draw_rect: bool = False) -> list:
+        rect_list = [tuple(box) for box in self.detect_faces([image])[0].tolist()]
+        if draw_rect:
+            for (startX, startY, endX, endY) in rect_list:
+                cv2.rectangle(image, (startX, startY), (endX, endY), (0, 255, 0), 2)
         return rect_list
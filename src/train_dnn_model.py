@@ -21,6 +21,8 @@ from tensorflow import keras
 from tensorflow.python.client import device_lib
 
 from yawn_train.src import train_utils
+from yawn_train.src.dataset_shards import ShardDataset
+from yawn_train.src.metadata_index import MetadataIndex
 
 MOUTH_AR_THRESH = 0.6
 
@@ -40,6 +42,7 @@ class DNNTrainer(object):
                  img_size: tuple = (100, 100),
                  grayscale: bool = True,
                  data_folder: str = './mouth_state',
+                 shard_folder: str = None,  # read sharded output of the converter instead of data_folder
                  use_gpu: bool = True,
                  epochs: int = 1,
                  batch_size: int = 64,
@@ -60,6 +63,7 @@ class DNNTrainer(object):
         self.input_shape = (self.max_width, self.max_height, self.color_channels)
 
         self.data_folder = data_folder
+        self.shard_folder = shard_folder
         self.use_gpu = use_gpu
         self.epochs = epochs
         self.batch_size = batch_size
@@ -111,6 +115,34 @@ class DNNTrainer(object):
         strategy = tf.distribute.get_strategy()
     print("REPLICAS: ", strategy.num_replicas_in_sync)
 
+    def show_dataset_preview(self, data_folder: str, plot_freq_path: str, plot_preview_path: str):
+        # metadata index of the converter, file names are parsed only for datasets without index
+        metadata_index = MetadataIndex.from_folder(data_folder)
+        opened_index = metadata_index.opened()
+        closed_index = metadata_index.closed()
+
+        print('First 10 opened images')
+        opened_eye_img_paths = opened_index.paths
+        opened_eye_img_names = [os.path.basename(f) for f in opened_eye_img_paths[:10]]
+        print(opened_eye_img_names)
+        print()
+
+        print('First 10 closed images')
+        closed_eye_img_paths = closed_index.paths
+        closed_eye_img_names = [os.path.basename(f) for f in closed_eye_img_paths[:10]]
+        print(closed_eye_img_names)
+        print()
+
+        train_utils.plot_freq_index(plot_freq_path, metadata_index)
+
+        train_utils.show_img_preview(
+            plot_preview_path,
+            opened_eye_img_paths, closed_eye_img_paths,
+            MOUTH_AR_THRESH,
+            self.grayscale,
+            opened_index['mar'], closed_index['mar']
+        )
+
     def run_training(self):
         if self.use_gpu:
             self.apply_gpu()
@@ -124,8 +156,6 @@ class DNNTrainer(object):
         MOUTH_PREPARE_VAL_FOLDER = os.path.join(MOUTH_PREPARE_FOLDER, 'val')
 
         MOUTH_FOLDER = self.data_folder
-        MOUTH_OPENED_FOLDER = os.path.join(MOUTH_FOLDER, 'opened')
-        MOUTH_CLOSED_FOLDER = os.path.join(MOUTH_FOLDER, 'closed')
 
         # Hyperparameters
         EPOCH = self.epochs
@@ -156,30 +186,18 @@ class DNNTrainer(object):
         SAVED_MODEL = os.path.join(OUTPUT_FOLDER, f"saved_mouth_model_{EPOCH}")
         TFJS_MODEL = os.path.join(OUTPUT_FOLDER, f"tfjs_model_{EPOCH}")
 
-        print('First 10 opened images')
-        opened_eye_img_paths = train_utils.listdir_fullpath(MOUTH_OPENED_FOLDER)
-        opened_eye_img_names = [os.path.basename(f) for f in opened_eye_img_paths[:10]]
-        print(opened_eye_img_names)
-        print()
-
-        print('First 10 closed images')
-        closed_eye_img_paths = train_utils.listdir_fullpath(MOUTH_CLOSED_FOLDER)
-        closed_eye_img_names = [os.path.basename(f) for f in closed_eye_img_paths[:10]]
-        print(closed_eye_img_names)
-        print()
-
-        train_utils.plot_freq_imgs(
-            PLOT_IMAGE_FREQ_PATH,
-            opened_eye_img_paths,
-            closed_eye_img_paths
-        )
-
-        train_utils.show_img_preview(
-            PLOT_IMAGE_PREVIEW,
-            opened_eye_img_paths, closed_eye_img_paths,
-            MOUTH_AR_THRESH,
-            self.grayscale
-        )
+        if self.shard_folder is not None:
+            shard_dataset = ShardDataset(self.shard_folder)
+            print(f'Shards: {len(shard_dataset.shards)}, images: {len(shard_dataset)}')
+            train_idx, val_idx, test_idx = shard_dataset.split()
+            is_opened = shard_dataset.labels == 1
+            train_utils.plot_freq_confs(
+                PLOT_IMAGE_FREQ_PATH,
+                shard_dataset.index['mar'][is_opened],
+                shard_dataset.index['mar'][~is_opened]
+            )
+        else:
+            self.show_dataset_preview(MOUTH_FOLDER, PLOT_IMAGE_FREQ_PATH, PLOT_IMAGE_PREVIEW)
 
         # https://stackoverflow.com/questions/42443936/keras-split-train-test-set-when-using-imagedatagenerator
         # Data normalization is an important step which ensures that each input parameter (pixel, in this case) has a similar data distribution. This makes convergence faster while training the network.
@@ -195,17 +213,26 @@ class DNNTrainer(object):
             horizontal_flip=True,
             fill_mode="nearest"  # zoom_range will corrupt img
         )
-        train_generator = train_datagen.flow_from_directory(
-            MOUTH_PREPARE_TRAIN_FOLDER,  # source directory for training images
-            batch_size=BATCH_SIZE,
-            color_mode='grayscale' if self.grayscale else 'rgb',
-            shuffle=True,
-            class_mode='binary',
-            target_size=self.img_size  # All images will be resized to IMAGE_SHAPE
-        )
-
-        print('Preview 20 images from train generator')
-        train_utils.plot_data_generator_first_20(train_generator)
+        if self.shard_folder is not None:
+            train_generator = train_utils.ShardSequence(
+                shard_dataset, train_idx, train_datagen,
+                batch_size=BATCH_SIZE,
+                shuffle=True,
+                img_size=self.img_size,
+                grayscale=self.grayscale
+            )
+        else:
+            train_generator = train_datagen.flow_from_directory(
+                MOUTH_PREPARE_TRAIN_FOLDER,  # source directory for training images
+                batch_size=BATCH_SIZE,
+                color_mode='grayscale' if self.grayscale else 'rgb',
+                shuffle=True,
+                class_mode='binary',
+                target_size=self.img_size  # All images will be resized to IMAGE_SHAPE
+            )
+
+            print('Preview 20 images from train generator')
+            train_utils.plot_data_generator_first_20(train_generator)
 
         class_indices = train_generator.class_indices
         print(class_indices)  # {'closed': 0, 'opened': 1}
@@ -213,14 +240,23 @@ class DNNTrainer(object):
         class_idx = list(class_indices.values())
 
         print('Create Validation Image Data Generator')
-        valid_generator = train_datagen.flow_from_directory(
-            MOUTH_PREPARE_VAL_FOLDER,
-            class_mode='binary',
-            color_mode='grayscale' if self.grayscale else 'rgb',
-            batch_size=BATCH_SIZE,
-            shuffle=False,  # no shuffle as we use it to predict on test data that must be in order
-            target_size=self.img_size  # All images will be resized to IMAGE_SHAPE
-        )
+        if self.shard_folder is not None:
+            valid_generator = train_utils.ShardSequence(
+                shard_dataset, val_idx, train_datagen,
+                batch_size=BATCH_SIZE,
+                shuffle=False,
+                img_size=self.img_size,
+                grayscale=self.grayscale
+            )
+        else:
+            valid_generator = train_datagen.flow_from_directory(
+                MOUTH_PREPARE_VAL_FOLDER,
+                class_mode='binary',
+                color_mode='grayscale' if self.grayscale else 'rgb',
+                batch_size=BATCH_SIZE,
+                shuffle=False,  # no shuffle as we use it to predict on test data that must be in order
+                target_size=self.img_size  # All images will be resized to IMAGE_SHAPE
+            )
         print('Keys: ' + ','.join(map(str, list(valid_generator.class_indices.keys()))))
         print('Values: ' + ','.join(map(str, list(valid_generator.class_indices.values()))))
         print('First 10 images: ' + ','.join(map(str, valid_generator.filenames[:10])))
@@ -236,8 +272,11 @@ class DNNTrainer(object):
         print(test_labels[:100])
 
         print('Resolve test images')
-        test_images = valid_generator.filenames
-        test_images[:] = [f'{MOUTH_PREPARE_VAL_FOLDER}/{x}' for x in test_images]
+        if self.shard_folder is not None:
+            test_images = valid_generator.images
+        else:
+            test_images = valid_generator.filenames
+            test_images[:] = [f'{MOUTH_PREPARE_VAL_FOLDER}/{x}' for x in test_images]
 
         print('Create model')
         # Create a basic model instance
@@ -333,8 +372,9 @@ class DNNTrainer(object):
         plt.show()
 
         # Predicting the classes of some images
-        for class_name in class_names:  # opened, closed
-            train_utils.predict_random_test_img(model, MOUTH_PREPARE_TEST_FOLDER, class_name, self.grayscale)
+        if self.shard_folder is None:
+            for class_name in class_names:  # opened, closed
+                train_utils.predict_random_test_img(model, MOUTH_PREPARE_TEST_FOLDER, class_name, self.grayscale)
 
         # saved model
         tf.keras.models.save_model(
@@ -381,13 +421,19 @@ class DNNTrainer(object):
         # convert to js format
         train_utils.export_tf_js(model, TFJS_MODEL)
 
+        # shards have their own test split, not seen in training or validation
+        tflite_test_images, tflite_test_labels = test_images, test_labels
+        if self.shard_folder is not None:
+            tflite_test_images = train_utils.ShardImages(shard_dataset, test_idx)
+            tflite_test_labels = [int(label) for label in shard_dataset.labels[test_idx]]
+
         train_utils.export_tflite_quant(TFLITE_QUANT_PATH, SAVED_MODEL)
         if IS_EVALUATE_TFLITE:
-            train_utils.evaluate_tflite_quant(TFLITE_QUANT_PATH, test_images, test_labels)
+            train_utils.evaluate_tflite_quant(TFLITE_QUANT_PATH, tflite_test_images, tflite_test_labels)
 
         train_utils.export_tflite_floating(TFLITE_FLOAT_PATH, SAVED_MODEL)
         if IS_EVALUATE_TFLITE:
-            train_utils.evaluate_tflite_float(TFLITE_FLOAT_PATH, test_images, test_labels)
+            train_utils.evaluate_tflite_float(TFLITE_FLOAT_PATH, tflite_test_images, tflite_test_labels)
 
         # Create a concrete function from the SavedModel
         train_utils.export_tflite_floating2(
@@ -0,0 +1,107 @@
+import argparse
+import os
+import time
+
+import cv2
+import dlib
+import numpy as np
+
+from yawn_train.src import detect_utils, inference_utils
+from yawn_train.src.metadata_index import MetadataIndex
+from yawn_train.src.model_config import MOUTH_AR_THRESH, MOUTH_FOLDER
+from yawn_train.src.model_registry import MODELS, MODEL_DLIB_PREDICTOR, MODELS_FOLDER, DLIB_MOUTH_PREDICTOR_FILE
+
+# smaller than the 68 points model defaults (depth 4, cascade 10, 500 trees), 20 points need less
+TREE_DEPTH = 4
+CASCADE_DEPTH = 10
+NUM_TREES_PER_CASCADE_LEVEL = 300
+OVERSAMPLING_AMOUNT = 10
+TEST_SPLIT = 0.2
+
+
+def load_faces(data_folder: str, max_images: int, seed: int = 0) -> list:
+    # dlib HOG boxes with a dlib output crop, whole image is then the rect the extractor predicts landmarks in
+    metadata_index = MetadataIndex.from_folder(data_folder).from_box_source('dlib')
+    paths = metadata_index.select(metadata_index['detector'] == 'dlib').paths
+    rng = np.random.RandomState(seed)
+    if len(paths) > max_images:
+        paths = [paths[i] for i in rng.choice(len(paths), max_images, replace=False)]
+    else:
+        paths = [paths[i] for i in rng.permutation(len(paths))]
+    return [cv2.imread(path, cv2.IMREAD_GRAYSCALE) for path in paths]
+
+
+def face_rect(face_img) -> dlib.rectangle:
+    return dlib.rectangle(0, 0, face_img.shape[1], face_img.shape[0])
+
+
+def teacher_mouth_points(teacher, face_imgs: list) -> list:
+    return [inference_utils.predict_mouth_points(teacher, face_img, face_rect(face_img)) for face_img in face_imgs]
+
+
+def train_mouth_predictor(face_imgs: list, mouth_points: list, threads: int) -> dlib.shape_predictor:
+    objects = [[dlib.full_object_detection(face_rect(face_img), [dlib.point(int(x), int(y)) for x, y in points])]
+               for face_img, points in zip(face_imgs, mouth_points)]
+    options = dlib.shape_predictor_training_options()
+    options.tree_depth = TREE_DEPTH
+    options.cascade_depth = CASCADE_DEPTH
+    options.num_trees_per_cascade_level = NUM_TREES_PER_CASCADE_LEVEL
+    options.oversampling_amount = OVERSAMPLING_AMOUNT
+    options.num_threads = threads
+    options.be_verbose = True
+    return dlib.train_shape_predictor(face_imgs, objects, options)
+
+
+def predict_timed(predictor, face_imgs: list) -> tuple:
+    start_time = time.perf_counter()
+    mouth_points = teacher_mouth_points(predictor, face_imgs)
+    return mouth_points, (time.perf_counter() - start_time) * 1000 / len(face_imgs)
+
+
+def report(teacher, student, face_imgs: list):
+    points_teacher, ms_teacher = predict_timed(teacher, face_imgs)
+    points_student, ms_student = predict_timed(student, face_imgs)
+    mars_teacher = np.round(detect_utils.mouth_aspect_ratios(np.array(points_teacher)), 2)
+    mars_student = np.round(detect_utils.mouth_aspect_ratios(np.array(points_student)), 2)
+    # point error relative to the mouth width of the teacher
+    mouth_widths = np.linalg.norm(np.array(points_teacher)[:, 0] - np.array(points_teacher)[:, 6], axis=1)
+    point_errors = np.linalg.norm(np.array(points_teacher) - np.array(points_student), axis=2).mean(axis=1)
+    opened_teacher = mars_teacher >= MOUTH_AR_THRESH
+    opened_student = mars_student >= MOUTH_AR_THRESH
+    print(f'Test faces: {len(face_imgs)}')
+    print(f'68 points: {ms_teacher:.3f} ms/face, mouth only: {ms_student:.3f} ms/face'
+          f', {ms_teacher / ms_student:.2f}x')
+    print(f'Point error: {np.mean(point_errors / np.maximum(mouth_widths, 1)) * 100:.1f}% of mouth width')
+    print(f'MAR mean abs difference: {np.mean(np.abs(mars_teacher - mars_student)):.3f}'
+          f', correlation: {np.corrcoef(mars_teacher, mars_student)[0, 1]:.3f}')
+    print(f'Label agreement at {MOUTH_AR_THRESH}: {np.mean(opened_teacher == opened_student) * 100:.1f}%'
+          f', opened only by 68 points: {np.sum(opened_teacher & ~opened_student)}'
+          f', only by mouth only: {np.sum(~opened_teacher & opened_student)}')
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Train a mouth-only dlib shape predictor on the 68 points predictor output.")
+    parser.add_argument("--data-folder", type=str, default=MOUTH_FOLDER, help="extracted face images")
+    parser.add_argument("--max-images", type=int, default=5000, help="faces used for training and test")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(), help="training threads")
+    parser.add_argument("--output", type=str, default=os.path.join(MODELS_FOLDER, DLIB_MOUTH_PREDICTOR_FILE),
+                        help="trained predictor, extractor loads it from the models folder")
+    parser.add_argument("--report-only", action='store_true', help="compare an already trained predictor")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    face_imgs = load_faces(args.data_folder, args.max_images)
+    test_count = int(len(face_imgs) * TEST_SPLIT)
+    train_imgs, test_imgs = face_imgs[test_count:], face_imgs[:test_count]
+    teacher = MODELS.get(MODEL_DLIB_PREDICTOR)
+    if args.report_only:
+        student = dlib.shape_predictor(args.output)
+    else:
+        print(f'Train faces: {len(train_imgs)}')
+        student = train_mouth_predictor(train_imgs, teacher_mouth_points(teacher, train_imgs), args.threads)
+        student.save(args.output)
+        print(f'Saved {args.output}, {os.path.getsize(args.output) / 1024 / 1024:.1f} MB')
+    report(teacher, student, test_imgs)
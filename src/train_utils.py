@@ -1,3 +1,4 @@
+import math
 import os
 import random
 import tempfile
@@ -12,6 +13,7 @@ from tensorflow import keras
 from tensorflow.keras import backend as K
 from tensorflow.keras import layers
 
+from yawn_train.src.dataset_shards import CLASS_INDICES
 from yawn_train.src.model_config import IMAGE_PAIR_SIZE
 
 
@@ -93,8 +95,12 @@ def plot_image(i, predictions_item, true_label_id, images, class_names, class_in
     plt.xticks([])
     plt.yticks([])
 
-    img_filename = os.path.basename(img)
-    img_obj = mpimg.imread(img)
+    if isinstance(img, str):
+        img_filename = os.path.basename(img)
+        img_obj = mpimg.imread(img)
+    else:  # image array, e.g. from dataset shards
+        img_filename = str(i)
+        img_obj = np.squeeze(img)
     plt.imshow(img_obj, cmap="gray")
     # predicted_label_id = np.argmax(predictions_item)  # take class with highest confidence
     predicted_confidence = np.max(predictions_item)
@@ -406,11 +412,18 @@ def evaluate_model(interpreter, test_images, test_labels):
         # Pre-processing: add batch dimension and convert to float32 to match with
         # the model's input data format.
 
-        # load image by path
-        loaded_img = keras.preprocessing.image.load_img(
-            test_image, target_size=IMAGE_PAIR_SIZE, color_mode="grayscale"
-        )
-        img_array = keras.preprocessing.image.img_to_array(loaded_img)
+        if isinstance(test_image, str):
+            # load image by path
+            loaded_img = keras.preprocessing.image.load_img(
+                test_image, target_size=IMAGE_PAIR_SIZE, color_mode="grayscale"
+            )
+            img_array = keras.preprocessing.image.img_to_array(loaded_img)
+        else:  # image array from dataset shards, (H, W, C) uint8
+            img_array = test_image.astype('float32')
+            if img_array.shape[:2] != (IMAGE_PAIR_SIZE[1], IMAGE_PAIR_SIZE[0]):
+                img_array = tf.image.resize(img_array, (IMAGE_PAIR_SIZE[1], IMAGE_PAIR_SIZE[0])).numpy()
+            if img_array.shape[-1] == 3:
+                img_array = np.dot(img_array, [0.114, 0.587, 0.299])[..., np.newaxis]  # shards keep opencv BGR order
         img_array = img_array.astype('float32')
 
         if floating_model:
@@ -602,7 +615,8 @@ def predict_random_test_img(model, path: str, class_name: str, grayscale: bool):
     predict_image(model, random_img, grayscale)
 
 
-def show_img_preview(out_path_img: str, img_class_paths1, img_class_paths2, threshold, grayscale: bool):
+def show_img_preview(out_path_img: str, img_class_paths1, img_class_paths2, threshold, grayscale: bool,
+                     confs1=None, confs2=None):
     # Parameters for our graph; we'll output images in a 4x4 configuration
     nrows = 4
     ncols = 4
@@ -614,7 +628,11 @@ def show_img_preview(out_path_img: str, img_class_paths1, img_class_paths2, thre
     pic_index += 8
     next_eye_opened_pic = img_class_paths1[pic_index - 8:pic_index]
     next_closed_eye_pic = img_class_paths2[pic_index - 8:pic_index]
-    for i, img_path in enumerate(next_eye_opened_pic + next_closed_eye_pic):
+    if confs1 is None or confs2 is None:
+        next_confs = [get_conf_from_path(img_path) for img_path in next_eye_opened_pic + next_closed_eye_pic]
+    else:  # e.g. mar column of the metadata index
+        next_confs = list(confs1[pic_index - 8:pic_index]) + list(confs2[pic_index - 8:pic_index])
+    for i, (img_path, conf) in enumerate(zip(next_eye_opened_pic + next_closed_eye_pic, next_confs)):
         # Set up subplot; subplot indices start at 1
         sp = plt.subplot(nrows, ncols, i + 1)
         # sp.axis('Off')  # Don't show axes (or gridlines)
@@ -622,7 +640,6 @@ def show_img_preview(out_path_img: str, img_class_paths1, img_class_paths2, thre
         plt.xticks([])
         plt.yticks([])
 
-        conf = get_conf_from_path(img_path)
         img_filename = os.path.basename(img_path)
         is_opened = "opened" if conf >= threshold else "closed"
 
@@ -642,10 +659,17 @@ def plot_freq_imgs(out_path_img: str, opened_eye_img_paths: list, closed_eye_img
     for image_path in closed_eye_img_paths:
         conf = get_conf_from_path(image_path)
         closed_freq.append(conf)
+    plot_freq_confs(out_path_img, opened_freq, closed_freq)
 
+
+def plot_freq_index(out_path_img: str, metadata_index):
+    plot_freq_confs(out_path_img, metadata_index.opened()['mar'], metadata_index.closed()['mar'])
+
+
+def plot_freq_confs(out_path_img: str, opened_freq, closed_freq):
     bins = numpy.linspace(0.0, 1.0, 50)
-    plt.hist(closed_freq, bins=bins, label=f'Closed ({len(closed_eye_img_paths)})', color='blue', edgecolor='black')
-    plt.hist(opened_freq, bins=bins, label=f'Opened ({len(opened_eye_img_paths)})', color='red', edgecolor='black')
+    plt.hist(closed_freq, bins=bins, label=f'Closed ({len(closed_freq)})', color='blue', edgecolor='black')
+    plt.hist(opened_freq, bins=bins, label=f'Opened ({len(opened_freq)})', color='red', edgecolor='black')
     plt.legend(loc='upper right')
     plt.gca().set(title='Frequency Histogram', ylabel='Frequency')
     plt.xlim(0.0, 1.0)
@@ -687,3 +711,78 @@ def plot_roc(out_path_img: str, y_true, y_score):
     plt.legend(loc="lower right")
     plt.savefig(out_path_img)
     plt.show()
+
+
+class ShardImages(object):
+    """
+    Lazy list of images of dataset shards, to be used in place of image paths
+    """
+
+    def __init__(self, shard_dataset, indices):
+        self.shard_dataset = shard_dataset
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        return self.shard_dataset.get_images(self.indices[i:i + 1])[0]
+
+    def __iter__(self):
+        for i in range(len(self.indices)):
+            yield self[i]
+
+
+class ShardSequence(keras.utils.Sequence):
+    """
+    Batches read from memory-mapped dataset shards instead of flow_from_directory,
+    with the same augmentation and rescaling of the given ImageDataGenerator
+    """
+
+    def __init__(self, shard_dataset, indices, image_data_generator, batch_size: int, shuffle: bool,
+                 img_size: tuple = IMAGE_PAIR_SIZE, grayscale: bool = True):
+        self.shard_dataset = shard_dataset
+        self.indices = np.asarray(indices)
+        self.image_data_generator = image_data_generator
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.img_size = img_size
+        self.grayscale = grayscale
+        # same attributes as DirectoryIterator, classes are in unshuffled order
+        self.class_indices = dict(CLASS_INDICES)
+        self.n = len(self.indices)
+        self.classes = shard_dataset.labels[self.indices].astype(np.int32)
+        self.filenames = [f'{shard_id}_{offset}' for shard_id, offset in
+                          zip(shard_dataset.index['shard'][self.indices], shard_dataset.index['offset'][self.indices])]
+        self.images = ShardImages(shard_dataset, self.indices)
+        self.order = np.arange(self.n)
+        self.on_epoch_end()
+
+    def __len__(self):
+        return math.ceil(self.n / self.batch_size)
+
+    def __getitem__(self, idx):
+        batch_order = self.order[idx * self.batch_size:(idx + 1) * self.batch_size]
+        batch_indices = self.indices[batch_order]
+        images = self.shard_dataset.get_images(batch_indices).astype(np.float32)
+        if images.shape[1:3] != (self.img_size[1], self.img_size[0]):
+            images = tf.image.resize(images, (self.img_size[1], self.img_size[0])).numpy()
+        if self.grayscale and images.shape[-1] == 3:
+            images = np.dot(images, [0.114, 0.587, 0.299])[..., np.newaxis]  # shards keep opencv BGR order
+        elif not self.grayscale and images.shape[-1] == 1:
+            images = gray_to_rgb(images)
+        elif not self.grayscale:
+            images = images[..., ::-1]  # BGR to RGB, as keras loads images
+        for i in range(len(images)):
+            if self.image_data_generator is not None:
+                images[i] = self.image_data_generator.random_transform(images[i])
+                images[i] = self.image_data_generator.standardize(images[i])
+        return images, self.shard_dataset.labels[batch_indices].astype(np.float32)
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            np.random.shuffle(self.order)
+
+    def reset(self):
+        # batches are computed by index, nothing to reset
+        pass
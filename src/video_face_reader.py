@@ -2,25 +2,34 @@ import threading
 
 import cv2
 
+from yawn_train.src.face_tracker import FaceTracker
 from yawn_train.src.ssd_face_detector import SSDFaceDetector
 
 
 class VideoFaceDetector(object):
-    last_face = None
-    last_frame = None
 
-    def __init__(self, filename, face_model):
+    def __init__(self, filename, face_model, keyframe_interval: int = 10):
         self.ssd_face_detector = SSDFaceDetector(face_model)
+        # full frame detection only on keyframes, track the face in between
+        self.face_tracker = FaceTracker(self.ssd_face_detector.detect_face, keyframe_interval=keyframe_interval)
         self.vid = cv2.VideoCapture(filename)
         if self.vid.isOpened() is False:
             raise Exception("Video not opened")
+        self.last_face = None
+        # latest frame waiting for background detection, replaced by newer frames
+        self._pending_frame = None
+        self._stopped = False
+        self._condition = threading.Condition()
+        self.read_frames = 0
+        self.detected_frames = 0
+        self.dropped_frames = 0
 
     def start_single(self, image_reader):
         while True:
             ret, frame = self.vid.read()
             if ret is False:
                 break
-            face_list = self.ssd_face_detector.detect_face(frame)
+            face_list = self.face_tracker.update(frame)
             if len(face_list) == 0:
                 print('Face list empty')
                 cv2.imshow('Image', frame)
@@ -28,33 +37,65 @@ class VideoFaceDetector(object):
                 continue
             image_reader(frame, face_list[0])
         self.vid.release()
+        print(self.face_tracker.stats)
 
     def detect_face(self):
+        """
+        Background detection of the latest submitted frame, sleeps while there is none
+        """
         while True:
+            with self._condition:
+                while self._pending_frame is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                frame = self._pending_frame
+                self._pending_frame = None
             try:
-                if self.last_frame is not None:
-                    face_list = self.ssd_face_detector.detect_face(self.last_frame)
-                    if len(face_list) == 0:
-                        print('Face not found')
-                        continue
-                    self.last_face = face_list[0]
-                    self.last_frame = None
-            except BaseException as e:
-                print('{!r}; restarting thread'.format(e))
-            else:
-                # print('exited normally, bad thread; restarting')
-                pass
+                face_list = self.ssd_face_detector.detect_face(frame)
+            except Exception as e:
+                print('{!r}; skip frame'.format(e))
+                continue
+            with self._condition:
+                self.detected_frames = self.detected_frames + 1
+                if len(face_list) == 0:
+                    print('Face not found')
+                    continue
+                self.last_face = face_list[0]
+
+    def submit_frame(self, frame):
+        with self._condition:
+            if self._pending_frame is not None:
+                # detection is behind, only the newest frame is worth detecting
+                self.dropped_frames = self.dropped_frames + 1
+            self._pending_frame = frame
+            self.read_frames = self.read_frames + 1
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            if self._pending_frame is not None:
+                self.dropped_frames = self.dropped_frames + 1
+                self._pending_frame = None
+            self._stopped = True
+            self._condition.notify_all()
 
     def start_batch(self, image_reader):
-        # recognize face in background thread
+        # recognize face in background thread, the reader gets the last found face
+        self._stopped = False
         t = threading.Thread(target=self.detect_face)
         t.daemon = True
         t.start()
-
-        while True:
-            ret, frame = self.vid.read()
-            if ret is False:
-                break
-            self.last_frame = frame
-            image_reader(frame, self.last_face)
-        self.vid.release()
+        try:
+            while True:
+                ret, frame = self.vid.read()
+                if ret is False:
+                    break
+                # copy, the reader draws on the frame
+                self.submit_frame(frame.copy())
+                image_reader(frame, self.last_face)
+        finally:
+            self.stop()
+            t.join()
+            self.vid.release()
+        print(f'Frames read: {self.read_frames}, detected: {self.detected_frames}, dropped: {self.dropped_frames}')